@@ -29,7 +29,7 @@ def draw_line(x1: float, y1: float, x2: float, y2: float, color: str = "#00ff00"
     return resp.json()
 
 @mcp.tool
-def draw_circle(cx: float, cy: float, r: float, color: str = "#ff0000", width: int = 1):
+def draw_circle(cx: float, cy: float, r: float, color: str = "#ff0000", width: int = 1, filled: bool = False):
     """
     画一个圆
     参数:
@@ -37,6 +37,7 @@ def draw_circle(cx: float, cy: float, r: float, color: str = "#ff0000", width: i
         r: 半径
         color: 颜色（默认红色）
         width: 线宽
+        filled: 是否画成实心
     """
 
     x1, y1 = cx + r, cy
@@ -48,7 +49,8 @@ def draw_circle(cx: float, cy: float, r: float, color: str = "#ff0000", width: i
         "x2": x2, "y2": y2,
         "x3": x3, "y3": y3,
         "color": color,
-        "width": width
+        "width": width,
+        "filled": filled
     }
 
     resp = requests.post(f"{BACKEND_URL}/circles", json=payload)
@@ -114,7 +116,8 @@ def draw_bezier(x1: float, y1: float, x2: float, y2: float, x3: float, y3: float
     return resp.json()
 
 @mcp.tool
-def draw_rectangle(x1: float, y1: float, x2: float, y2: float, color: str = "#ff0000", width: int = 1):
+def draw_rectangle(x1: float, y1: float, x2: float, y2: float, color: str = "#ff0000", width: int = 1,
+                   filled: bool = False):
     """
     画一个矩形
     参数:
@@ -122,13 +125,15 @@ def draw_rectangle(x1: float, y1: float, x2: float, y2: float, color: str = "#ff
         x2, y2: 右下角顶点坐标
         color: 颜色（默认红色）
         width: 线宽
+        filled: 是否画成实心
     """
 
     payload = {
         "x1": x1, "y1": y1,
         "x2": x2, "y2": y2,
         "color": color,
-        "width": width
+        "width": width,
+        "filled": filled
     }
 
     resp = requests.post(f"{BACKEND_URL}/rectangles", json=payload)
@@ -137,6 +142,54 @@ def draw_rectangle(x1: float, y1: float, x2: float, y2: float, color: str = "#ff
 
     return resp.json()
 
+@mcp.tool
+def boundary_fill(x: int, y: int, color: str = "#2ecc71", boundary: str = "#000000",
+                  canvas_width: int = 800, canvas_height: int = 600,
+                  connectivity: int = 4, tol: int = 0,
+                  bbox: list = None):
+    """
+    边界填充：从 (x, y) 开始填色，碰到边界色为止
+    参数:
+        x, y: 种子点坐标
+        color: 填充颜色
+        boundary: 边界颜色（默认黑色）
+        canvas_width, canvas_height: 画布尺寸（默认和前端画布一样 800x600）
+        connectivity: 4 或 8 邻接
+        tol: 颜色容差
+        bbox: 可选 [x0, y0, x1, y1]，最多填到这个框，防止没封口的区域填满整张画布
+    """
+    payload = {
+        "x": x, "y": y,
+        "color": color, "boundary": boundary,
+        "w": canvas_width, "h": canvas_height,
+        "connectivity": connectivity, "tol": tol,
+        "bbox": bbox,
+    }
+    resp = requests.post(f"{BACKEND_URL}/boundary_fill", json=payload)
+    if resp.status_code != 201:
+        return {"error": resp.text}
+
+    data = resp.json()
+    # 整场景的点太大，MCP 这边只回填充结果
+    return {"fill_id": data["fill_id"], "spans": len(data["spans"])}
+
+@mcp.tool
+def draw_batch(ops: list):
+    """
+    一次画一批图形 / 做一串变换（只算一步撤销，比一个个调用快得多）
+    参数:
+        ops: 每项是一个 dict，"type" 决定类型，其余字段和单个画图接口的 payload 一样：
+            {"type": "line", "x1":..., "y1":..., "x2":..., "y2":..., "color": "#ff0000", "width": 1}
+            {"type": "circle", "x1":..., "y1":..., "x2":..., "y2":..., "x3":..., "y3":..., "filled": false}
+            type 还可以是 rect / bezier / polygon / bspline / arc，
+            以及变换 translate(id, dx, dy) / rotate(id, theta, cx, cy) / scale(id, sx, sy, cx, cy)；
+            变换的 id 写 "$k" 表示这一批里第 k 项（从 0 数）画出来的图形
+    """
+    resp = requests.post(f"{BACKEND_URL}/batch", json=ops)
+    if resp.status_code != 201:
+        return {"error": resp.text}
+    return resp.json()
+
 @mcp.tool
 def clear_canvas():
     """
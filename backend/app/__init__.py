@@ -15,4 +15,6 @@ def create_app():
 
     init_extensions(app)
     app.register_blueprint(shapes_bp, url_prefix="/api/v1")
+    # 导入即注册 socket 事件处理
+    from .api import ws  # noqa: F401
     return app
\ No newline at end of file
@@ -1,11 +1,14 @@
-from flask import Blueprint, request, jsonify
-from ...domain.scene import Scene
-from ...services.scene_service import SceneService
+import json
+import math
+from typing import Optional
+from flask import Blueprint, Response, request, jsonify
+from ...domain.points import PointBuffer, POINTS_MIME
+from ...services.scene_service import get_scene_service
 
 bp = Blueprint("shapes", __name__, url_prefix="/api/v1")
 
-_scene = Scene()
-svc = SceneService(_scene)
+# 和 WebSocket 那边共用同一个场景 / service
+svc = get_scene_service()
 
 
 def _int(v, default):
@@ -21,6 +24,54 @@ def _float(v, default):
         return default
 
 
+def _wants_binary() -> bool:
+    """客户端在 Accept 里明确要了二进制点集（且不比 JSON 优先级低）"""
+    accept = request.accept_mimetypes
+    q = dict(accept).get(POINTS_MIME, 0)
+    return q > 0 and q >= accept["application/json"]
+
+
+def _points_response(pts: PointBuffer, status: int = 200):
+    """
+    所有返回像素点的接口都走这里：按 Accept 协商，
+    要二进制就给 PointBuffer.to_bytes()，否则还是旧的 JSON 数组。
+    """
+    if _wants_binary():
+        resp = Response(pts.to_bytes(), status=status, mimetype=POINTS_MIME)
+    else:
+        resp = jsonify(pts.to_dicts())
+        resp.status_code = status
+    resp.vary.add("Accept")
+    return resp
+
+
+# 返回的点集只是单个 shape（不是整场景）时带上这个头，值为 "shape"
+POINTS_SCOPE_HEADER = "X-Points-Scope"
+# 二进制返回时，填充接口把新 FillBlob 的 id 放在这个响应头里
+FILL_ID_HEADER = "X-Fill-Id"
+
+
+def _fill_response(meta: dict):
+    """
+    填充接口的返回。JSON 时还是 {points, fill_id, spans}；
+    客户端要二进制时和别的改动接口一样，body 就是整场景的二进制点集，
+    fill_id 放响应头里 —— 新填充的行程本来就在点集的 spans 里（shape 就是 fill_id），不再另发一份
+    """
+    if _wants_binary():
+        resp = _points_response(meta["points"], status=201)
+        if meta["fill_id"]:
+            resp.headers[FILL_ID_HEADER] = meta["fill_id"]
+        return resp
+    resp = jsonify({
+        "points": meta["points"].to_dicts(),
+        "fill_id": meta["fill_id"],
+        "spans": meta["spans"].span_dicts(),
+    })
+    resp.status_code = 201
+    resp.vary.add("Accept")
+    return resp
+
+
 # -----------------------------
 # 创建各种图形
 # -----------------------------
@@ -37,7 +88,7 @@ def create_line():
     try:
         result = svc.add_line(data, color=color, width=width,
                               style=style, dash_on=dash_on, dash_off=dash_off)
-        return jsonify(result), 201
+        return _points_response(result, 201)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
@@ -54,7 +105,7 @@ def create_rectangle():
     try:
         result = svc.add_rect(data, color=color, width=width,
                               style=style, dash_on=dash_on, dash_off=dash_off)
-        return jsonify(result), 201
+        return _points_response(result, 201)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
@@ -71,7 +122,7 @@ def create_circle():
     try:
         result = svc.add_circle(data, color=color, width=width,
                               style=style, dash_on=dash_on, dash_off=dash_off)
-        return jsonify(result), 201
+        return _points_response(result, 201)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
@@ -88,7 +139,7 @@ def create_bezier():
     try:
         result = svc.add_bezier(data, color=color, width=width,
                               style=style, dash_on=dash_on, dash_off=dash_off)
-        return jsonify(result), 201
+        return _points_response(result, 201)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
@@ -105,7 +156,7 @@ def create_polygon():
     try:
         result = svc.add_polygon(data, color=color, width=width,
                               style=style, dash_on=dash_on, dash_off=dash_off)
-        return jsonify(result), 201
+        return _points_response(result, 201)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400 
     
@@ -123,7 +174,7 @@ def create_bspline():
         degree = _int(data.get("degree", 3), 3)
         result = svc.add_bspline(data, degree=degree, color=color, width=width,
                               style=style, dash_on=dash_on, dash_off=dash_off)
-        return jsonify(result), 201
+        return _points_response(result, 201)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
@@ -139,18 +190,106 @@ def create_arc():
     try:
         result = svc.add_arc(data, color=color, width=width,
                               style=style, dash_on=dash_on, dash_off=dash_off)
-        return jsonify(result), 201
+        return _points_response(result, 201)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
+# 按行分隔的 JSON（一行一项），批量接口可以直接流式读
+NDJSON_MIMES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def _read_batch_ops():
+    """批量接口的请求体：JSON 数组（或 {"ops": [...]}），或者 NDJSON（一行一项，逐行读不整块缓存）"""
+    if request.mimetype in NDJSON_MIMES:
+        ops = []
+        for n, line in enumerate(request.stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                ops.append(json.loads(line))
+            except ValueError:
+                raise ValueError(f"第 {n} 行不是合法的 JSON")
+        return ops
+    data = request.get_json(force=True, silent=True)
+    if isinstance(data, dict):
+        data = data.get("ops")
+    if not isinstance(data, list):
+        raise ValueError("需要 JSON 数组或 NDJSON")
+    return data
+
+
+@bp.post("/batch")
+def batch():
+    """
+    一次建一批图形 / 做一串变换：全部成功才生效，只记一条撤销、只推一次。
+    每项格式见 SceneService.apply_batch；返回 {"ids": [...], "version": n}
+    """
+    try:
+        result = svc.apply_batch(_read_batch_ops())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), 201
+
 # -----------------------------
 # 查询 / 状态
 # -----------------------------
 
+def _stream_mode() -> Optional[str]:
+    """?stream=json | ndjson，或者 Accept 里 NDJSON 比 JSON 优先：要流式输出"""
+    mode = request.args.get("stream")
+    if mode in ("json", "ndjson"):
+        return mode
+    accept = request.accept_mimetypes
+    q = max(dict(accept).get(m, 0) for m in NDJSON_MIMES)
+    if q > 0 and q >= accept["application/json"] and q >= dict(accept).get(POINTS_MIME, 0):
+        return "ndjson"
+    return None
+
+
+def _conditional(etag: str, build, cache: bool = True):
+    """
+    按场景版本做条件 GET：If-None-Match 对上就直接 304，不光栅化也不序列化；
+    否则同一版本、同一表示形式的响应体只序列化一次（build() 给出完整响应）。
+    流式响应不进缓存（本来就是为了不整块拿着）。
+    """
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        hit = svc.cached_body(etag) if cache else None
+        if hit is not None:
+            resp = Response(hit[0], mimetype=hit[1])
+        else:
+            resp = build()
+            if cache:
+                svc.cache_body(etag, resp.get_data(), resp.mimetype)
+    resp.set_etag(etag)
+    # 浏览器可以存，但每次都要带 If-None-Match 回来问
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept")
+    return resp
+
+
 @bp.get("/points")
 def get_points():
-    # 展开整场景为像素点
-    return jsonify(svc.get_points())
+    # 展开整场景为像素点；?viewport=x0,y0,x1,y1 只要视口里的（视口外的图形不光栅化）
+    # 大场景可以要流式输出（见 _stream_mode），逐个 shape 吐，前端边收边画
+    # 带场景版本的 ETag，没变就 304
+    viewport = request.args.get("viewport")
+    try:
+        mode = _stream_mode()
+        if mode is not None:
+            etag = svc.points_etag(viewport, mode)
+
+            def build():
+                chunks = svc.stream_points(viewport, ndjson=(mode == "ndjson"))
+                mimetype = "application/x-ndjson" if mode == "ndjson" else "application/json"
+                return Response(chunks, mimetype=mimetype)
+            return _conditional(etag, build, cache=False)
+        etag = svc.points_etag(viewport, "binary" if _wants_binary() else "json")
+        return _conditional(etag, lambda: _points_response(svc.get_points(viewport)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 @bp.get("/lines")
 def lines_explain():
@@ -158,12 +297,12 @@ def lines_explain():
 
 @bp.post("/undo")
 def undo():
-    return jsonify(svc.undo())
+    return _points_response(svc.undo())
 
 @bp.post("/clear")
 def clear_canvas():
     points = svc.clear()
-    return jsonify(points)
+    return _points_response(points)
 
 @bp.get("/scene")
 def dump_scene_state():
@@ -171,7 +310,27 @@ def dump_scene_state():
     可选调试接口，看看当前所有 shape 的几何和 transform。
     有助于前端做选框/控制柄等。
     """
-    return jsonify(svc.dump_scene_state())
+    return _conditional(svc.etag("scene"), lambda: jsonify(svc.dump_scene_state()))
+
+@bp.get("/pick")
+def pick_shape():
+    """?x=&y=&threshold= 点选离得最近的图形（服务端按几何算距离，不用前端扫像素）"""
+    try:
+        x = float(request.args["x"]); y = float(request.args["y"])
+        threshold = _float(request.args.get("threshold"), 12.0)
+    except (KeyError, ValueError):
+        return jsonify({"error": "需要数字参数 x, y"}), 400
+    # float() 认 nan / inf，放进空间索引的 floor 里会直接 500
+    if not all(math.isfinite(v) for v in (x, y, threshold)):
+        return jsonify({"error": "x, y, threshold 必须是有限的数"}), 400
+    return jsonify(svc.pick(x, y, threshold))
+
+@bp.get("/stats")
+def stats():
+    """
+    运行时统计：光栅缓存命中 / 未命中次数、撤销历史条数和字节数等
+    """
+    return jsonify(svc.stats())
 
 
 # -----------------------------
@@ -193,9 +352,14 @@ def translate_shape():
     dx = _float(data.get("dx", 0), 0.0)
     dy = _float(data.get("dy", 0), 0.0)
 
+    partial = svc.in_transform_session
     points = svc.translate_shape(shape_id, dx, dy)
-    # points 应该是一个数组，比如 [ {x, y, color, id, w}, ... ]
-    return jsonify(points)
+    # points 是 PointBuffer，出口处按 Accept 转成 JSON 数组或二进制
+    resp = _points_response(points)
+    if partial:
+        # 拖拽会话里只回被移动的那个 shape，前端自己替换进手里的点集
+        resp.headers[POINTS_SCOPE_HEADER] = "shape"
+    return resp
 
 @bp.post("/rotate")
 def rotate_shape():
@@ -260,7 +424,7 @@ def clip_rect():
         float(data["x2"]),
         float(data["y2"]),
     )
-    return jsonify(pts)
+    return _points_response(pts)
 
 # -----------------------------
 # 连通填充（油漆桶）
@@ -279,6 +443,31 @@ def flood_fill():
             x=x, y=y, new_color=color, width=width, height=height,
             connectivity=connectivity, tol=tol, bg_color="#ffffff"
         )
-        return jsonify(meta), 201
+        return _fill_response(meta)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+# -----------------------------
+# 边界填充（填到指定边界色为止）
+# -----------------------------
+@bp.post("/boundary_fill")
+def boundary_fill():
+    data = request.get_json(force=True)
+    x = int(data["x"]); y = int(data["y"])
+    color = data.get("color", "#2ecc71")
+    boundary = data.get("boundary", "#000000")
+    connectivity = int(data.get("connectivity", 4))
+    tol = int(data.get("tol", 0))
+    width = int(data.get("w")); height = int(data.get("h"))
+    # 可选 [x0, y0, x1, y1]：最多填到这个框
+    bbox = data.get("bbox")
+
+    try:
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError("bbox 需要 [x0, y0, x1, y1]")
+        meta = svc.boundary_fill_meta(
+            x=x, y=y, boundary_color=boundary, new_color=color, width=width, height=height,
+            connectivity=connectivity, tol=tol, bbox=bbox, bg_color="#ffffff"
+        )
+        return _fill_response(meta)
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
\ No newline at end of file
+        return jsonify({"error": str(e)}), 400
@@ -1,3 +1,4 @@
+from flask import request
 from flask_socketio import emit
 from ..extensions import socketio
 from ..services.scene_service import get_scene_service
@@ -6,15 +7,36 @@ from ..services.scene_service import get_scene_service
 @socketio.on("connect")
 def handle_connect():
     print("WebSocket client connected")
+    get_scene_service().subscribe(request.sid, "json")
 
 
 @socketio.on("disconnect")
 def handle_disconnect():
     print("WebSocket client disconnected")
+    get_scene_service().unsubscribe(request.sid)
 
 
 @socketio.on("subscribe_points")
-def handle_subscribe_points():
+def handle_subscribe_points(data=None):
+    """
+    data 可选：{"format": "json" | "binary", "viewport": [x0, y0, x1, y1], "delta": true}，
+    之后的推送都按这个格式；带了 viewport 就只推视口里的像素。
+    delta=true 时不再收整场景的 points_update，而是先收一条 scene_resync，
+    之后只收 shape_added / shape_removed / shape_replaced（见 SceneService._flush_deltas）
+    """
+    data = data if isinstance(data, dict) else {}
+    fmt = data.get("format", "json")
+    delta = bool(data.get("delta", False))
     svc = get_scene_service()
-    pts = svc.get_points()
-    emit("points_update", pts)
\ No newline at end of file
+    fmt, vp = svc.subscribe(request.sid, fmt, data.get("viewport"), delta)
+    if delta:
+        emit("scene_resync", svc.resync_payload(request.sid))
+        return
+    pts = svc.get_points() if vp is None else svc.viewport_points(vp)
+    emit("points_update", pts.to_bytes() if fmt == "binary" else pts.to_dicts())
+
+
+@socketio.on("request_resync")
+def handle_request_resync(data=None):
+    """增量订阅者发现自己漏了消息（base 对不上）时要一次整场景重发"""
+    emit("scene_resync", get_scene_service().resync_payload(request.sid))
@@ -1,5 +1,9 @@
 # fill.py
-from typing import Callable, Iterable, Tuple, List, Union
+from typing import Callable, Iterable, Optional, Tuple, List, Union
+
+import numpy as np
+
+from .points import PointBuffer
 
 Color = Union[int, Tuple[int, int, int, int], Tuple[int, int, int]]
 ReadFunc = Callable[[int, int], Color]  # 传入 (x,y) 返回当前像素颜色
@@ -22,20 +26,24 @@ def scanline_flood_fill(
     pen_w: int = 1,
     connectivity: int = 4,   # 4 或 8 邻接
     tol: int = 0,            # 颜色匹配容差
-) -> List[dict]:
+) -> PointBuffer:
     """
     泛洪填充：把和起点同色的连通区域全部替换为 new_color。
-    返回像素点列表（和你的 rasterize 一致的结构）。
+    返回 PointBuffer：每一行扫出来的 [xL, xR] 直接作为一段行程，不拆成单个像素
+    （调色板里只有 new_color）。
     不直接写画布；由上层统一渲染。
     """
     if not (0 <= seed_x < width and 0 <= seed_y < height):
-        return []
+        return PointBuffer.empty()
 
     target = read(seed_x, seed_y)
     if _col_equal(target, new_color, tol):
-        return []
+        return PointBuffer.empty()
 
-    out: List[dict] = []
+    # 行程：第 span_y 行的 [span_x0, span_x1]
+    span_y: List[int] = []
+    span_x0: List[int] = []
+    span_x1: List[int] = []
     visited = set()  # 防止重复入栈/扫描
     stack: List[Tuple[int, int]] = [(seed_x, seed_y)]
 
@@ -44,6 +52,9 @@ def scanline_flood_fill(
 
     while stack:
         x, y = stack.pop()
+        # 同一段会被压入好几个种子，已经填过的就跳过，免得重复出段
+        if (x, y) in visited:
+            continue
 
         # 向左扩展
         xL = x
@@ -55,10 +66,11 @@ def scanline_flood_fill(
         while xR + 1 < width and ok(xR + 1, y):
             xR += 1
 
-        # 填充 [xL, xR]
-        for xx in range(xL, xR + 1):
-            visited.add((xx, y))
-            out.append({"x": xx, "y": y, "color": new_color, "id": shape_id, "w": max(1, int(pen_w))})
+        # 填充 [xL, xR]（记成一段）
+        visited.update((xx, y) for xx in range(xL, xR + 1))
+        span_y.append(y)
+        span_x0.append(xL)
+        span_x1.append(xR)
 
         # 检查上一行 / 下一行的可扩张段作为新种子
         for ny in (y - 1, y + 1):
@@ -89,7 +101,7 @@ def scanline_flood_fill(
                 if 0 <= sx < width and 0 <= sy < height and ok(sx, sy):
                     stack.append((sx, sy))
 
-    return out
+    return PointBuffer.from_spans(span_y, span_x0, span_x1, shape_id, new_color, pen_w)
 
 
 def scanline_boundary_fill(
@@ -103,7 +115,7 @@ def scanline_boundary_fill(
     shape_id: str,
     pen_w: int = 1,
     tol: int = 0,
-) -> List[dict]:
+) -> PointBuffer:
     """
     边界填充：遇到 boundary_color 停止。
     """
@@ -113,9 +125,12 @@ def scanline_boundary_fill(
         return (not _col_equal(c, boundary_color, tol)) and (not _col_equal(c, new_color, tol))
 
     if not (0 <= seed_x < width and 0 <= seed_y < height) or not is_inside(seed_x, seed_y):
-        return []
+        return PointBuffer.empty()
 
-    out: List[dict] = []
+    # 行程：第 span_y 行的 [span_x0, span_x1]
+    span_y: List[int] = []
+    span_x0: List[int] = []
+    span_x1: List[int] = []
     visited = set()
     stack = [(seed_x, seed_y)]
 
@@ -124,6 +139,9 @@ def scanline_boundary_fill(
 
     while stack:
         x, y = stack.pop()
+        # 同一段会被压入好几个种子，已经填过的就跳过，免得重复出段
+        if (x, y) in visited:
+            continue
 
         xL = x
         while xL - 1 >= 0 and ok(xL - 1, y):
@@ -132,9 +150,10 @@ def scanline_boundary_fill(
         while xR + 1 < width and ok(xR + 1, y):
             xR += 1
 
-        for xx in range(xL, xR + 1):
-            visited.add((xx, y))
-            out.append({"x": xx, "y": y, "color": new_color, "id": shape_id, "w": max(1, int(pen_w))})
+        visited.update((xx, y) for xx in range(xL, xR + 1))
+        span_y.append(y)
+        span_x0.append(xL)
+        span_x1.append(xR)
 
         for ny in (y - 1, y + 1):
             if ny < 0 or ny >= height:
@@ -154,4 +173,147 @@ def scanline_boundary_fill(
                 stack.append((mid, ny))
                 stack.append((sR, ny))
 
-    return out
\ No newline at end of file
+    return PointBuffer.from_spans(span_y, span_x0, span_x1, shape_id, new_color, pen_w)
+
+# ----------------------
+# 帧缓冲上的向量化填充
+# ----------------------
+# 上面两个函数每探一个像素都要回调一次 read()，大面积填充很慢。
+# 下面这组直接吃 H×W×4 的 RGBA 数组：
+# 1. 一次性算出整张图“能填”的布尔掩码（颜色容差比较全是向量运算）
+# 2. 掩码按行切成行程（run），相邻两行行程有重叠就连通
+# 3. 从种子所在行程出发在行程图上 BFS，结果直接就是行程
+
+def color_match_mask(rgba: np.ndarray, color, tol: int = 0) -> np.ndarray:
+    """每个像素和 color 的各通道差都 <= tol 的位置"""
+    c = np.asarray(color, dtype=np.int16)[: rgba.shape[2]]
+    if tol <= 0 and c.size == 4:
+        # 精确匹配：把 RGBA 看成一个 uint32 直接比
+        packed = np.ascontiguousarray(rgba).view(np.uint32)[..., 0]
+        target = np.array(c, dtype=np.uint8).view(np.uint32)[0]
+        return packed == target
+    # 有容差：逐通道比上下界，全程 uint8，不用整张图转 int16 再取绝对值
+    tol = max(0, int(tol))
+    mask = np.ones(rgba.shape[:2], dtype=bool)
+    for ch, v in enumerate(c.tolist()):
+        lo, hi = max(0, v - tol), min(255, v + tol)
+        plane = rgba[..., ch]
+        if lo > 0:
+            mask &= plane >= lo
+        if hi < 255:
+            mask &= plane <= hi
+    return mask
+
+
+def mask_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    布尔掩码 → 每行连续为 True 的行程 (ys, x0s, x1s)，按 (y, x0) 排好序。
+    """
+    h, w = mask.shape
+    padded = np.zeros((h, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    d = np.diff(padded, axis=1)
+    ys, x0s = np.nonzero(d == 1)
+    _, ends = np.nonzero(d == -1)
+    return ys, x0s, ends - 1
+
+
+def region_runs(ys: np.ndarray, x0s: np.ndarray, x1s: np.ndarray,
+                seed_x: int, seed_y: int, height: int,
+                connectivity: int = 4) -> List[int]:
+    """
+    在行程图上从种子出发做 BFS，返回连通的行程下标。
+    4 邻接：上下两行 x 区间有重叠才连通；8 邻接：区间放宽 1 像素（斜对角也算）。
+    """
+    row_ptr = np.searchsorted(ys, np.arange(height + 1)).tolist()
+    x0l, x1l = x0s.tolist(), x1s.tolist()
+    yl = ys.tolist()
+
+    lo, hi = row_ptr[seed_y], row_ptr[seed_y + 1]
+    seed = next((i for i in range(lo, hi) if x0l[i] <= seed_x <= x1l[i]), None)
+    if seed is None:
+        return []
+
+    e = 1 if connectivity == 8 else 0
+    seen = {seed}
+    queue = [seed]
+    for i in queue:  # queue 边遍历边追加，就是 BFS
+        a, b, y = x0l[i] - e, x1l[i] + e, yl[i]
+        for ny in (y - 1, y + 1):
+            if ny < 0 or ny >= height:
+                continue
+            lo, hi = row_ptr[ny], row_ptr[ny + 1]
+            # 该行里第一个右端 >= a 的行程，之后依次往右，直到左端 > b
+            j = lo + int(np.searchsorted(x1s[lo:hi], a)) if hi - lo > 8 else lo
+            while j < hi and x0l[j] <= b:
+                if x1l[j] >= a and j not in seen:
+                    seen.add(j)
+                    queue.append(j)
+                j += 1
+    return queue
+
+
+def fill_mask_region(mask: np.ndarray, seed_x: int, seed_y: int,
+                     new_color: Color, shape_id: str, pen_w: int = 1,
+                     connectivity: int = 4) -> PointBuffer:
+    """掩码里和种子连通的那一块，作为行程返回"""
+    h, w = mask.shape
+    if not (0 <= seed_x < w and 0 <= seed_y < h) or not mask[seed_y, seed_x]:
+        return PointBuffer.empty()
+    ys, x0s, x1s = mask_runs(mask)
+    idx = np.array(sorted(region_runs(ys, x0s, x1s, seed_x, seed_y, h, connectivity)), dtype=np.int64)
+    return PointBuffer.from_spans(ys[idx], x0s[idx], x1s[idx], shape_id, new_color, pen_w)
+
+
+def flood_fill_rgba(
+    rgba: np.ndarray,
+    seed_x: int,
+    seed_y: int,
+    new_color: Color,
+    shape_id: str,
+    pen_w: int = 1,
+    connectivity: int = 4,
+    tol: int = 0,
+) -> PointBuffer:
+    """
+    scanline_flood_fill 的帧缓冲版本：语义一样（和种子同色、容差 tol 以内的连通区域），
+    但颜色比较和找行程都是整张图一起算的。
+    """
+    h, w = rgba.shape[:2]
+    if not (0 <= seed_x < w and 0 <= seed_y < h):
+        return PointBuffer.empty()
+    target = tuple(int(v) for v in rgba[seed_y, seed_x])
+    if _col_equal(target, tuple(new_color), tol):
+        return PointBuffer.empty()
+    mask = color_match_mask(rgba, target, tol)
+    return fill_mask_region(mask, seed_x, seed_y, new_color, shape_id, pen_w, connectivity)
+
+
+def boundary_fill_rgba(
+    rgba: np.ndarray,
+    seed_x: int,
+    seed_y: int,
+    boundary_color: Color,
+    new_color: Color,
+    shape_id: str,
+    pen_w: int = 1,
+    connectivity: int = 4,
+    tol: int = 0,
+    bbox: Optional[Tuple[int, int, int, int]] = None,
+) -> PointBuffer:
+    """
+    scanline_boundary_fill 的帧缓冲版本：从种子出发，遇到 boundary_color（容差 tol）停，
+    已经是 new_color 的像素也不进（免得反复填）。
+    bbox=(x0, y0, x1, y1)（闭区间）限定最多填到哪：区域没封口时不会一路漫到整张画布，
+    而且只在这块里面算掩码，大画布上也快。
+    """
+    h, w = rgba.shape[:2]
+    x0, y0, x1, y1 = (0, 0, w - 1, h - 1) if bbox is None else bbox
+    x0, y0 = max(0, int(x0)), max(0, int(y0))
+    x1, y1 = min(w - 1, int(x1)), min(h - 1, int(y1))
+    if not (x0 <= seed_x <= x1 and y0 <= seed_y <= y1):
+        return PointBuffer.empty()
+    sub = rgba[y0:y1 + 1, x0:x1 + 1]
+    mask = ~color_match_mask(sub, boundary_color, tol) & ~color_match_mask(sub, new_color, tol)
+    out = fill_mask_region(mask, seed_x - x0, seed_y - y0, new_color, shape_id, pen_w, connectivity)
+    return out.shifted(x0, y0) if out.n_spans else out
@@ -0,0 +1,156 @@
+# backend/app/domain/framebuffer.py
+"""
+常驻的 RGBA 帧缓冲（H×W×4 uint8），给油漆桶之类“要读画布颜色”的操作用。
+
+以前每次点油漆桶都要把整场景 flatten、再建一个 {(x, y): RGBA} 的大 dict；
+现在帧缓冲一直留着，每次用之前 sync(scene) 一下：
+- 逐个 shape 对比 (对象, version, 包围盒)，找出新增 / 删除 / 改动过的
+- 改动前后的包围盒记成脏矩形
+- 只把脏矩形里刷回背景色，再按绘制顺序把和它相交的 shape 重新涂一遍
+
+语义和前端画布 / 旧的 rgbamap 一致：每个像素点只占 1 个像素（不看线宽），后画的盖住先画的。
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .points import PointBuffer
+
+Rect = Tuple[int, int, int, int]  # (x0, y0, x1, y1) 闭区间
+RGBA = Tuple[int, int, int, int]
+
+# 脏矩形超过这么多个就直接合成一个大的
+MAX_DIRTY_RECTS = 16
+
+
+def _intersects(a: Rect, b: Rect) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _union(rects: List[Rect]) -> Rect:
+    return (min(r[0] for r in rects), min(r[1] for r in rects),
+            max(r[2] for r in rects), max(r[3] for r in rects))
+
+
+class Framebuffer:
+    def __init__(self, width: int, height: int, background: RGBA,
+                 to_rgba: Callable[[object], RGBA]):
+        self.width = int(width)
+        self.height = int(height)
+        self.background = tuple(background)
+        self.rgba = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        self.rgba[:] = self.background
+        self._to_rgba = to_rgba
+        # 调色板颜色 -> RGBA，缓存起来不用每次都解析 hex
+        self._color_cache: Dict[object, RGBA] = {}
+        # 已经画进缓冲的 shape：sid -> (shape 对象, version, 包围盒, 光栅结果)
+        self._painted: Dict[str, Tuple[object, int, Optional[Rect], PointBuffer]] = {}
+        self._order: List[str] = []
+        # 每重画一个矩形就通知一下（连通块索引靠这个只作废脏行）
+        self._repaint_listeners: List[Callable[[Rect], None]] = []
+        # 统计
+        self.syncs = 0
+        self.repainted_pixels = 0
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    def add_repaint_listener(self, fn: Callable[[Rect], None]) -> None:
+        self._repaint_listeners.append(fn)
+
+    # ----------------------
+    # 和场景同步
+    # ----------------------
+    def sync(self, scene) -> None:
+        """把缓冲更新到和 scene 当前状态一致，只重画变过的区域"""
+        self.syncs += 1
+        current: Dict[str, Tuple[object, int, Optional[Rect], PointBuffer]] = {}
+        order: List[str] = []
+        dirty: List[Rect] = []
+        for sid, shp, pts in scene.iter_rasters():
+            old = self._painted.get(sid)
+            if old is not None and old[0] is shp and old[1] == shp.version:
+                current[sid] = old
+            else:
+                box = pts.bbox()
+                current[sid] = (shp, shp.version, box, pts)
+                if old is not None and old[2] is not None:
+                    dirty.append(old[2])
+                if box is not None:
+                    dirty.append(box)
+            order.append(sid)
+
+        for sid, old in self._painted.items():
+            if sid not in current and old[2] is not None:
+                dirty.append(old[2])
+
+        # 没变的 shape 之间相对顺序变了（比如撤销把删掉的塞回中间），就整块重画
+        kept_before = [sid for sid in self._order if sid in current]
+        kept_now = [sid for sid in order if sid in self._painted]
+        self._painted, self._order = current, order
+        if kept_before != kept_now:
+            self._repaint((0, 0, self.width - 1, self.height - 1))
+            return
+
+        rects = [r for r in (self._clip(r) for r in dirty) if r is not None]
+        if len(rects) > MAX_DIRTY_RECTS:
+            rects = [_union(rects)]
+        for r in rects:
+            self._repaint(r)
+
+    # ----------------------
+    # 内部
+    # ----------------------
+    def _clip(self, r: Rect) -> Optional[Rect]:
+        x0, y0 = max(r[0], 0), max(r[1], 0)
+        x1, y1 = min(r[2], self.width - 1), min(r[3], self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return None
+        return x0, y0, x1, y1
+
+    def _palette(self, palette) -> np.ndarray:
+        out = np.empty((len(palette), 4), dtype=np.uint8)
+        for i, c in enumerate(palette):
+            key = tuple(c) if isinstance(c, list) else c
+            rgba = self._color_cache.get(key)
+            if rgba is None:
+                rgba = self._color_cache[key] = self._to_rgba(c)
+            out[i] = rgba
+        return out
+
+    def _repaint(self, rect: Rect) -> None:
+        x0, y0, x1, y1 = rect
+        self.rgba[y0:y1 + 1, x0:x1 + 1] = self.background
+        self.repainted_pixels += (x1 - x0 + 1) * (y1 - y0 + 1)
+        for sid in self._order:
+            _, _, box, pts = self._painted[sid]
+            if box is not None and _intersects(box, rect):
+                self._paint(pts, rect)
+        for fn in self._repaint_listeners:
+            fn(rect)
+
+    def _paint(self, pts: PointBuffer, rect: Rect) -> None:
+        x0, y0, x1, y1 = rect
+        colors = self._palette(pts.palette)
+        if pts.x.size:
+            m = (pts.x >= x0) & (pts.x <= x1) & (pts.y >= y0) & (pts.y <= y1)
+            if m.any():
+                self.rgba[pts.y[m], pts.x[m]] = colors[pts.color[m]]
+        if pts.n_spans:
+            m = ((pts.span_y >= y0) & (pts.span_y <= y1)
+                 & (pts.span_x1 >= x0) & (pts.span_x0 <= x1))
+            if m.any():
+                lo = np.maximum(pts.span_x0[m], x0).tolist()
+                hi = (np.minimum(pts.span_x1[m], x1) + 1).tolist()
+                for y, a, b, c in zip(pts.span_y[m].tolist(), lo, hi, pts.span_color[m].tolist()):
+                    self.rgba[y, a:b] = colors[c]
+
+    def stats(self) -> dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "shapes": len(self._painted),
+            "syncs": self.syncs,
+            "repainted_pixels": self.repainted_pixels,
+        }
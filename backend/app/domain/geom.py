@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 import math
 
+import numpy as np
+
 @dataclass
 class Mat2x3:
     a: float = 1; c: float = 0; tx: float = 0
@@ -41,6 +43,86 @@ class Mat2x3:
     def scale(sx: float, sy: float) -> "Mat2x3":
         return Mat2x3(sx, 0, 0, 0, sy, 0)
 
+    def inverse(self) -> "Mat2x3":
+        det = self.a * self.d - self.b * self.c
+        if abs(det) < 1e-12:
+            raise ValueError("transform is singular")
+        a, c, b, d = self.d / det, -self.c / det, -self.b / det, self.a / det
+        return Mat2x3(a, c, -(a * self.tx + c * self.ty), b, d, -(b * self.tx + d * self.ty))
+
+    def similarity_scale(self):
+        """
+        线性部分是“旋转（或镜像）+ 等比缩放”时返回缩放倍数，否则 None。
+        这种变换把圆还映成圆，点到圆的距离可以直接算
+        """
+        if math.isclose(self.a, self.d, abs_tol=1e-12) and math.isclose(self.b, -self.c, abs_tol=1e-12):
+            return math.hypot(self.a, self.b)
+        if math.isclose(self.a, -self.d, abs_tol=1e-12) and math.isclose(self.b, self.c, abs_tol=1e-12):
+            return math.hypot(self.a, self.b)
+        return None
+
+# ----------------------
+# 点到几何的距离（拾取用）
+# ----------------------
+# 顶点少的时候纯 Python 比 NumPy 快（省掉一堆小数组的开销）
+_SMALL_POLYLINE = 24
+
+
+def _segment_distance(px, py, qx, qy, x, y) -> float:
+    dx, dy = qx - px, qy - py
+    len2 = dx * dx + dy * dy
+    t = 0.0 if len2 == 0 else max(0.0, min(1.0, ((x - px) * dx + (y - py) * dy) / len2))
+    return math.hypot(px + t * dx - x, py + t * dy - y)
+
+
+def point_polyline_distance(pts, x: float, y: float, closed: bool = False) -> float:
+    """点 (x, y) 到折线（closed=True 时是多边形边界）的最短距离"""
+    n = len(pts)
+    if n == 0:
+        return math.inf
+    if n <= _SMALL_POLYLINE:
+        v = [(float(p[0]), float(p[1])) for p in pts]
+        if n == 1:
+            return math.hypot(v[0][0] - x, v[0][1] - y)
+        pairs = zip(v, v[1:] + v[:1]) if closed else zip(v, v[1:])
+        return min(_segment_distance(p[0], p[1], q[0], q[1], x, y) for p, q in pairs)
+
+    # 顶点多：所有线段一次算完
+    v = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+    if closed:
+        v = np.concatenate([v, v[:1]])
+    p, d = v[:-1], np.diff(v, axis=0)
+    len2 = np.einsum("ij,ij->i", d, d)
+    len2[len2 == 0] = np.inf
+    t = np.clip(((x - p[:, 0]) * d[:, 0] + (y - p[:, 1]) * d[:, 1]) / len2, 0.0, 1.0)
+    ex = p[:, 0] + t * d[:, 0] - x
+    ey = p[:, 1] + t * d[:, 1] - y
+    return float(np.sqrt((ex * ex + ey * ey).min()))
+
+
+def point_in_polygon(pts, x: float, y: float) -> bool:
+    """奇偶规则：从 (x, y) 往右的射线穿过边的次数为奇数就在里面"""
+    n = len(pts)
+    if n < 3:
+        return False
+    if n <= _SMALL_POLYLINE:
+        inside = False
+        px, py = float(pts[-1][0]), float(pts[-1][1])
+        for p in pts:
+            qx, qy = float(p[0]), float(p[1])
+            if (py > y) != (qy > y) and px + (y - py) * (qx - px) / (qy - py) > x:
+                inside = not inside
+            px, py = qx, qy
+        return inside
+    v = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+    p, q = v, np.roll(v, -1, axis=0)
+    straddle = (p[:, 1] > y) != (q[:, 1] > y)
+    if not straddle.any():
+        return False
+    p, q = p[straddle], q[straddle]
+    xi = p[:, 0] + (y - p[:, 1]) * (q[:, 0] - p[:, 0]) / (q[:, 1] - p[:, 1])
+    return bool(np.count_nonzero(xi > x) % 2)
+
 def _clip_against_edge(points, inside_fn, intersect_fn):
     """Sutherland–Hodgman 的单边裁剪"""
     if not points:
@@ -0,0 +1,177 @@
+# backend/app/domain/history.py
+"""
+撤销 / 重做用的命令日志。
+
+不再给整个场景拍深拷贝快照，而是只记录“改了什么”：
+- AddOp:       新加了哪个 id
+- RemoveOp:    删掉的那个 shape（以及它原来的位置，撤销时放回去保持绘制顺序）
+- TransformOp: 某个 shape 变换前 / 后的矩阵
+- ReplaceOp:   几何被整体替换（裁剪）时，替换前 / 后的 shape 对象
+
+一次用户操作（或者 begin_batch ~ end_batch 之间的整段拖拽）对应一个 Command，
+undo / redo 的代价只和这次改动到的 shape 数量有关，和场景大小无关。
+
+所有 op 都通过 Scene 的 _put_shape / _drop_shape / _set_transform 去改场景，
+这样缓存、版本号之类的簿记只需要在 Scene 里维护一处。
+
+历史本身有上限（HistoryPolicy）：条数和估算字节数超了就先合并老的连续变换，
+还不够再从最老的开始丢。
+"""
+import sys
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from .geom import Mat2x3
+from .shapes import Shape
+
+
+@dataclass
+class HistoryPolicy:
+    """撤销历史的上限"""
+    max_entries: int = 500                # 最多保留多少条可撤销操作
+    max_bytes: int = 64 * 1024 * 1024     # 历史（undo + redo）估算占用上限
+    keep_recent: int = 20                 # 最近这么多条不合并，保证细粒度撤销
+
+
+def approx_nbytes(obj, _seen: Optional[set] = None) -> int:
+    """
+    粗略估算一个对象（连同它引用的 list / dict / dataclass）占多少字节。
+    只用来做历史预算，不追求精确。
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += approx_nbytes(k, _seen) + approx_nbytes(v, _seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for v in obj:
+            size += approx_nbytes(v, _seen)
+    elif hasattr(obj, "__dict__"):
+        size += approx_nbytes(vars(obj), _seen)
+    return size
+
+
+class Op:
+    """一条可逆操作"""
+    sid: str
+
+    def nbytes(self) -> int:
+        """这条 op 让历史额外占住的内存（估算）"""
+        return approx_nbytes(self)
+
+    def undo(self, scene) -> None:
+        raise NotImplementedError
+
+    def redo(self, scene) -> None:
+        raise NotImplementedError
+
+
+@dataclass
+class AddOp(Op):
+    sid: str
+    shape: Shape
+
+    def nbytes(self) -> int:
+        # 加进来的 shape 还活在场景里，历史只多持有一个引用
+        return sys.getsizeof(self) + sys.getsizeof(self.sid)
+
+    def undo(self, scene) -> None:
+        scene._drop_shape(self.sid)
+
+    def redo(self, scene) -> None:
+        scene._put_shape(self.sid, self.shape)
+
+
+@dataclass
+class RemoveOp(Op):
+    sid: str
+    shape: Shape
+    index: int  # 删除时它在 _shapes 里的位置
+
+    def undo(self, scene) -> None:
+        scene._put_shape(self.sid, self.shape, self.index)
+
+    def redo(self, scene) -> None:
+        scene._drop_shape(self.sid)
+
+
+@dataclass
+class TransformOp(Op):
+    sid: str
+    before: Mat2x3
+    after: Mat2x3
+
+    def nbytes(self) -> int:
+        return (sys.getsizeof(self) + sys.getsizeof(self.sid)
+                + approx_nbytes(self.before) + approx_nbytes(self.after))
+
+    def undo(self, scene) -> None:
+        scene._set_transform(self.sid, self.before)
+
+    def redo(self, scene) -> None:
+        scene._set_transform(self.sid, self.after)
+
+
+@dataclass
+class ReplaceOp(Op):
+    sid: str
+    before: Shape
+    after: Shape
+
+    def undo(self, scene) -> None:
+        scene._put_shape(self.sid, self.before)
+
+    def redo(self, scene) -> None:
+        scene._put_shape(self.sid, self.after)
+
+
+@dataclass
+class Command:
+    """一次可撤销的用户操作，由若干 op 组成"""
+    ops: List[Op] = field(default_factory=list)
+    # 进撤销栈时算一次，之后 op 不会再变大
+    nbytes: int = 0
+
+    def measure(self) -> int:
+        self.nbytes = sys.getsizeof(self) + sum(op.nbytes() for op in self.ops)
+        return self.nbytes
+
+    def is_pure_transform(self) -> bool:
+        return bool(self.ops) and all(isinstance(op, TransformOp) for op in self.ops)
+
+    def merge_transforms(self, newer: "Command") -> Optional["Command"]:
+        """
+        两条都只有变换、而且动的是同一批 shape 时，合成一条：
+        before 取自己的，after 取 newer 的。合不了返回 None。
+        """
+        if not (self.is_pure_transform() and newer.is_pure_transform()):
+            return None
+        mine = {op.sid: op for op in self.ops}
+        theirs = {op.sid: op for op in newer.ops}
+        if len(mine) != len(self.ops) or len(theirs) != len(newer.ops) or mine.keys() != theirs.keys():
+            return None
+        merged = Command([TransformOp(sid, op.before, theirs[sid].after) for sid, op in mine.items()])
+        merged.measure()
+        return merged
+
+    def record(self, op: Op) -> None:
+        # 连续对同一个 shape 做变换（比如拖拽中的一串 translate），
+        # 只保留最早的 before 和最新的 after
+        last: Optional[Op] = self.ops[-1] if self.ops else None
+        if isinstance(op, TransformOp) and isinstance(last, TransformOp) and last.sid == op.sid:
+            last.after = op.after
+            return
+        self.ops.append(op)
+
+    def undo(self, scene) -> None:
+        for op in reversed(self.ops):
+            op.undo(scene)
+
+    def redo(self, scene) -> None:
+        for op in self.ops:
+            op.redo(scene)
@@ -0,0 +1,357 @@
+# backend/app/domain/points.py
+"""
+列式像素缓冲：代替原来一个像素一个 {"x","y","color","id","w"} dict 的做法。
+
+散点部分（描边类图形）：
+- x, y:   int32 数组
+- shape:  每个像素属于 shape 表里的第几个（uint16，shape 太多时自动升到 uint32）
+- color:  每个像素在调色板里的下标（同上）
+
+行程部分（填充类图形，一段一行）：
+- span_y, span_x0, span_x1: int32，表示第 y 行 [x0, x1] 闭区间整段都涂上
+- span_shape, span_color:   同上，shape 表 / 调色板下标
+
+- shapes / widths: shape 表（id 和线宽，一一对应）
+- palette: 颜色表
+
+光栅化、虚线、填充、flatten_points 全程都用它，只有在 JSON 出口才 to_dicts()
+（散点还是一个像素一项；行程不展开，一段一项，见 to_dicts）。
+
+二进制传输格式（to_bytes / from_bytes，全部小端，前端直接包成 TypedArray）：
+
+    偏移  类型       内容
+    0     4 bytes    魔数 b"PTS1"
+    4     uint8      格式版本（目前 2）
+    5     uint8      shape 下标每项字节数（2 或 4）
+    6     uint8      color 下标每项字节数（2 或 4）
+    7     uint8      保留
+    8     uint32     散点数 n
+    12    uint32     行程数 m
+    16    uint32     表长度 T（字节，已补齐到 4 的倍数）
+    20    T bytes    JSON：{"shapes": [...], "widths": [...], "palette": [...]}，空格补齐
+    ...   Int32[n]   x
+    ...   Int32[n]   y
+    ...   Uint16/32[n] shape（之后补齐到 4 字节）
+    ...   Uint16/32[n] color（之后补齐到 4 字节）
+    ...   Int32[m]   span y
+    ...   Int32[m]   span x0
+    ...   Int32[m]   span x1
+    ...   Uint16/32[m] span shape（之后补齐到 4 字节）
+    ...   Uint16/32[m] span color（之后补齐到 4 字节）
+"""
+import json
+import struct
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 二进制点集的 MIME，请求头 Accept 里带上它就返回二进制
+POINTS_MIME = "application/x-paint-points"
+WIRE_MAGIC = b"PTS1"
+WIRE_VERSION = 2
+_HEADER = struct.Struct("<4sBBBxIII")
+# 线上的小端类型 -> 内存里用的类型
+_NATIVE = {"<i4": np.int32, "<u2": np.uint16, "<u4": np.uint32}
+
+
+def _index_dtype(n: int):
+    return np.uint16 if n <= 0xFFFF else np.uint32
+
+
+def _pad4(b: bytes) -> bytes:
+    return b + b"\0" * (-len(b) % 4)
+
+
+def _ints():
+    return field(default_factory=lambda: np.empty(0, dtype=np.int32))
+
+
+def _indices():
+    return field(default_factory=lambda: np.empty(0, dtype=np.uint16))
+
+
+def expand_spans(y, x0, x1):
+    """
+    行程 → 逐像素坐标（向量化）。
+    返回 (xs, ys, owner)，owner[i] 是第 i 个像素来自第几段。
+    """
+    y = np.asarray(y, dtype=np.int64)
+    x0 = np.asarray(x0, dtype=np.int64)
+    lengths = np.asarray(x1, dtype=np.int64) - x0 + 1
+    owner = np.repeat(np.arange(y.size), lengths)
+    # 每个像素在自己那段里的偏移 = 全局下标 - 该段起始下标
+    starts = np.cumsum(lengths) - lengths
+    offset = np.arange(owner.size) - starts[owner]
+    xs = (x0[owner] + offset).astype(np.int32)
+    ys = y[owner].astype(np.int32)
+    return xs, ys, owner
+
+
+@dataclass
+class PointBuffer:
+    x: np.ndarray = _ints()
+    y: np.ndarray = _ints()
+    shape: np.ndarray = _indices()
+    color: np.ndarray = _indices()
+    shapes: List[str] = field(default_factory=list)
+    widths: List[int] = field(default_factory=list)
+    palette: List[Any] = field(default_factory=list)
+    span_y: np.ndarray = _ints()
+    span_x0: np.ndarray = _ints()
+    span_x1: np.ndarray = _ints()
+    span_shape: np.ndarray = _indices()
+    span_color: np.ndarray = _indices()
+
+    # ---- 构造 ----
+    @staticmethod
+    def empty() -> "PointBuffer":
+        return PointBuffer()
+
+    @staticmethod
+    def from_xy(xs, ys, shape_id: str, color: Any, w: int = 1) -> "PointBuffer":
+        """同一个 shape、同一种颜色的一串像素"""
+        xs = np.asarray(xs, dtype=np.int32)
+        ys = np.asarray(ys, dtype=np.int32)
+        n = xs.size
+        return PointBuffer(
+            x=xs, y=ys,
+            shape=np.zeros(n, dtype=np.uint16),
+            color=np.zeros(n, dtype=np.uint16),
+            shapes=[shape_id], widths=[max(1, int(w))], palette=[color],
+        )
+
+    @staticmethod
+    def from_spans(ys, x0s, x1s, shape_id: str, color: Any, w: int = 1) -> "PointBuffer":
+        """同一个 shape、同一种颜色的一组行程"""
+        ys = np.asarray(ys, dtype=np.int32)
+        m = ys.size
+        return PointBuffer(
+            shapes=[shape_id], widths=[max(1, int(w))], palette=[color],
+            span_y=ys,
+            span_x0=np.asarray(x0s, dtype=np.int32),
+            span_x1=np.asarray(x1s, dtype=np.int32),
+            span_shape=np.zeros(m, dtype=np.uint16),
+            span_color=np.zeros(m, dtype=np.uint16),
+        )
+
+    @staticmethod
+    def concat(buffers: Iterable["PointBuffer"]) -> "PointBuffer":
+        """
+        按顺序拼接多个缓冲：shape 表直接接在后面，调色板按颜色合并去重，
+        各自的下标数组整体平移 / 查表重映射（全是向量操作）。
+        """
+        buffers = [b for b in buffers if b.shapes]
+        if not buffers:
+            return PointBuffer.empty()
+        if len(buffers) == 1:
+            return buffers[0]
+
+        shapes: List[str] = []
+        widths: List[int] = []
+        palette: List[Any] = []
+        color_index: Dict[Any, int] = {}
+        shape_parts, color_parts = [], []
+        span_shape_parts, span_color_parts = [], []
+        for b in buffers:
+            offset = len(shapes)
+            shapes.extend(b.shapes)
+            widths.extend(b.widths)
+            remap = np.empty(len(b.palette), dtype=np.int64)
+            for i, c in enumerate(b.palette):
+                key = c if not isinstance(c, list) else tuple(c)
+                j = color_index.get(key)
+                if j is None:
+                    j = color_index[key] = len(palette)
+                    palette.append(c)
+                remap[i] = j
+            shape_parts.append(b.shape.astype(np.int64) + offset)
+            color_parts.append(remap[b.color])
+            span_shape_parts.append(b.span_shape.astype(np.int64) + offset)
+            span_color_parts.append(remap[b.span_color])
+
+        shape_t = _index_dtype(len(shapes))
+        color_t = _index_dtype(len(palette))
+        return PointBuffer(
+            x=np.concatenate([b.x for b in buffers]),
+            y=np.concatenate([b.y for b in buffers]),
+            shape=np.concatenate(shape_parts).astype(shape_t),
+            color=np.concatenate(color_parts).astype(color_t),
+            shapes=shapes, widths=widths, palette=palette,
+            span_y=np.concatenate([b.span_y for b in buffers]),
+            span_x0=np.concatenate([b.span_x0 for b in buffers]),
+            span_x1=np.concatenate([b.span_x1 for b in buffers]),
+            span_shape=np.concatenate(span_shape_parts).astype(shape_t),
+            span_color=np.concatenate(span_color_parts).astype(color_t),
+        )
+
+    # ---- 基本操作 ----
+    def __len__(self) -> int:
+        """覆盖的像素总数（散点 + 行程展开后的长度）"""
+        return int(self.x.size) + int(np.sum(self.span_x1 - self.span_x0 + 1, dtype=np.int64))
+
+    @property
+    def n_spans(self) -> int:
+        return int(self.span_y.size)
+
+    def bbox(self) -> Optional[Tuple[int, int, int, int]]:
+        """覆盖范围 (x0, y0, x1, y1)，闭区间；什么都没有时返回 None"""
+        xs_lo, xs_hi, ys = [], [], []
+        if self.x.size:
+            xs_lo.append(self.x.min()); xs_hi.append(self.x.max())
+            ys += [self.y.min(), self.y.max()]
+        if self.span_y.size:
+            xs_lo.append(self.span_x0.min()); xs_hi.append(self.span_x1.max())
+            ys += [self.span_y.min(), self.span_y.max()]
+        if not ys:
+            return None
+        return int(min(xs_lo)), int(min(ys)), int(max(xs_hi)), int(max(ys))
+
+    def take(self, sel) -> "PointBuffer":
+        """按下标数组或布尔掩码取一部分散点（行程、shape 表、调色板原样共用）"""
+        return PointBuffer(
+            x=self.x[sel], y=self.y[sel],
+            shape=self.shape[sel], color=self.color[sel],
+            shapes=self.shapes, widths=self.widths, palette=self.palette,
+            span_y=self.span_y, span_x0=self.span_x0, span_x1=self.span_x1,
+            span_shape=self.span_shape, span_color=self.span_color,
+        )
+
+    def shifted(self, dx: int, dy: int) -> "PointBuffer":
+        """整体平移整数像素：只动坐标列，行程不展开"""
+        return PointBuffer(
+            x=self.x + np.int32(dx), y=self.y + np.int32(dy),
+            shape=self.shape, color=self.color,
+            shapes=self.shapes, widths=self.widths, palette=self.palette,
+            span_y=self.span_y + np.int32(dy),
+            span_x0=self.span_x0 + np.int32(dx), span_x1=self.span_x1 + np.int32(dx),
+            span_shape=self.span_shape, span_color=self.span_color,
+        )
+
+    def cropped(self, x0: int, y0: int, x1: int, y1: int) -> "PointBuffer":
+        """
+        只留窗口 [x0, x1] × [y0, y1]（闭区间）里的部分：散点按坐标筛，
+        行程去掉窗口外的行、两端截到窗口内，不展开。shape 表 / 调色板原样共用。
+        """
+        keep = (self.x >= x0) & (self.x <= x1) & (self.y >= y0) & (self.y <= y1)
+        sx0 = np.maximum(self.span_x0, np.int32(x0))
+        sx1 = np.minimum(self.span_x1, np.int32(x1))
+        rows = (self.span_y >= y0) & (self.span_y <= y1) & (sx0 <= sx1)
+        return PointBuffer(
+            x=self.x[keep], y=self.y[keep],
+            shape=self.shape[keep], color=self.color[keep],
+            shapes=self.shapes, widths=self.widths, palette=self.palette,
+            span_y=self.span_y[rows], span_x0=sx0[rows], span_x1=sx1[rows],
+            span_shape=self.span_shape[rows], span_color=self.span_color[rows],
+        )
+
+    def expand(self) -> "PointBuffer":
+        """
+        把行程展开成散点，得到只有散点的缓冲。
+        按 shape 下标稳定排序，保证和“逐个 shape 依次绘制”的顺序一致。
+        """
+        if self.n_spans == 0:
+            return self
+        sx, sy, owner = expand_spans(self.span_y, self.span_x0, self.span_x1)
+        shape = np.concatenate([self.shape.astype(np.int64), self.span_shape[owner].astype(np.int64)])
+        order = np.argsort(shape, kind="stable")
+        color = np.concatenate([self.color.astype(np.int64), self.span_color[owner].astype(np.int64)])
+        return PointBuffer(
+            x=np.concatenate([self.x, sx])[order],
+            y=np.concatenate([self.y, sy])[order],
+            shape=shape[order].astype(self.shape.dtype),
+            color=color[order].astype(self.color.dtype),
+            shapes=self.shapes, widths=self.widths, palette=self.palette,
+        )
+
+    def colors(self) -> List[Any]:
+        """每个散点的颜色值（不是下标）"""
+        return [self.palette[i] for i in self.color.tolist()]
+
+    # ---- JSON 出口 ----
+    def to_dicts(self) -> List[Dict]:
+        """
+        转回旧的 [{x, y, color, id, w}, ...] 结构，只在序列化成 JSON 时用。
+        行程不逐像素展开（实心大矩形一展开就是几百万个 dict）：每段一项
+        {y, x0, x1, color, id, w}，有没有 x0 就能区分。
+        顺序和 expand() 一样按 shape 稳定排序（同一个 shape 先散点、后行程），
+        所以整场景的结果和逐个 shape 拼起来（流式输出）完全一致
+        """
+        ids = self.shapes
+        widths = self.widths
+        palette = self.palette
+        out = [
+            {"x": x, "y": y, "color": palette[c], "id": ids[s], "w": widths[s]}
+            for x, y, s, c in zip(self.x.tolist(), self.y.tolist(),
+                                  self.shape.tolist(), self.color.tolist())
+        ]
+        if self.n_spans == 0:
+            return out
+        out += [
+            {"y": y, "x0": x0, "x1": x1, "color": palette[c], "id": ids[s], "w": widths[s]}
+            for y, x0, x1, s, c in zip(self.span_y.tolist(), self.span_x0.tolist(), self.span_x1.tolist(),
+                                       self.span_shape.tolist(), self.span_color.tolist())
+        ]
+        order = np.argsort(np.concatenate([self.shape.astype(np.int64), self.span_shape.astype(np.int64)]),
+                           kind="stable")
+        return [out[i] for i in order.tolist()]
+
+    def span_dicts(self) -> List[Dict]:
+        """行程部分转成 [{y, x0, x1, color}, ...]（不展开）"""
+        palette = self.palette
+        return [
+            {"y": y, "x0": x0, "x1": x1, "color": palette[c]}
+            for y, x0, x1, c in zip(self.span_y.tolist(), self.span_x0.tolist(),
+                                    self.span_x1.tolist(), self.span_color.tolist())
+        ]
+
+    # ---- 二进制出口 ----
+    def to_bytes(self) -> bytes:
+        """按模块顶部说明的格式打包，前端不用解析就能包成 TypedArray"""
+        table = json.dumps(
+            {"shapes": self.shapes, "widths": self.widths, "palette": self.palette},
+            separators=(",", ":"), ensure_ascii=False,
+        ).encode("utf-8")
+        table += b" " * (-len(table) % 4)
+        si = np.dtype(_index_dtype(len(self.shapes))).itemsize
+        ci = np.dtype(_index_dtype(len(self.palette))).itemsize
+        shape_t, color_t = "<u%d" % si, "<u%d" % ci
+        return b"".join([
+            _HEADER.pack(WIRE_MAGIC, WIRE_VERSION, si, ci,
+                         int(self.x.size), self.n_spans, len(table)),
+            table,
+            self.x.astype("<i4", copy=False).tobytes(),
+            self.y.astype("<i4", copy=False).tobytes(),
+            _pad4(self.shape.astype(shape_t, copy=False).tobytes()),
+            _pad4(self.color.astype(color_t, copy=False).tobytes()),
+            self.span_y.astype("<i4", copy=False).tobytes(),
+            self.span_x0.astype("<i4", copy=False).tobytes(),
+            self.span_x1.astype("<i4", copy=False).tobytes(),
+            _pad4(self.span_shape.astype(shape_t, copy=False).tobytes()),
+            _pad4(self.span_color.astype(color_t, copy=False).tobytes()),
+        ])
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "PointBuffer":
+        """to_bytes 的逆过程（调试 / 脚本里用）"""
+        magic, version, si, ci, n, m, tlen = _HEADER.unpack_from(data, 0)
+        if magic != WIRE_MAGIC or version != WIRE_VERSION:
+            raise ValueError("not a point buffer")
+        off = _HEADER.size
+        table = json.loads(data[off:off + tlen].decode("utf-8"))
+        off += tlen
+
+        def column(dtype, itemsize, count):
+            nonlocal off
+            arr = np.frombuffer(data, dtype=dtype, count=count, offset=off)
+            off += count * itemsize + (-(count * itemsize) % 4)
+            return arr.astype(_NATIVE[dtype])
+
+        shape_t, color_t = "<u%d" % si, "<u%d" % ci
+        return PointBuffer(
+            x=column("<i4", 4, n), y=column("<i4", 4, n),
+            shape=column(shape_t, si, n), color=column(color_t, ci, n),
+            shapes=table["shapes"], widths=table["widths"], palette=table["palette"],
+            span_y=column("<i4", 4, m), span_x0=column("<i4", 4, m), span_x1=column("<i4", 4, m),
+            span_shape=column(shape_t, si, m), span_color=column(color_t, ci, m),
+        )
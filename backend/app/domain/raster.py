@@ -0,0 +1,626 @@
+# backend/app/domain/raster.py
+"""
+向量化的光栅化小工具（NumPy）。
+
+shapes.py 里的各个图形负责“几何 → 世界坐标”，这里负责“世界坐标 → 像素”，
+全部按数组一次算完，不再一个像素一个 dict 地 append。
+"""
+from functools import lru_cache
+from math import comb
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# 曲线展平成折线时允许的最大偏差（像素）
+FLATNESS_TOLERANCE = 0.25
+# 自适应细分的最大层数（2^16 段足够任何画布尺寸的曲线）
+MAX_SUBDIVISION_DEPTH = 16
+
+IntArray = np.ndarray
+
+
+def round_half_up(v) -> IntArray:
+    """
+    四舍五入到像素：floor(v + 0.5)，.5 一律往大取（和 FillBlob 的取整一致）。
+    不用 np.rint / Python round 的“.5 向偶数取”：那种取整在整数平移下不保持，
+    同一个形状平移 k 像素后光栅就不一定等于原光栅平移 k 像素，
+    光栅缓存的整数平移快路径（Scene._rasterize_cached）就会和重新光栅化对不上。
+    """
+    return np.floor(np.asarray(v, dtype=np.float64) + 0.5).astype(np.int64)
+
+
+def bresenham_segments(x0, y0, x1, y1) -> Tuple[IntArray, IntArray]:
+    """
+    一次性光栅化多条线段，结果和逐段调用 shapes.bresenham 拼起来完全一样
+    （包括每段首尾像素、段与段之间重复的端点）。
+
+    对第 i 个像素，主轴坐标走 i 步，副轴坐标是闭式解：
+        minor_i = (2 * i * d_minor + d_major - 1) // (2 * d_major)
+    这正是那版整数误差累加 Bresenham 的取整规则。
+
+    x0, y0, x1, y1: 等长的整数数组（每个元素是一条线段的端点）
+    返回 int32 的 xs, ys
+    """
+    x0 = np.atleast_1d(np.asarray(x0, dtype=np.int64))
+    y0 = np.atleast_1d(np.asarray(y0, dtype=np.int64))
+    x1 = np.atleast_1d(np.asarray(x1, dtype=np.int64))
+    y1 = np.atleast_1d(np.asarray(y1, dtype=np.int64))
+    if x0.size == 0:
+        empty = np.empty(0, dtype=np.int32)
+        return empty, empty.copy()
+
+    dx = np.abs(x1 - x0)
+    dy = np.abs(y1 - y0)
+    sx = np.where(x0 < x1, 1, -1)
+    sy = np.where(y0 < y1, 1, -1)
+    major = np.maximum(dx, dy)
+    counts = major + 1
+
+    # 每个像素属于哪条线段、是该线段的第几个像素
+    seg = np.repeat(np.arange(x0.size), counts)
+    starts = np.cumsum(counts) - counts
+    i = np.arange(seg.size, dtype=np.int64) - starts[seg]
+
+    dx_s, dy_s, major_s = dx[seg], dy[seg], major[seg]
+    x_major = dx_s >= dy_s
+    minor_d = np.where(x_major, dy_s, dx_s)
+    denom = 2 * np.maximum(major_s, 1)
+    minor = (2 * i * minor_d + major_s - 1) // denom
+    minor = np.where(major_s == 0, 0, minor)
+
+    xs = x0[seg] + sx[seg] * np.where(x_major, i, minor)
+    ys = y0[seg] + sy[seg] * np.where(x_major, minor, i)
+    return xs.astype(np.int32), ys.astype(np.int32)
+
+
+def rasterize_polyline(vertices, closed: bool = False) -> Tuple[IntArray, IntArray]:
+    """
+    折线 / 多边形描边：vertices 是 (N, 2) 的世界坐标（可以是小数，先四舍五入到像素），
+    所有边一次算完。closed=True 时补上最后一个点回到第一个点的边。
+    输出顺序和逐边调用 bresenham 再拼接一致。
+    """
+    v = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    if len(v) < 2:
+        empty = np.empty(0, dtype=np.int32)
+        return empty, empty.copy()
+    p = round_half_up(v)
+    if closed:
+        q = np.roll(p, -1, axis=0)
+    else:
+        p, q = p[:-1], p[1:]
+    return bresenham_segments(p[:, 0], p[:, 1], q[:, 0], q[:, 1])
+
+
+def dash_mask(n: int, on: int, off: int) -> np.ndarray:
+    """
+    虚线规则的向量化版本：画 on 个、跳 off 个，周而复始。
+    on<=0 或 off<=0 表示实线，全部保留。
+    """
+    if on <= 0 or off <= 0:
+        return np.ones(n, dtype=bool)
+    return (np.arange(n) % (on + off)) < on
+
+
+def unique_first(xs: IntArray, ys: IntArray) -> np.ndarray:
+    """
+    像素去重，保留每个 (x, y) 第一次出现的位置，并保持原来的先后顺序。
+    返回要保留的下标。
+    """
+    if xs.size == 0:
+        return np.empty(0, dtype=np.int64)
+    key = (xs.astype(np.int64) << 32) | (ys.astype(np.int64) & 0xFFFFFFFF)
+    _, first = np.unique(key, return_index=True)
+    first.sort()
+    return first
+
+
+def pseudo_angle(x, y) -> np.ndarray:
+    """
+    不用三角函数的“伪角度”：随 atan2(y, x) 单调递增，取值 [0, 4)，
+    从 +x 方向（0）开始逆时针。只用来排序，不是真的角度。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    s = np.abs(x) + np.abs(y)
+    p = np.divide(x, s, out=np.ones_like(x), where=s > 0)
+    return np.where(y >= 0, 1.0 - p, 3.0 + p)
+
+
+def _ellipse_form(ux: float, uy: float, vx: float, vy: float):
+    """
+    共轭半轴 u、v 张成的椭圆写成隐式二次型 A*dx^2 + 2B*dx*dy + C*dy^2 = 1。
+    返回 (det, A, B, C, x 方向半宽, y 方向半高)；u、v 共线时返回 None
+    """
+    det = ux * vy - vx * uy
+    if abs(det) < 1e-9:
+        return None
+    inv_det2 = 1.0 / (det * det)
+    A = (vy * vy + uy * uy) * inv_det2
+    B = -(vy * vx + uy * ux) * inv_det2
+    C = (vx * vx + ux * ux) * inv_det2
+    ex = np.sqrt(ux * ux + vx * vx)   # x 方向半宽
+    ey = np.sqrt(uy * uy + vy * vy)   # y 方向半高
+    return det, A, B, C, ex, ey
+
+
+def ellipse_ring(cx: float, cy: float, ux: float, uy: float, vx: float, vy: float,
+                 window: Optional[Tuple[float, float, float, float]] = None):
+    """
+    仿射变换后的圆 = 一般位置的椭圆 P(t) = C + u*cos(t) + v*sin(t) 的像素。
+
+    用隐式二次型 d^T Q d = 1（d = P - C）直接求交点，不做三角采样：
+    - 斜率 |k| <= 1 的那几段，按整数 x 逐列解出 y；
+    - 斜率 |k| >= 1 的那几段，按整数 y 逐行解出 x。
+    这就是中点画圆 / 画椭圆的分区思路，所以结果是单像素宽的环，
+    代价和周长（像素数）成正比。
+    window=(x0, y0, x1, y1) 时只解落在这个框里的列 / 行（画圆弧时用，代价跟着弧长走）。
+
+    返回 (xs, ys, qx, qy)：像素已去重，并按参数角 t 从 0 开始递增排好序；
+    qx, qy 是每个像素对应的精确交点在“单位圆参数空间”里的坐标
+    （(cos t, sin t)，画圆弧时用来判断是否在弧上）。
+    列 / 行交界处取整偶尔会差出 2 个像素，需要连通的调用方自己 bridge_gaps。
+    u、v 共线（椭圆退化成线段）时返回 None，由调用方自己兜底。
+    """
+    form = _ellipse_form(ux, uy, vx, vy)
+    if form is None:
+        return None
+    det, A, B, C, ex, ey = form
+    x_lo, x_hi, y_lo, y_hi = cx - ex, cx + ex, cy - ey, cy + ey
+    if window is not None:
+        x_lo, x_hi = max(x_lo, window[0]), min(x_hi, window[2])
+        y_lo, y_hi = max(y_lo, window[1]), min(y_hi, window[3])
+
+    # 每个候选像素同时记下它来自的那个“精确交点”，排序和弧段判断都用精确点
+    parts_x, parts_y, exact_x, exact_y = [], [], [], []
+
+    # 逐列：C*dy^2 + 2B*dx*dy + (A*dx^2 - 1) = 0
+    X = np.arange(np.ceil(x_lo), np.floor(x_hi) + 1)
+    if X.size:
+        dx = X - cx
+        disc = np.sqrt(np.maximum(B * B * dx * dx - C * (A * dx * dx - 1.0), 0.0))
+        for sign in (1.0, -1.0):
+            dy = (-B * dx + sign * disc) / C
+            keep = np.abs(A * dx + B * dy) <= np.abs(B * dx + C * dy)
+            parts_x.append(X[keep])
+            parts_y.append(round_half_up(cy + dy[keep]))
+            exact_x.append(dx[keep])
+            exact_y.append(dy[keep])
+
+    # 逐行：A*dx^2 + 2B*dy*dx + (C*dy^2 - 1) = 0
+    Y = np.arange(np.ceil(y_lo), np.floor(y_hi) + 1)
+    if Y.size:
+        dy = Y - cy
+        disc = np.sqrt(np.maximum(B * B * dy * dy - A * (C * dy * dy - 1.0), 0.0))
+        for sign in (1.0, -1.0):
+            dx = (-B * dy + sign * disc) / A
+            keep = np.abs(A * dx + B * dy) >= np.abs(B * dx + C * dy)
+            parts_x.append(round_half_up(cx + dx[keep]))
+            parts_y.append(Y[keep])
+            exact_x.append(dx[keep])
+            exact_y.append(dy[keep])
+
+    if not parts_x or sum(p.size for p in parts_x) == 0:
+        if window is not None:
+            empty = np.empty(0, dtype=np.int32)
+            return empty, empty.copy(), np.empty(0), np.empty(0)
+        # 比一个像素还小：画圆心那一个点
+        return (round_half_up([cx]).astype(np.int32), round_half_up([cy]).astype(np.int32),
+                np.ones(1), np.zeros(1))
+    xs = np.concatenate(parts_x).astype(np.int64)
+    ys = np.concatenate(parts_y).astype(np.int64)
+    px = np.concatenate(exact_x)
+    py = np.concatenate(exact_y)
+
+    # 精确交点回到单位圆参数空间 q = M^-1 (P - C)，按参数角 t 排序（从 t=0 开始），
+    # 再去重（保留排序后第一次出现的）
+    qx = (vy * px - vx * py) / det
+    qy = (-uy * px + ux * py) / det
+    order = np.argsort(pseudo_angle(qx, qy), kind="stable")
+    xs, ys, qx, qy = xs[order], ys[order], qx[order], qy[order]
+    first = unique_first(xs, ys)
+    return xs[first].astype(np.int32), ys[first].astype(np.int32), qx[first], qy[first]
+
+
+def ellipse_spans(cx: float, cy: float, ux: float, uy: float, vx: float, vy: float):
+    """
+    实心椭圆（ellipse_ring 的内部）的行程：每个整数 y 精确解出左右两个交点，
+    [ceil(左), floor(右)] 就是这一行，代价和行数成正比。
+    返回 (ys, x0s, x1s)；u、v 共线时返回 None。
+    """
+    form = _ellipse_form(ux, uy, vx, vy)
+    if form is None:
+        return None
+    _, A, B, C, _, ey = form
+    Y = np.arange(np.ceil(cy - ey), np.floor(cy + ey) + 1)
+    dy = Y - cy
+    # 逐行：A*dx^2 + 2B*dy*dx + (C*dy^2 - 1) = 0
+    disc = B * B * dy * dy - A * (C * dy * dy - 1.0)
+    ok = disc >= 0
+    Y, dy, root = Y[ok], dy[ok], np.sqrt(disc[ok])
+    x0s = np.ceil(cx + (-B * dy - root) / A).astype(np.int64)
+    x1s = np.floor(cx + (-B * dy + root) / A).astype(np.int64)
+    keep = x0s <= x1s
+    return Y[keep].astype(np.int64), x0s[keep], x1s[keep]
+
+
+def bridge_gaps(xs: IntArray, ys: IntArray, closed: bool) -> Tuple[IntArray, IntArray]:
+    """
+    按顺序把相邻但不挨着（切比雪夫距离 > 1）的两个像素用 Bresenham 连起来，
+    保证整串像素 8 连通；closed=True 时首尾也连。补出来的点插在缺口处，最后去重。
+    绝大多数相邻像素本来就挨着，这一步几乎不加新点。
+    """
+    if xs.size < 2:
+        return xs, ys
+    xs = xs.astype(np.int64)
+    ys = ys.astype(np.int64)
+    nx, ny = np.roll(xs, -1), np.roll(ys, -1)
+    gap = np.maximum(np.abs(nx - xs), np.abs(ny - ys)) > 1
+    if not closed:
+        gap[-1] = False
+    if gap.any():
+        idx = np.flatnonzero(gap)
+        fx, fy = bresenham_segments(xs[idx], ys[idx], nx[idx], ny[idx])
+        seg_len = np.maximum(np.abs(nx[idx] - xs[idx]), np.abs(ny[idx] - ys[idx])) + 1
+        pos = np.concatenate([np.arange(xs.size), np.repeat(idx, seg_len)])
+        order = np.argsort(pos, kind="stable")
+        xs = np.concatenate([xs, fx])[order]
+        ys = np.concatenate([ys, fy])[order]
+        first = unique_first(xs, ys)
+        xs, ys = xs[first], ys[first]
+    return xs.astype(np.int32), ys.astype(np.int32)
+
+
+def _relative_angle(qx, qy, sx: float, sy: float, direction: float) -> np.ndarray:
+    """q 相对起点方向 s、沿 direction（+1 逆时针 / -1 顺时针）转过的伪角度，[0, 4)"""
+    qx = np.asarray(qx, dtype=np.float64)
+    qy = np.asarray(qy, dtype=np.float64)
+    return pseudo_angle(qx * sx + qy * sy, direction * (sx * qy - sy * qx))
+
+
+def ellipse_arc(cx: float, cy: float, ux: float, uy: float, vx: float, vy: float,
+                start: Tuple[float, float], end: Tuple[float, float], direction: float):
+    """
+    椭圆 P(t) = C + u*cos(t) + v*sin(t) 上从参数方向 start 转到 end 的那一段弧。
+
+    start / end 是单位圆参数空间里的方向向量 (cos t, sin t)，
+    direction=+1 表示 t 增大方向，-1 表示 t 减小方向。
+    全程没有三角函数：是否在弧上、沿弧排序都用“相对起点的伪角度”判断。
+    只在弧的包围盒里逐列 / 逐行求交，代价和弧长成正比，与半径无关地平稳。
+    起点、终点的像素总会画出来，整段 8 连通。
+    退化时返回 None。
+    """
+    if abs(ux * vy - vx * uy) < 1e-9:
+        return None
+    sx, sy = start
+    ex_, ey_ = end
+    end_angle = _relative_angle(ex_, ey_, sx, sy, direction)
+
+    def on_arc(qx, qy):
+        return _relative_angle(qx, qy, sx, sy, direction) <= end_angle
+
+    def to_world(qx, qy):
+        qx = np.asarray(qx, dtype=np.float64)
+        qy = np.asarray(qy, dtype=np.float64)
+        return cx + ux * qx + vx * qy, cy + uy * qx + vy * qy
+
+    # 包围盒：两个端点 + 落在弧上的 x / y 极值点
+    nx_, ny_ = np.hypot(ux, vx), np.hypot(uy, vy)
+    cand_qx = [sx, ex_]
+    cand_qy = [sy, ey_]
+    for qx, qy in ((ux / nx_, vx / nx_), (-ux / nx_, -vx / nx_),
+                   (uy / ny_, vy / ny_), (-uy / ny_, -vy / ny_)):
+        if on_arc(qx, qy):
+            cand_qx.append(qx)
+            cand_qy.append(qy)
+    bx, by = to_world(cand_qx, cand_qy)
+    window = (bx.min() - 1, by.min() - 1, bx.max() + 1, by.max() + 1)
+
+    xs, ys, qx, qy = ellipse_ring(cx, cy, ux, uy, vx, vy, window=window)
+    rel = _relative_angle(qx, qy, sx, sy, direction)
+    keep = rel <= end_angle
+    order = np.argsort(rel[keep], kind="stable")
+    xs, ys = xs[keep][order], ys[keep][order]
+
+    # 端点精确落在三点里给的起点 / 终点像素上
+    (p0x, p3x), (p0y, p3y) = to_world([sx, ex_], [sy, ey_])
+    xs = np.concatenate([round_half_up([p0x]), xs, round_half_up([p3x])])
+    ys = np.concatenate([round_half_up([p0y]), ys, round_half_up([p3y])])
+    first = unique_first(xs, ys)
+    return bridge_gaps(xs[first], ys[first], closed=False)
+
+
+@lru_cache(maxsize=64)
+def bezier_split_matrices(degree: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    n 次 Bézier 在 t=0.5 处一分为二的矩阵形式（de Casteljau 的闭式）：
+        left  = L @ P,  L[i, j] = C(i, j) / 2^i              (j <= i)
+        right = R @ P,  R[i, j] = C(n-i, j-i) / 2^(n-i)      (j >= i)
+    按次数缓存，所有曲线、所有细分层共用。
+    """
+    n = degree
+    L = np.zeros((n + 1, n + 1))
+    R = np.zeros((n + 1, n + 1))
+    for i in range(n + 1):
+        for j in range(i + 1):
+            L[i, j] = comb(i, j) / 2.0 ** i
+        for j in range(i, n + 1):
+            R[i, j] = comb(n - i, j - i) / 2.0 ** (n - i)
+    L.setflags(write=False)
+    R.setflags(write=False)
+    return L, R
+
+
+def _control_polygon_deviation(ctrl: np.ndarray) -> np.ndarray:
+    """
+    ctrl: (k, n+1, 2)，每段曲线的控制点。
+    返回每段内部控制点到弦 P0-Pn（线段，不是整条直线）的最大距离。
+    曲线一定落在控制多边形的凸包里，凸包上离线段最远的点是某个顶点，
+    所以这个值是曲线偏离弦的上界；投影要夹到 [0, 1]，否则沿弦方向折回去的
+    控制多边形（比如 0 -> 1000 -> -1000 -> 100）会被误当成平的。
+    """
+    if ctrl.shape[1] <= 2:
+        return np.zeros(len(ctrl))
+    a = ctrl[:, :1, :]
+    d = ctrl[:, -1:, :] - a
+    rel = ctrl[:, 1:-1, :] - a
+    len2 = d[..., 0] ** 2 + d[..., 1] ** 2
+    t = (rel[..., 0] * d[..., 0] + rel[..., 1] * d[..., 1]) / np.maximum(len2, 1e-24)
+    t = np.where(len2 > 1e-24, np.clip(t, 0.0, 1.0), 0.0)   # 弦退化成点时就是到 P0 的距离
+    off = rel - t[..., None] * d
+    return np.hypot(off[..., 0], off[..., 1]).max(axis=1)
+
+
+def flatten_bezier(ctrl_pts, tol: float = FLATNESS_TOLERANCE) -> np.ndarray:
+    """
+    把世界坐标下的 Bézier 控制点 (n+1, 2) 自适应地展平成折线顶点 (m, 2)。
+
+    每一层把所有“还不够平”的段一起用缓存的分裂矩阵劈成两半（批量 einsum），
+    够平的段直接收下；只有弯得厉害的地方才会继续细分，直线段一层就结束。
+    """
+    P = np.asarray(ctrl_pts, dtype=np.float64).reshape(-1, 2)
+    degree = len(P) - 1
+    if degree < 1:
+        return P.copy()
+    L, R = bezier_split_matrices(degree)
+
+    pending = P[None, :, :]
+    starts = np.zeros(1)               # 每段的起始参数 t，用来最后排回曲线顺序
+    width = 1.0
+    done_ctrl, done_t = [], []
+    for depth in range(MAX_SUBDIVISION_DEPTH + 1):
+        flat = _control_polygon_deviation(pending) <= tol
+        if depth == MAX_SUBDIVISION_DEPTH:
+            flat[:] = True
+        done_ctrl.append(pending[flat])
+        done_t.append(starts[flat])
+        pending, starts = pending[~flat], starts[~flat]
+        if len(pending) == 0:
+            break
+        width /= 2.0
+        left = np.einsum("ij,kjd->kid", L, pending)
+        right = np.einsum("ij,kjd->kid", R, pending)
+        pending = np.concatenate([left, right])
+        starts = np.concatenate([starts, starts + width])
+
+    segs = np.concatenate(done_ctrl)
+    order = np.argsort(np.concatenate(done_t), kind="stable")
+    segs = segs[order]
+    return np.vstack([segs[:, 0, :], segs[-1:, -1, :]])
+
+
+def uniform_knot_vector(n_ctrl: int, degree: int) -> np.ndarray:
+    """
+    BSpline 用的节点向量（保持原来 BSpline._uniform_knot_vector 的取法）：
+    首尾各重复 degree+1 次，中间均匀分布。
+    """
+    n = n_ctrl - 1
+    k = degree
+    m = n + k + 1
+    inner = m - 2 * k - 1
+    return np.array([0.0] * (k + 1) + [i / inner for i in range(inner)] + [1.0] * (k + 1))
+
+
+@lru_cache(maxsize=128)
+def bspline_basis(n_ctrl: int, order: int, n_samples: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    在 t = 0, 1/n_samples, ..., 1 上预先算好的 B 样条基函数矩阵（稀疏形式）。
+
+    每个采样点只有 order 个非零基函数（它所在节点区间的那几个），所以存成：
+        idx:     (n_samples+1, order) 参与的控制点下标
+        weights: (n_samples+1, order) 对应的基函数值
+    用 de Boor / Cox–de Boor 的三角递推一次算完所有采样点，不再递归。
+    只依赖 (控制点个数, 阶数, 采样数)，和控制点位置、transform 都无关，
+    所以按这三个值缓存，所有 BSpline 的每次光栅化都能复用。
+    """
+    k = order - 1
+    knots = uniform_knot_vector(n_ctrl, k)
+    t = np.arange(n_samples + 1) / n_samples
+
+    # 每个 t 所在的节点区间 [knots[s], knots[s+1])；t=1 归到最后一个非空区间
+    span = np.searchsorted(knots, t, side="right") - 1
+    span = np.clip(span, k, n_ctrl - 1)
+
+    S = t.size
+    N = np.zeros((S, k + 1))
+    N[:, 0] = 1.0
+    left = np.zeros((S, k + 1))
+    right = np.zeros((S, k + 1))
+    for j in range(1, k + 1):
+        left[:, j] = t - knots[span + 1 - j]
+        right[:, j] = knots[span + j] - t
+        saved = np.zeros(S)
+        for r in range(j):
+            denom = right[:, r + 1] + left[:, j - r]
+            temp = np.divide(N[:, r], denom, out=np.zeros(S), where=denom != 0)
+            N[:, r] = saved + right[:, r + 1] * temp
+            saved = left[:, j - r] * temp
+        N[:, j] = saved
+
+    idx = span[:, None] - k + np.arange(k + 1)[None, :]
+    idx.setflags(write=False)
+    N.setflags(write=False)
+    return idx, N
+
+
+def eval_bspline(ctrl_pts, order: int, n_samples: int) -> np.ndarray:
+    """世界坐标控制点 (n, 2) → 均匀参数采样的曲线点 (n_samples+1, 2)"""
+    P = np.asarray(ctrl_pts, dtype=np.float64).reshape(-1, 2)
+    idx, N = bspline_basis(len(P), order, n_samples)
+    return np.einsum("sr,srd->sd", N, P[idx])
+
+
+# ----------------------
+# 行程 ↔ 轮廓多边形
+# ----------------------
+# 像素 (x, y) 看成单位方格 [x, x+1) × [y, y+1)，轮廓顶点都在像素角点（整数坐标）上。
+# 反过来扫描填充时在像素中心 (x+0.5, y+0.5) 采样，所以不变换时
+# “行程 → 轮廓 → 扫描”能一个像素不差地还原。
+
+def normalize_spans(ys, x0s, x1s) -> Tuple[IntArray, IntArray, IntArray]:
+    """行程按 (y, x0) 排序，同一行里重叠 / 相邻的合成一段"""
+    ys = np.asarray(ys, dtype=np.int64)
+    x0s = np.asarray(x0s, dtype=np.int64)
+    x1s = np.asarray(x1s, dtype=np.int64)
+    if ys.size == 0:
+        return ys, x0s, x1s
+    order = np.lexsort((x0s, ys))
+    ys, x0s, x1s = ys[order], x0s[order], x1s[order]
+    # 每行到目前为止最靠右的 x1（y 单调，所以拼成一个 key 做前缀最大值不会串行）
+    big = int(x1s.max() - x0s.min()) + 4
+    base = int(x0s.min()) - 2
+    reach = np.maximum.accumulate(ys * big + (x1s - base)) - ys * big + base
+    start = np.ones(ys.size, dtype=bool)
+    start[1:] = (ys[1:] != ys[:-1]) | (x0s[1:] > reach[:-1] + 1)
+    idx = np.flatnonzero(start)
+    return ys[idx], x0s[idx], np.maximum.reduceat(x1s, idx)
+
+
+def _vertical_edges(xs, ys) -> Tuple[IntArray, IntArray, IntArray]:
+    """x 相同、y 连续的单位竖边合成一条：返回 (x, y_top, y_bottom)"""
+    order = np.lexsort((ys, xs))
+    xs, ys = xs[order], ys[order]
+    brk = np.ones(xs.size, dtype=bool)
+    brk[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1] + 1)
+    starts = np.flatnonzero(brk)
+    ends = np.append(starts[1:], xs.size) - 1
+    return xs[starts], ys[starts], ys[ends] + 1
+
+
+def _horizontal_edges(ys, x0s, x1s):
+    """
+    第 L 条水平网格线（第 L-1 行和第 L 行之间）上的边：
+    只有下面一行盖住 → 上边界（向右走），只有上面一行盖住 → 下边界（向左走）。
+    返回 (line, xa, xb, is_top)，区间 [xa, xb]
+    """
+    # 事件：(线号, x, 上面一行覆盖变化, 下面一行覆盖变化)
+    line = np.concatenate([ys + 1, ys + 1, ys, ys])
+    xs = np.concatenate([x0s, x1s + 1, x0s, x1s + 1])
+    n = ys.size
+    d_above = np.concatenate([np.ones(n), -np.ones(n), np.zeros(2 * n)])
+    d_below = np.concatenate([np.zeros(2 * n), np.ones(n), -np.ones(n)])
+    span = int(xs.max() - xs.min()) + 2
+    keys, inv = np.unique((line - line.min()) * span + (xs - xs.min()), return_inverse=True)
+    above = np.cumsum(np.bincount(inv, weights=d_above)) > 0.5
+    below = np.cumsum(np.bincount(inv, weights=d_below)) > 0.5
+    k_line = keys // span + line.min()
+    k_x = keys % span + xs.min()
+    # 第 i 个区间是 [k_x[i], k_x[i+1])，要求在同一条线上
+    same = k_line[:-1] == k_line[1:]
+    top = same & below[:-1] & ~above[:-1]
+    bottom = same & above[:-1] & ~below[:-1]
+    edge = top | bottom
+    return k_line[:-1][edge], k_x[:-1][edge], k_x[1:][edge], top[edge]
+
+
+def trace_span_contours(ys, x0s, x1s) -> List[np.ndarray]:
+    """
+    把一组行程描成闭合轮廓多边形（像素角点坐标，int32 的 (K, 2) 数组列表）。
+    外轮廓和洞的走向相反；两块只在对角点相接时那个点会出现两次，不影响奇偶填充。
+    顶点只留拐角，存储量和周长成正比，和面积无关。
+    """
+    ys, x0s, x1s = normalize_spans(ys, x0s, x1s)
+    if ys.size == 0:
+        return []
+
+    # 竖边：行程左端向上走，右端向下走
+    lx, lt, lb = _vertical_edges(x0s, ys)
+    rx, rt, rb = _vertical_edges(x1s + 1, ys)
+    # 横边：上边界向右，下边界向左
+    hl, ha, hb, top = _horizontal_edges(ys, x0s, x1s)
+
+    sx = np.concatenate([lx, rx, np.where(top, ha, hb)])
+    sy = np.concatenate([lb, rt, hl])
+    ex = np.concatenate([lx, rx, np.where(top, hb, ha)])
+    ey = np.concatenate([lt, rb, hl])
+
+    # 每条边接到“从它终点出发”的边上。每个角点出边数 == 入边数，
+    # 按点排好序后一一配对就是一个置换，置换的每个环就是一条轮廓
+    x_min, y_min = int(min(sx.min(), ex.min())), int(min(sy.min(), ey.min()))
+    span = int(max(sx.max(), ex.max())) - x_min + 1
+    s_key = (sy - y_min) * span + (sx - x_min)
+    e_key = (ey - y_min) * span + (ex - x_min)
+    out_order = np.argsort(s_key, kind="stable")
+    in_order = np.argsort(e_key, kind="stable")
+    nxt = np.empty(sx.size, dtype=np.int64)
+    nxt[in_order] = out_order
+
+    nxt_l = nxt.tolist()
+    seen = bytearray(sx.size)
+    loops: List[np.ndarray] = []
+    for s in range(sx.size):
+        if seen[s]:
+            continue
+        cyc = []
+        i = s
+        while not seen[i]:
+            seen[i] = 1
+            cyc.append(i)
+            i = nxt_l[i]
+        loops.append(np.stack([sx[cyc], sy[cyc]], axis=1).astype(np.int32))
+    return loops
+
+
+def scanline_fill(polygons) -> Tuple[IntArray, IntArray, IntArray]:
+    """
+    奇偶规则的扫描线多边形填充，返回行程 (ys, x0s, x1s)，按 (y, x0) 排序。
+
+    就是有序边表 / 活性边表那一套，只不过整批一起算：
+    每条非水平边和它跨过的每条扫描线（像素中心 y+0.5，下闭上开）求一次交点，
+    按 (y, x) 排序后每行两两配对，[xa, xb) 里中心落进去的像素就是一段。
+    polygons: 若干 (K, 2) 的顶点数组（可以是小数），每个都自动闭合。
+    """
+    starts, ends = [], []
+    for poly in polygons:
+        v = np.asarray(poly, dtype=np.float64).reshape(-1, 2)
+        if len(v) < 2:
+            continue
+        starts.append(v)
+        ends.append(np.roll(v, -1, axis=0))
+    if not starts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.copy(), empty.copy()
+    p = np.concatenate(starts)
+    q = np.concatenate(ends)
+    keep = p[:, 1] != q[:, 1]
+    p, q = p[keep], q[keep]
+
+    y_lo = np.minimum(p[:, 1], q[:, 1])
+    y_hi = np.maximum(p[:, 1], q[:, 1])
+    # 边覆盖的扫描线：y_lo <= y + 0.5 < y_hi
+    first = np.ceil(y_lo - 0.5).astype(np.int64)
+    last = np.ceil(y_hi - 0.5).astype(np.int64) - 1
+    counts = np.maximum(last - first + 1, 0)
+    edge = np.repeat(np.arange(p.shape[0]), counts)
+    offs = np.arange(edge.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    row = first[edge] + offs
+    t = (row + 0.5 - p[edge, 1]) / (q[edge, 1] - p[edge, 1])
+    x = p[edge, 0] + t * (q[edge, 0] - p[edge, 0])
+
+    order = np.lexsort((x, row))
+    row, x = row[order], x[order]
+    # 闭合多边形每条扫描线上的交点一定是偶数个，整体两两配对不会跨行
+    ys = row[0::2]
+    x0s = np.ceil(x[0::2] - 0.5).astype(np.int64)
+    x1s = np.ceil(x[1::2] - 0.5).astype(np.int64) - 1
+    ok = x0s <= x1s
+    return ys[ok], x0s[ok], x1s[ok]
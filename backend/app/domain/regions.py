@@ -0,0 +1,281 @@
+# backend/app/domain/regions.py
+"""
+油漆桶的连通区域标号索引。
+
+用户经常在同一幅画上连点好几次油漆桶，每次都从头做一遍扫描线泛洪很浪费。
+这里给帧缓冲维护一张“连通块标号图”，填充就变成：查种子所在块的标号 → 取出这个块的所有行程。
+
+结构（都按行存，改动时只作废脏行）：
+- 每行的行程 runs[y] = (x0s, x1s, keys)
+    * tol == 0：整行按颜色切段，key 是打包成 uint32 的 RGBA，同色才连通
+    * tol > 0 ：先按“和 target 差 <= tol”做掩码再切段，key 全 0
+      （容差是相对种子颜色算的，不传递，所以这种索引要按 target 分开建）
+- 每对相邻行之间的连边 edges[y] = (上一行的局部下标, 下一行的局部下标)
+    4 邻接：x 区间重叠；8 邻接：区间放宽 1 像素
+- 标号：所有行程 + 所有连边上做一次向量化的并查集（挂接 + 指针跳跃），
+  只在有脏行时重算
+
+帧缓冲每重画一个矩形，就通知索引把对应的行（和上下相邻的连边）作废。
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .fill import _col_equal, color_match_mask, mask_runs
+from .points import PointBuffer
+
+# 同时保留多少种 (tol, connectivity, target) 的索引
+MAX_REGION_INDEXES = 8
+
+
+def _packed(rgba: np.ndarray) -> np.ndarray:
+    """H×W×4 uint8 → H×W uint32，一个像素一个数，方便整行比较颜色"""
+    return np.ascontiguousarray(rgba).view(np.uint32)[..., 0]
+
+
+def _color_runs(band: np.ndarray):
+    """
+    打包颜色（uint32）的一段连续行，按“同色连续”切成行程（向量化）。
+    返回 (行号, x0, x1, 颜色)，行号是 band 内的相对行号，按 (行, x0) 排序。
+    """
+    h, w = band.shape
+    # 按颜色切：每行第 0 列，以及和左边颜色不同的位置都是段首
+    starts = np.ones((h, w), dtype=bool)
+    starts[:, 1:] = band[:, 1:] != band[:, :-1]
+    ys, x0s = np.nonzero(starts)
+    # 段尾 = 同一行下一段段首 - 1，行末段到 w - 1
+    x1s = np.empty_like(x0s)
+    x1s[:-1] = x0s[1:] - 1
+    if x1s.size:
+        x1s[-1] = w - 1
+        row_end = np.ones(ys.size, dtype=bool)
+        row_end[:-1] = ys[1:] != ys[:-1]
+        x1s[row_end] = w - 1
+    return ys, x0s, x1s, band[ys, x0s]
+
+
+def _pair_edges(ys, x0s, x1s, keys, e: int, width: int):
+    """
+    行程按 (y, x0) 排好序时，找出所有 “y 行的 i 和 y+1 行的 j 相连” 的 (i, j)。
+    全程 searchsorted + repeat，没有 Python 循环。
+    """
+    n = ys.size
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    wp = width + 4
+    y64 = ys.astype(np.int64)
+    k0 = y64 * wp + x0s + 2
+    k1 = y64 * wp + x1s + 2
+    lo = np.searchsorted(k1, (y64 + 1) * wp + x0s - e + 2, side="left")
+    hi = np.searchsorted(k0, (y64 + 1) * wp + x1s + e + 2, side="right")
+    cnt = np.maximum(hi - lo, 0)
+    u = np.repeat(np.arange(n), cnt)
+    first = np.cumsum(cnt) - cnt
+    v = np.repeat(lo, cnt) + (np.arange(u.size) - np.repeat(first, cnt))
+    keep = keys[u] == keys[v]
+    return u[keep], v[keep]
+
+
+def label_components(n: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    n 个节点、若干无向边 (u, v) 的连通分量标号（向量化并查集）。
+    每轮：把每条边两端的根里较大的挂到较小的上（挂接），再指针跳跃压缩到根，
+    一般 O(log n) 轮收敛。返回每个节点的根（同一分量根相同）。
+    """
+    parent = np.arange(n, dtype=np.int64)
+    while u.size:
+        pu, pv = parent[u], parent[v]
+        differ = pu != pv
+        if not differ.any():
+            break
+        u, v = u[differ], v[differ]
+        pu, pv = pu[differ], pv[differ]
+        np.minimum.at(parent, np.maximum(pu, pv), np.minimum(pu, pv))
+        while True:
+            pp = parent[parent]
+            if np.array_equal(pp, parent):
+                break
+            parent = pp
+    return parent
+
+
+class RegionIndex:
+    """一种 (tol, connectivity, target) 设置下的连通块索引"""
+
+    def __init__(self, width: int, height: int, tol: int = 0, connectivity: int = 4,
+                 target: Optional[Tuple[int, int, int, int]] = None):
+        self.width = int(width)
+        self.height = int(height)
+        self.tol = int(tol)
+        self.connectivity = 8 if connectivity == 8 else 4
+        self.target = target
+        # 每行的行程；None 表示脏了要重算
+        self._runs: List[Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = [None] * self.height
+        # edges[y]：y 行和 y+1 行之间的连边（两边各自的行内下标）
+        self._edges: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * max(0, self.height - 1)
+        # 拼好的全局数组 + 标号，脏了就置 None
+        self._flat = None
+        self.rebuilt_rows = 0
+        self.relabels = 0
+
+    # ----------------------
+    # 作废
+    # ----------------------
+    def invalidate_rows(self, y0: int, y1: int) -> None:
+        y0, y1 = max(0, y0), min(self.height - 1, y1)
+        if y0 > y1:
+            return
+        for y in range(y0, y1 + 1):
+            self._runs[y] = None
+        for y in range(max(0, y0 - 1), min(len(self._edges), y1 + 1)):
+            self._edges[y] = None
+        self._flat = None
+
+    # ----------------------
+    # 重建
+    # ----------------------
+    def _band_runs(self, rgba: np.ndarray, y0: int, y1: int):
+        """y0..y1 行的行程：tol == 0 按颜色切，tol > 0 按和 target 的容差掩码切"""
+        band = rgba[y0:y1 + 1]
+        if self.tol <= 0:
+            return _color_runs(_packed(band))
+        ys, x0s, x1s = mask_runs(color_match_mask(band, self.target, self.tol))
+        return ys, x0s, x1s, np.zeros(ys.size, dtype=np.uint32)
+
+    @staticmethod
+    def _dirty_bands(flags: List[bool]) -> List[Tuple[int, int]]:
+        """把连续的脏行合成若干段 [a, b]"""
+        bands, start = [], None
+        for y, dirty in enumerate(flags):
+            if dirty and start is None:
+                start = y
+            elif not dirty and start is not None:
+                bands.append((start, y - 1))
+                start = None
+        if start is not None:
+            bands.append((start, len(flags) - 1))
+        return bands
+
+    def _refresh(self, rgba: np.ndarray) -> None:
+        # 1) 脏行的行程，按连续段一起算
+        for a, b in self._dirty_bands([r is None for r in self._runs]):
+            ys, x0s, x1s, keys = self._band_runs(rgba, a, b)
+            bounds = np.searchsorted(ys, np.arange(b - a + 2))
+            for k in range(b - a + 1):
+                s, t = bounds[k], bounds[k + 1]
+                self._runs[a + k] = (x0s[s:t], x1s[s:t], keys[s:t])
+            self.rebuilt_rows += b - a + 1
+
+        # 2) 脏的相邻行连边，同样按段一起算（段 [a, b] 需要 a..b+1 行的行程）
+        e = 1 if self.connectivity == 8 else 0
+        for a, b in self._dirty_bands([r is None for r in self._edges]):
+            rows = range(a, b + 2)
+            counts = [self._runs[y][0].size for y in rows]
+            ys = np.repeat(np.arange(len(counts)), counts)
+            x0s = np.concatenate([self._runs[y][0] for y in rows])
+            x1s = np.concatenate([self._runs[y][1] for y in rows])
+            keys = np.concatenate([self._runs[y][2] for y in rows])
+            u, v = _pair_edges(ys, x0s, x1s, keys, e, self.width)
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            # 每条边按上端所在行分组（u 本来就按行有序）
+            uy = ys[u]
+            bounds = np.searchsorted(uy, np.arange(b - a + 2))
+            for k in range(b - a + 1):
+                s, t = bounds[k], bounds[k + 1]
+                self._edges[a + k] = (u[s:t] - offsets[k], v[s:t] - offsets[k + 1])
+
+        # 3) 拼成全局数组，重新标号
+        counts = np.array([r[0].size for r in self._runs], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        ys = np.repeat(np.arange(self.height, dtype=np.int32), counts)
+        x0s = np.concatenate([r[0] for r in self._runs]) if self.height else np.empty(0, np.int64)
+        x1s = np.concatenate([r[1] for r in self._runs]) if self.height else np.empty(0, np.int64)
+        us = [eu + offsets[y] for y, (eu, _) in enumerate(self._edges)]
+        vs = [ev + offsets[y + 1] for y, (_, ev) in enumerate(self._edges)]
+        u = np.concatenate(us) if us else np.empty(0, np.int64)
+        v = np.concatenate(vs) if vs else np.empty(0, np.int64)
+        labels = label_components(int(offsets[-1]), u, v)
+        self._flat = (offsets, ys, x0s, x1s, labels)
+        self.relabels += 1
+
+    # ----------------------
+    # 查询
+    # ----------------------
+    def region(self, rgba: np.ndarray, x: int, y: int):
+        """
+        (x, y) 所在连通块的全部行程 (ys, x0s, x1s)；
+        tol > 0 时 (x, y) 本身不在掩码里返回 None
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        if self._flat is None:
+            self._refresh(rgba)
+        offsets, ys, x0s, x1s, labels = self._flat
+        s, t = offsets[y], offsets[y + 1]
+        k = s + int(np.searchsorted(x1s[s:t], x))
+        if k >= t or x0s[k] > x:
+            return None
+        sel = labels == labels[k]
+        return ys[sel], x0s[sel], x1s[sel]
+
+    def stats(self) -> dict:
+        return {
+            "tol": self.tol,
+            "connectivity": self.connectivity,
+            "target": list(self.target) if self.target is not None else None,
+            "rebuilt_rows": self.rebuilt_rows,
+            "relabels": self.relabels,
+        }
+
+
+class RegionLabels:
+    """
+    按 (tol, connectivity[, target]) 分别维护的 RegionIndex（LRU），挂在一个帧缓冲上。
+    """
+
+    def __init__(self, framebuffer, max_indexes: int = MAX_REGION_INDEXES):
+        self.fb = framebuffer
+        self._indexes: "OrderedDict[tuple, RegionIndex]" = OrderedDict()
+        self._max = max(1, int(max_indexes))
+        framebuffer.add_repaint_listener(self._on_repaint)
+
+    def _on_repaint(self, rect) -> None:
+        for idx in self._indexes.values():
+            idx.invalidate_rows(rect[1], rect[3])
+
+    def _index(self, tol: int, connectivity: int, target) -> RegionIndex:
+        # tol == 0 时同色即连通，和 target 无关，所有颜色共用一张
+        key = (tol, connectivity) if tol <= 0 else (tol, connectivity, target)
+        idx = self._indexes.get(key)
+        if idx is None:
+            idx = self._indexes[key] = RegionIndex(
+                self.fb.width, self.fb.height, tol, connectivity,
+                None if tol <= 0 else target,
+            )
+            while len(self._indexes) > self._max:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(key)
+        return idx
+
+    def flood(self, seed_x: int, seed_y: int, new_color, shape_id: str,
+              pen_w: int = 1, connectivity: int = 4, tol: int = 0) -> PointBuffer:
+        """
+        和 fill.flood_fill_rgba 语义一样的泛洪，但走标号索引：
+        查种子所在块 → 直接拿这个块的行程。
+        """
+        rgba = self.fb.rgba
+        if not (0 <= seed_x < self.fb.width and 0 <= seed_y < self.fb.height):
+            return PointBuffer.empty()
+        target = tuple(int(v) for v in rgba[seed_y, seed_x])
+        if _col_equal(target, tuple(new_color), tol):
+            return PointBuffer.empty()
+        found = self._index(int(tol), 8 if connectivity == 8 else 4, target).region(rgba, seed_x, seed_y)
+        if found is None:
+            return PointBuffer.empty()
+        ys, x0s, x1s = found
+        return PointBuffer.from_spans(ys, x0s, x1s, shape_id, new_color, pen_w)
+
+    def stats(self) -> List[Dict]:
+        return [idx.stats() for idx in self._indexes.values()]
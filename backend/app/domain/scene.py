@@ -1,33 +1,212 @@
 # backend/app/domain/scene.py
 
-from typing import List, Dict, Optional
+from typing import Deque, List, Dict, Optional, Tuple
+from collections import OrderedDict, deque
 import copy
+import numpy as np
 from .shapes import Shape, Polygon
 from .geom import clip_polygon_rect  # <--- 新的
 from .shapes import Shape  # 假设你的 Line / Rectangle / Circle / Bezier / Polygon 都继承了 Shape
 from .shapes import Line, Rectangle, Circle, Bezier, Polygon
 from .geom import Mat2x3, clip_polygon_rect   # clip_polygon_rect 就是你原来用的那个
-
-Point = Dict[str, int]
+from .history import Command, Op, AddOp, RemoveOp, TransformOp, ReplaceOp, HistoryPolicy
+from .points import PointBuffer
+from .spatial import SpatialGrid, bbox_contains, bbox_distance, bbox_intersects
+
+# 光栅缓存默认最多保留多少个 shape 的结果
+DEFAULT_RASTER_CACHE_SIZE = 4096
+# 变更日志最多留多少条；客户端落后得比这还多就只能整场景重发
+DEFAULT_CHANGE_LOG_SIZE = 4096
+
+
+def _integer_shift(before: Mat2x3, after: Mat2x3) -> Optional[Tuple[int, int]]:
+    """
+    after 是不是 before 再加一个整数像素平移：线性部分完全一样、平移差是整数时返回 (dx, dy)，否则 None。
+    （平移是左乘上去的，线性部分乘 1 加 0 不会有舍入误差；平移差允许一点浮点误差）
+    """
+    if (before.a, before.b, before.c, before.d) != (after.a, after.b, after.c, after.d):
+        return None
+    dx = after.tx - before.tx
+    dy = after.ty - before.ty
+    rx, ry = round(dx), round(dy)
+    if abs(dx - rx) > 1e-9 or abs(dy - ry) > 1e-9:
+        return None
+    return int(rx), int(ry)
 
 
 class Scene:
-    def __init__(self):
+    def __init__(self, raster_cache_size: int = DEFAULT_RASTER_CACHE_SIZE,
+                 history_policy: Optional[HistoryPolicy] = None,
+                 change_log_size: int = DEFAULT_CHANGE_LOG_SIZE):
         # 场景里的所有对象
         # 这里我改成 dict[str, Shape] 更稳：通过 id 直接索引，不用每次 for s in _shapes 找
         self._shapes: Dict[str, Shape] = {}
 
-        # 撤销 / 重做栈。我们直接存快照（_shapes 的深拷贝）。
-        self._undo: List[Dict[str, Shape]] = []
-        self._redo: List[Dict[str, Shape]] = []
-        self._batch_active: bool = False  # 是否处于一次连续操作中
+        # 撤销 / 重做栈：存的是命令日志（只记改动），不再是整场景快照
+        self._undo: List[Command] = []
+        self._redo: List[Command] = []
+        # 连续操作（比如拖拽）期间正在累积的命令；None 表示不在 batch 里
+        self._batch: Optional[Command] = None
+        # 历史上限，以及 undo + redo 两个栈当前的估算字节数
+        self._history_policy: HistoryPolicy = history_policy or HistoryPolicy()
+        self._history_bytes: int = 0
+
+        # 每个 shape 的光栅缓存：key -> (shape 对象, 光栅时的 version, geom_version, transform, 像素点)
+        # 只有对象被替换或 version 变了才重新 rasterize；按 LRU 限制条数。
+        # 几何没变、transform 只差一个整数平移时，直接把旧像素整体挪过去（见 _rasterize_cached）
+        self._raster_cache: "OrderedDict[str, Tuple[Shape, int, int, Mat2x3, PointBuffer]]" = OrderedDict()
+        self._raster_cache_size: int = max(1, int(raster_cache_size))
+        self._cache_hits: int = 0
+        self._cache_misses: int = 0
+        self._cache_shifts: int = 0
+
+        # 世界坐标包围盒的空间索引（均匀网格），跟着 _put_shape / _drop_shape / _set_transform 走
+        self._index = SpatialGrid()
+        # 每个 shape 的绘制顺序号，查询结果按它排序（插回中间时整体重排一次）
+        self._rank: Dict[str, int] = {}
+        self._next_rank: int = 0
+
+        # 场景版本：每次有 shape 加入 / 删除 / 改动就 +1
+        # 变更日志记 (版本, "added" | "removed" | "replaced", id)，推增量用；版本号在日志里是连续的
+        self._version: int = 0
+        self._changes: Deque[Tuple[int, str, str]] = deque(maxlen=max(1, int(change_log_size)))
 
     # ----------------------
-    # 内部：拍快照给 undo
+    # 内部：所有对 _shapes 的改动都走这里（history 里的 op 也调用它们）
     # ----------------------
-    def _snapshot_for_undo(self):
-        # 注意：要 deepcopy 整个 dict，不然引用会串
-        self._undo.append(copy.deepcopy(self._shapes))
+    def _put_shape(self, sid: str, shape: Shape, index: Optional[int] = None):
+        """
+        放入 / 替换一个 shape。
+        已存在的 id 原位替换；给了 index 就插回原来的位置（撤销删除时保持绘制顺序）。
+        """
+        self._reindex(sid, shape)
+        self._note_change("replaced" if sid in self._shapes else "added", sid)
+        if sid in self._shapes or index is None or index >= len(self._shapes):
+            if sid not in self._shapes:
+                self._rank[sid] = self._next_rank
+                self._next_rank += 1
+            self._shapes[sid] = shape
+            return
+        items = list(self._shapes.items())
+        items.insert(index, (sid, shape))
+        self._shapes = dict(items)
+        self._rank = {k: i for i, k in enumerate(self._shapes)}
+        self._next_rank = len(self._rank)
+
+    def _drop_shape(self, sid: str):
+        # 光栅缓存不急着删：撤销时同一个对象放回来还能直接命中，LRU 会兜底
+        if self._shapes.pop(sid, None) is not None:
+            self._note_change("removed", sid)
+        self._rank.pop(sid, None)
+        self._index.remove(sid)
+
+    def _set_transform(self, sid: str, m: Mat2x3):
+        shp = self._shapes.get(sid)
+        if shp is None:
+            return
+        shp.transform = m
+        shp.touch(geometry=False)
+        self._changed(sid, shp)
+
+    def _reindex(self, sid: str, shape: Shape):
+        """几何 / transform 变了之后更新空间索引里的包围盒"""
+        self._index.insert(sid, shape.bounds())
+
+    def _changed(self, sid: str, shape: Shape):
+        """原地改了某个 shape（变换）：更新索引，记一条变更"""
+        self._reindex(sid, shape)
+        self._note_change("replaced", sid)
+
+    def _note_change(self, kind: str, sid: str):
+        self._version += 1
+        self._changes.append((self._version, kind, sid))
+
+    def _record(self, op: Op):
+        """
+        记一条可撤销操作：batch 中就并进当前命令，否则自成一个命令。
+        有新操作时 redo 栈作废。
+        """
+        self._clear_redo()
+        if self._batch is not None:
+            self._batch.record(op)
+        else:
+            self._push_undo(Command([op]))
+
+    def _replace_shape(self, sid: str, new_shape: Shape):
+        """用新对象整体替换某个 shape（裁剪用），可撤销"""
+        self._record(ReplaceOp(sid, self._shapes[sid], new_shape))
+        self._put_shape(sid, new_shape)
+
+    # ----------------------
+    # 内部：历史预算
+    # ----------------------
+    def _push_undo(self, cmd: Command):
+        self._history_bytes += cmd.measure()
+        self._undo.append(cmd)
+        self._enforce_history_policy()
+
+    def _clear_redo(self):
+        if self._redo:
+            self._history_bytes -= sum(cmd.nbytes for cmd in self._redo)
+            self._redo.clear()
+
+    def _over_budget(self, dropped: int = 0) -> bool:
+        p = self._history_policy
+        return len(self._undo) - dropped > p.max_entries or self._history_bytes > p.max_bytes
+
+    def _enforce_history_policy(self):
+        """
+        超出上限时：先把较老的、连续作用在同一批 shape 上的纯变换合成一条，
+        还超就从最老的一条开始丢（丢掉的只是“能撤销 / 重做到多远”，不影响当前场景）。
+        """
+        if not self._over_budget():
+            return
+        self._compact_history()
+        drop = 0
+        while drop < len(self._undo) and self._over_budget(drop):
+            self._history_bytes -= self._undo[drop].nbytes
+            drop += 1
+        if drop:
+            del self._undo[:drop]
+        # 撤销栈都丢光了还超（刚连续撤销过一大段），就从 redo 最远的那头丢
+        drop = 0
+        while drop < len(self._redo) and self._history_bytes > self._history_policy.max_bytes:
+            self._history_bytes -= self._redo[drop].nbytes
+            drop += 1
+        if drop:
+            del self._redo[:drop]
+
+    def _compact_history(self):
+        keep = max(0, self._history_policy.keep_recent)
+        cut = max(0, len(self._undo) - keep)
+        if cut < 2:
+            return
+        old, recent = self._undo[:cut], self._undo[cut:]
+        compacted: List[Command] = [old[0]]
+        for cmd in old[1:]:
+            merged = compacted[-1].merge_transforms(cmd)
+            if merged is not None:
+                self._history_bytes += merged.nbytes - compacted[-1].nbytes - cmd.nbytes
+                compacted[-1] = merged
+            else:
+                compacted.append(cmd)
+        self._undo = compacted + recent
+
+    def set_history_policy(self, policy: HistoryPolicy):
+        """运行时调整历史上限，立即按新上限收缩"""
+        self._history_policy = policy
+        self._enforce_history_policy()
+
+    def history_stats(self) -> dict:
+        """撤销历史当前的条数和估算占用，方便给实例定内存规格"""
+        p = self._history_policy
+        return {
+            "undo_entries": len(self._undo),
+            "redo_entries": len(self._redo),
+            "bytes": self._history_bytes,
+            "max_entries": p.max_entries,
+            "max_bytes": p.max_bytes,
+        }
 
     # ----------------------
     # 公共：场景管理
@@ -36,10 +215,15 @@ class Scene:
         """
         往场景里放一个新的 shape。
         返回它的 id，方便前端保存。
+        先光栅化一次（结果直接进光栅缓存，反正马上要用）：光栅化失败就抛出去，
+        场景里不会留下一个之后每次 flatten 都炸的 shape
         """
-        self._snapshot_for_undo()
-        self._shapes[shape.id] = shape
-        self._redo.clear()
+        self._rasterize_cached(shape.id, shape)
+        if shape.id in self._shapes:
+            self._replace_shape(shape.id, shape)
+            return shape.id
+        self._record(AddOp(shape.id, shape))
+        self._put_shape(shape.id, shape)
         return shape.id
 
     def remove(self, shape_id: str) -> bool:
@@ -48,20 +232,28 @@ class Scene:
         """
         if shape_id not in self._shapes:
             return False
-        self._snapshot_for_undo()
-        del self._shapes[shape_id]
-        self._redo.clear()
+        index = list(self._shapes).index(shape_id)
+        self._record(RemoveOp(shape_id, self._shapes[shape_id], index))
+        self._drop_shape(shape_id)
         return True
 
     def clear(self):
         """
         清空场景。
+        整个清空算一次操作；从后往前删，撤销时就是从前往后依次追加，不用挪位置。
         """
         if not self._shapes:
             return
-        self._snapshot_for_undo()
-        self._shapes.clear()
-        self._redo.clear()
+        ids = list(self._shapes)
+        own_batch = self._batch is None
+        if own_batch:
+            self.begin_batch()
+        for index in range(len(ids) - 1, -1, -1):
+            sid = ids[index]
+            self._record(RemoveOp(sid, self._shapes[sid], index))
+            self._drop_shape(sid)
+        if own_batch:
+            self.end_batch()
 
     def get_shape(self, shape_id: str) -> Optional[Shape]:
         """
@@ -73,34 +265,225 @@ class Scene:
     # 撤销 / 重做
     # ----------------------
     def undo(self):
+        # 拖拽还没结束就撤销：先把已经累积的那段收尾
+        if self._batch is not None:
+            self.end_batch()
         if not self._undo:
             return
-        # 当前状态推到 redo 栈
-        self._redo.append(copy.deepcopy(self._shapes))
-        # 取出上一个状态作为当前
-        self._shapes = self._undo.pop()
+        cmd = self._undo.pop()
+        cmd.undo(self)
+        # 字节数在 undo / redo 两个栈之间挪动，总量不变
+        self._redo.append(cmd)
 
     def redo(self):
+        if self._batch is not None:
+            self.end_batch()
         if not self._redo:
             return
-        # 当前状态推回 undo 栈
-        self._undo.append(copy.deepcopy(self._shapes))
-        # 取出 redo 栈顶部为当前
-        self._shapes = self._redo.pop()
+        cmd = self._redo.pop()
+        cmd.redo(self)
+        self._undo.append(cmd)
 
     # ----------------------
     # 渲染（给前端画）
     # ----------------------
-    def flatten_points(self) -> List[Point]:
+    def flatten_points(self, viewport: Optional[Tuple[int, int, int, int]] = None) -> PointBuffer:
+        """
+        把场景里所有 shape 的像素点按绘制顺序拼成一个列式缓冲。
+        前端要的 [{x, y, color, id, w}, ...] 由 API 层在出口处 to_dicts()。
+
+        给了 viewport=(x0, y0, x1, y1)（闭区间）时只光栅化包围盒和它相交的 shape，
+        结果再裁到窗口里；画布外的图形既不算也不发。
+        """
+        if viewport is None:
+            return PointBuffer.concat(pts for _, _, pts in self.iter_rasters())
+        x0, y0, x1, y1 = viewport
+        pts = PointBuffer.concat(p for _, _, p in self.iter_rasters(self.shapes_in_rect(x0, y0, x1, y1)))
+        return pts.cropped(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+    def iter_points(self, viewport: Optional[Tuple[int, int, int, int]] = None):
+        """
+        按绘制顺序逐个 shape 给出 (sid, 像素)，流式输出用：一次只拿着一个 shape 的结果。
+        给了视口就只看包围盒和它相交的 shape，并裁到视口里；没有像素的跳过
+        """
+        if viewport is None:
+            sids = None
+        else:
+            x0, y0, x1, y1 = viewport
+            sids = self.shapes_in_rect(x0, y0, x1, y1)
+        for sid, _, pts in self.iter_rasters(sids):
+            if viewport is not None:
+                pts = pts.cropped(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+            if pts.x.size or pts.n_spans:
+                yield sid, pts
+
+    def iter_rasters(self, sids: Optional[List[str]] = None):
         """
-        把场景里所有 shape 的像素点合到一个数组里。
-        你的前端画布目前正是吃这种结构，所以这个接口我保持不变。
+        按绘制顺序逐个给出 (sid, shape, 光栅结果)，走光栅缓存。
+        sids 给了就只看这些（调用方保证已按绘制顺序排好）。
         """
-        pts: List[Point] = []
-        for s in self._shapes.values():
-            pts.extend(s.rasterize())
+        if sids is None:
+            items = list(self._shapes.items())
+        else:
+            items = [(sid, self._shapes[sid]) for sid in sids if sid in self._shapes]
+        for sid, s in items:
+            yield sid, s, self._rasterize_cached(sid, s)
+
+    def _rasterize_cached(self, sid: str, shp: Shape) -> PointBuffer:
+        """
+        取某个 shape 的光栅结果：对象没换、version 没变就直接用缓存；
+        几何没变、transform 只是多了个整数平移，就把缓存的散点 / 行程整体挪一下（不碰几何）；
+        否则重新 rasterize。结果都写回缓存（超出容量时踢掉最久没用的）。
+        返回的是缓存里的那份，调用方不要原地修改数组。
+        """
+        entry = self._raster_cache.get(sid)
+        if entry is not None and entry[0] is shp and entry[1] == shp.version:
+            self._raster_cache.move_to_end(sid)
+            self._cache_hits += 1
+            return entry[4]
+
+        shift = None
+        if entry is not None and entry[0] is shp and entry[2] == shp.geom_version:
+            shift = _integer_shift(entry[3], shp.transform)
+        if shift is not None:
+            self._cache_shifts += 1
+            pts = entry[4].shifted(*shift)
+        else:
+            self._cache_misses += 1
+            pts = shp.rasterize()
+        self._raster_cache[sid] = (shp, shp.version, shp.geom_version, shp.transform, pts)
+        self._raster_cache.move_to_end(sid)
+        while len(self._raster_cache) > self._raster_cache_size:
+            self._raster_cache.popitem(last=False)
         return pts
 
+    def raster_cache_stats(self) -> dict:
+        """光栅缓存的命中情况，方便压测时确认缓存在起作用"""
+        total = self._cache_hits + self._cache_misses + self._cache_shifts
+        return {
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "shifts": self._cache_shifts,
+            "hit_rate": (self._cache_hits / total) if total else 0.0,
+            "size": len(self._raster_cache),
+            "capacity": self._raster_cache_size,
+        }
+
+    # ----------------------
+    # 空间查询（只看包围盒，精确判断交给调用方）
+    # ----------------------
+    def _in_draw_order(self, sids) -> List[str]:
+        return sorted(sids, key=self._rank.__getitem__)
+
+    def shape_bounds(self, shape_id: str):
+        """某个 shape 当前的世界坐标包围盒 (x0, y0, x1, y1)，没有就是 None"""
+        return self._index.bbox(shape_id)
+
+    def shapes_at(self, x: float, y: float) -> List[str]:
+        """包围盒盖住 (x, y) 的 shape，按绘制顺序（最上面的在最后）"""
+        return self._in_draw_order(self._index.query_point(x, y))
+
+    def shapes_in_rect(self, x1: float, y1: float, x2: float, y2: float) -> List[str]:
+        """包围盒和矩形相交的 shape，按绘制顺序"""
+        x_min, x_max = sorted([x1, x2])
+        y_min, y_max = sorted([y1, y2])
+        return self._in_draw_order(self._index.query_rect((x_min, y_min, x_max, y_max)))
+
+    def nearest_shapes(self, x: float, y: float, k: int = 1,
+                       max_dist: Optional[float] = None) -> List[Tuple[float, str]]:
+        """包围盒离 (x, y) 最近的 k 个 shape：[(距离, id), ...]，由近到远"""
+        return self._index.nearest(x, y, k, max_dist)
+
+    def pick(self, x: float, y: float, threshold: float = 12.0) -> Optional[Tuple[str, float]]:
+        """
+        拾取：离 (x, y) 最近、且距离 <= threshold 的 shape，返回 (id, 距离)，没有就 None。
+        先用空间索引筛出包围盒离点不超过 threshold 的候选，再逐个算到几何的精确距离；
+        距离一样时取画在上面的（绘制顺序靠后的）。
+        """
+        t = max(0.0, float(threshold))
+        cand = self._index.query_rect((x - t, y - t, x + t, y + t))
+        # 包围盒距离是精确距离的下界：按 (下界, 越上面越先) 排序，
+        # 下界已经比当前最好的还大就不用再算了
+        order = sorted(((bbox_distance(self._index.bbox(sid), x, y), -self._rank[sid], sid) for sid in cand))
+        best: Optional[Tuple[str, float]] = None
+        for lower, _, sid in order:
+            if best is not None and lower > best[1]:
+                break
+            d = self._shapes[sid].distance(x, y)
+            if d <= t and (best is None or d < best[1]):
+                best = (sid, d)
+                if d == 0.0 and lower == 0.0:
+                    # 同一组里后面的都画在它下面，不会更好了
+                    break
+        return best
+
+    def spatial_index_stats(self) -> dict:
+        return self._index.stats()
+
+    # ----------------------
+    # 版本 / 变更日志（给增量推送用）
+    # ----------------------
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def draw_order(self) -> List[str]:
+        return list(self._shapes)
+
+    def changes_since(self, version: int) -> Optional[List[Tuple[int, str, str]]]:
+        """
+        version 之后的变更 [(版本, 类型, id), ...]，按发生顺序。
+        日志已经不够往回找（被挤掉了）时返回 None，调用方只能整场景重发。
+        """
+        if version >= self._version:
+            return []
+        if not self._changes or self._changes[0][0] > version + 1:
+            return None
+        start = max(0, version + 1 - self._changes[0][0])
+        return list(self._changes)[start:]
+
+    def delta_since(self, version: int) -> Optional[List[Tuple[str, str, Optional[int]]]]:
+        """
+        把 version 之后的变更按 shape 合并成客户端要做的操作：
+            [("removed", id, None), ..., ("replaced", id, None), ..., ("added", id, 绘制位置), ...]
+        先删、再原位替换、最后按绘制位置从前往后插，依次做完就和当前场景一致。
+        中间加了又删掉的 shape 不出现。返回 None 表示日志不够，要整场景重发。
+        """
+        changes = self.changes_since(version)
+        if changes is None:
+            return None
+        # 每个 shape 在这段里第一次出现时的类型决定它在 version 时存不存在
+        first: Dict[str, str] = {}
+        for _, kind, sid in changes:
+            first.setdefault(sid, kind)
+        removed, replaced, added = [], [], []
+        for sid, kind in first.items():
+            existed = kind != "added"
+            if sid in self._shapes:
+                (replaced if existed else added).append(sid)
+            elif existed:
+                removed.append(sid)
+        ops: List[Tuple[str, str, Optional[int]]] = [("removed", sid, None) for sid in removed]
+        ops += [("replaced", sid, None) for sid in replaced]
+        if added:
+            pos = {sid: i for i, sid in enumerate(self._shapes)}
+            ops += [("added", sid, pos[sid]) for sid in sorted(added, key=pos.__getitem__)]
+        return ops
+
+    def shape_points(self, sid: str, viewport: Optional[Tuple[int, int, int, int]] = None) -> PointBuffer:
+        """
+        单个 shape 的光栅（走缓存）；给了视口就裁到视口里，包围盒不沾视口的直接返回空的不光栅化
+        """
+        shp = self._shapes.get(sid)
+        if shp is None:
+            return PointBuffer.empty()
+        if viewport is None:
+            return self._rasterize_cached(sid, shp)
+        b = self._index.bbox(sid)
+        if b is None or not bbox_intersects(b, viewport):
+            return PointBuffer.empty()
+        return self._rasterize_cached(sid, shp).cropped(*viewport)
+
     # ----------------------
     # 变换接口（核心升级）
     # ----------------------
@@ -112,22 +495,23 @@ class Scene:
         if shp is None:
             return False
 
-        # 只有当不在 batch 状态时，才自动 snapshot。
-        # 在拖拽批次中，begin_batch() 会提前拍一次。
-        if not self._batch_active:
-            self._snapshot_for_undo()
-            self._redo.clear()
-
-        # 真正改坐标
+        # 真正改坐标。batch（拖拽）中的多次平移会被并成同一条撤销记录。
         if hasattr(shp, "translate"):
+            before = shp.transform
             shp.translate(dx, dy)
+            self._record(TransformOp(sid, before, shp.transform))
+            self._changed(sid, shp)
         else:
-            # fallback：直接改它的坐标属性
+            # fallback：直接改它的坐标属性；这种情况只能存一份改之前的拷贝
+            old = copy.deepcopy(shp)
             for attr in dir(shp):
                 if attr.startswith("x") and isinstance(getattr(shp, attr), (int, float)):
                     setattr(shp, attr, getattr(shp, attr) + dx)
                 elif attr.startswith("y") and isinstance(getattr(shp, attr), (int, float)):
                     setattr(shp, attr, getattr(shp, attr) + dy)
+            shp.touch()
+            self._record(ReplaceOp(sid, old, shp))
+            self._changed(sid, shp)
 
         return True
 
@@ -141,12 +525,11 @@ class Scene:
         if theta_rad == 0:
             return False
 
-        self._snapshot_for_undo()
-
         shp = self._shapes[shape_id]
+        before = shp.transform
         shp.rotate(theta_rad, cx, cy)
-
-        self._redo.clear()
+        self._record(TransformOp(shape_id, before, shp.transform))
+        self._changed(shape_id, shp)
         return True
 
     def scale_shape(self, shape_id: str, sx: float, sy: float, cx: float, cy: float) -> bool:
@@ -161,12 +544,11 @@ class Scene:
         if sx == 1 and sy == 1:
             return False
 
-        self._snapshot_for_undo()
-
         shp = self._shapes[shape_id]
+        before = shp.transform
         shp.scale(sx, sy, cx, cy)
-
-        self._redo.clear()
+        self._record(TransformOp(shape_id, before, shp.transform))
+        self._changed(shape_id, shp)
         return True
 
     # ----------------------
@@ -189,14 +571,17 @@ class Scene:
             for attr in dir(shp):
                 if attr.startswith("_"):
                     continue
-                if attr in ("color", "pen_width", "id", "transform",
+                if attr in ("color", "pen_width", "id", "transform", "version", "geom_version",
                             "translate", "rotate", "scale",
-                            "move", "rasterize"):
+                            "move", "rasterize", "touch"):
                     continue
                 val = getattr(shp, attr)
                 # 跳过可调用成员
                 if callable(val):
                     continue
+                # 填充的轮廓（FillBlob.contours）导出成 [[[x, y], ...], ...]
+                if isinstance(val, list) and val and isinstance(val[0], np.ndarray):
+                    val = [v.tolist() for v in val]
                 geometry_fields[attr] = val
 
             data["shapes"].append({
@@ -219,22 +604,26 @@ class Scene:
     def begin_batch(self):
         """
         标记：我要开始一连串的连续变换（比如拖拽）。
-        我们在这里拍一次快照，供整段操作撤销。
+        这期间的所有改动会合成一条撤销记录。
         """
-        if not self._batch_active:
-            self._snapshot_for_undo()
-            self._batch_active = True
-            # 清 redo，跟普通操作一致
-            self._redo.clear()
+        if self._batch is None:
+            self._batch = Command()
+
+    @property
+    def in_batch(self) -> bool:
+        return self._batch is not None
 
     def end_batch(self):
         """
         标记：这次连续变换结束了。
         之后的 translate/rotate/scale 又会开始新的一次操作。
+        没有实际改动的 batch（比如只点了一下没拖）不进撤销栈。
         """
-        self._batch_active = False
+        cmd, self._batch = self._batch, None
+        if cmd is not None and cmd.ops:
+            self._push_undo(cmd)
 
-    def translate_and_raster(self, sid: str, dx: float, dy: float) -> List[Point]:
+    def translate_and_raster(self, sid: str, dx: float, dy: float) -> PointBuffer:
         self.translate_shape(sid, dx, dy)
         return self.flatten_points()
 
@@ -263,13 +652,9 @@ class Scene:
         # 3. 真正裁剪
         clipped = clip_polygon_rect(world_pts, x_min, y_min, x_max, y_max)
 
-        # 4. 拍快照
-        self._snapshot_for_undo()
-
         if not clipped:
             # 全剪掉了，就删图形
-            del self._shapes[shape_id]
-            self._redo.clear()
+            self.remove(shape_id)
             return True
 
         # 5. 用裁好的点生成一个新的 polygon，注意我们让它回到“无变换”的状态
@@ -281,11 +666,11 @@ class Scene:
             dash_on=getattr(shp, "dash_on", 0),
             dash_off=getattr(shp, "dash_off", 0),
             closed=getattr(shp, "closed", True),
+            filled=getattr(shp, "filled", False),
         )
 
-        # 覆盖原来的
-        self._shapes[shape_id] = new_poly
-        self._redo.clear()
+        # 覆盖原来的（可撤销）
+        self._replace_shape(shape_id, new_poly)
         return True
 
     def clip_polygon_by_rect_and_raster(self, shape_id, x1, y1, x2, y2):
@@ -309,6 +694,16 @@ class Scene:
         x_min, x_max = sorted([x1, x2])
         y_min, y_max = sorted([y1, y2])
 
+        # 0) 先看空间索引里的包围盒：完全在框外直接删，完全在框里什么都不用裁
+        box = self._index.bbox(shape_id)
+        if box is not None:
+            window = (x_min, y_min, x_max, y_max)
+            if not bbox_intersects(box, window):
+                self.remove(shape_id)
+                return self.flatten_points()
+            if bbox_contains(window, box):
+                return self.flatten_points()
+
         # 1) 如果本来就是 Polygon，就用你原来的那条，别动
         if isinstance(shp, Polygon):
             self.clip_polygon_by_rect(shape_id, x1, y1, x2, y2)
@@ -345,22 +740,22 @@ class Scene:
                         break
                     if t < u2:
                         u2 = t
-            self._snapshot_for_undo()
             if not ok:
                 # 全剪没了
-                del self._shapes[shape_id]
-                self._redo.clear()
+                self.remove(shape_id)
                 return self.flatten_points()
 
             nx1 = X1 + u1 * dx
             ny1 = Y1 + u1 * dy
             nx2 = X1 + u2 * dx
             ny2 = Y1 + u2 * dy
-            # 写回去，清 transform
-            shp.transform = Mat2x3.identity()
-            shp.x1, shp.y1 = nx1, ny1
-            shp.x2, shp.y2 = nx2, ny2
-            self._redo.clear()
+            # 写到一个新对象上，清 transform；旧对象留给撤销
+            new_line = copy.deepcopy(shp)
+            new_line.transform = Mat2x3.identity()
+            new_line.x1, new_line.y1 = nx1, ny1
+            new_line.x2, new_line.y2 = nx2, ny2
+            new_line.touch()
+            self._replace_shape(shape_id, new_line)
             return self.flatten_points()
 
         # 3) Rectangle：转成4点多边形再裁
@@ -383,7 +778,6 @@ class Scene:
                 world.append({"x": X, "y": Y})
             # 用你原来的裁剪函数
             clipped = clip_polygon_rect(world, x_min, y_min, x_max, y_max)
-            self._snapshot_for_undo()
             # 覆盖成 Polygon
             poly = Polygon(
                 points=clipped,
@@ -393,18 +787,16 @@ class Scene:
                 dash_on=getattr(shp, "dash_on", 0),
                 dash_off=getattr(shp, "dash_off", 0),
                 closed=True,
+                filled=getattr(shp, "filled", False),
             )
             poly.id = shp.id
-            self._shapes[shape_id] = poly
-
-            self._redo.clear()
+            self._replace_shape(shape_id, poly)
             return self.flatten_points()
 
         if isinstance(shp, Circle):
             raw = shp.rasterize()
-            world = [{"x": p["x"], "y": p["y"]} for p in raw]
+            world = [{"x": x, "y": y} for x, y in zip(raw.x.tolist(), raw.y.tolist())]
             clipped = clip_polygon_rect(world, x_min, y_min, x_max, y_max)
-            self._snapshot_for_undo()
             poly = Polygon(
                 points=clipped,
                 color=shp.color,
@@ -413,18 +805,18 @@ class Scene:
                 dash_on=getattr(shp, "dash_on", 0),
                 dash_off=getattr(shp, "dash_off", 0),
                 closed=True,
+                filled=getattr(shp, "filled", False),
             )
             poly.id = shp.id
-            self._shapes[shape_id] = poly
-
-            self._redo.clear()
+            self._replace_shape(shape_id, poly)
             return self.flatten_points()
 
         # 5) Bézier / 曲线：用“折线裁剪”，只留下在窗口里的曲线，不闭合
         if isinstance(shp, Bezier):
             # 先拿到世界坐标下的采样点（是按顺序的）
-            samples = shp.rasterize()  # [{'x':..,'y':..}, ...] 世界坐标
-            if not samples or len(samples) < 2:
+            raw = shp.rasterize()  # PointBuffer，世界坐标
+            samples = [{"x": x, "y": y} for x, y in zip(raw.x.tolist(), raw.y.tolist())]
+            if len(samples) < 2:
                 return self.flatten_points()
 
             xmin, xmax = sorted([x1, x2])
@@ -460,8 +852,6 @@ class Scene:
                 ey = y1_ + u2 * dy
                 return {"x": sx, "y": sy}, {"x": ex, "y": ey}
 
-            self._snapshot_for_undo()
-
             out_pts = []
             last_end = None
 
@@ -483,8 +873,7 @@ class Scene:
 
             if not out_pts:
                 # 全在外面，删掉就好
-                del self._shapes[shape_id]
-                self._redo.clear()
+                self.remove(shape_id)
                 return self.flatten_points()
 
             # 只对 Bézier 这一支：用不闭合的 polygon
@@ -498,9 +887,7 @@ class Scene:
                 closed=False,  # 曲线保持不闭合
             )
             poly.id = shp.id
-            self._shapes[shape_id] = poly
-
-            self._redo.clear()
+            self._replace_shape(shape_id, poly)
             return self.flatten_points()
 
         # 其它类型：先不管，直接返回现状
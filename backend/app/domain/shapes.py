@@ -4,32 +4,118 @@ from dataclasses import dataclass, field
 from typing import List, Dict, Optional, Tuple
 import uuid
 
-from backend.app.domain.geom import Mat2x3
+import numpy as np
+
+from .geom import Mat2x3, point_polyline_distance, point_in_polygon
+from .points import PointBuffer
+from .raster import (bresenham_segments, rasterize_polyline, dash_mask,
+                     unique_first, ellipse_ring, ellipse_arc, bridge_gaps,
+                     flatten_bezier, eval_bspline, trace_span_contours,
+                     scanline_fill, ellipse_spans)
 
 Point = Dict[str, int]
 
 def bresenham(x1, y1, x2, y2) -> List[Point]:
-    x, y, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-    dx, dy = abs(x2 - x), abs(y2 - y)
-    sx, sy = (1 if x < x2 else -1), (1 if y < y2 else -1)
-    err = dx - dy
-    pts: List[Point] = []
-
-
-    while True:
-        pts.append({"x": x, "y": y})
-        if x == x2 and y == y2:
-            break
-        e2 = 2 * err
-        if e2 > -dy:
-            err -= dy
-            x += sx
-        if e2 < dx:
-            err += dx
-            y += sy
-    return pts
-
-def dash_filter(points: List[Point], on: int, off: int) -> List[Point]:
+    xs, ys = bresenham_segments(int(x1), int(y1), int(x2), int(y2))
+    return [{"x": x, "y": y} for x, y in zip(xs.tolist(), ys.tolist())]
+
+def _shape_pixels(shape: "Shape", xs, ys) -> PointBuffer:
+    """按 shape 的颜色 / id / 线宽把一串坐标包成 PointBuffer，再套上虚线"""
+    buf = PointBuffer.from_xy(xs, ys, shape.id, shape.color, shape.pen_width)
+    return dash_filter(buf, shape.dash_on, shape.dash_off)
+
+def _polyline_pixels(shape: "Shape", world_pts, closed: bool, dedup: bool) -> PointBuffer:
+    """
+    折线类图形的公共出口：整条折线一次光栅化 → 虚线 → （可选）去重。
+    world_pts: [(X, Y), ...] 世界坐标
+    """
+    xs, ys = rasterize_polyline(world_pts, closed=closed)
+    buf = _shape_pixels(shape, xs, ys)
+    if dedup:
+        buf = buf.take(unique_first(buf.x, buf.y))
+    return buf
+
+def _with_fill(shape: "Shape", outline: PointBuffer, spans) -> PointBuffer:
+    """
+    实心图形：内部行程 + 描边像素放进同一个缓冲（同一个 shape、同一种颜色）。
+    spans 为 None（退化）时只有描边
+    """
+    if spans is None or spans[0].size == 0:
+        return outline
+    ys, x0s, x1s = spans
+    fill = PointBuffer.from_spans(ys, x0s, x1s, shape.id, shape.color, shape.pen_width)
+    if not outline.shapes or outline.x.size == 0:
+        return fill
+    # 已经落在内部行程里的描边像素是重复的，去掉（行程按 (y, x0) 排好序，二分查一下）
+    width = int(max(x1s.max(), outline.x.max()) - min(x0s.min(), outline.x.min())) + 2
+    base = int(min(x0s.min(), outline.x.min()))
+    keys = ys.astype(np.int64) * width + (x0s - base)
+    px = outline.x.astype(np.int64)
+    j = np.searchsorted(keys, outline.y.astype(np.int64) * width + (px - base), side="right") - 1
+    jc = np.maximum(j, 0)
+    covered = (j >= 0) & (ys[jc] == outline.y) & (x1s[jc] >= px)
+    rest = outline.take(~covered)
+    fill.x, fill.y = rest.x, rest.y
+    fill.shape, fill.color = rest.shape, rest.color
+    return fill
+
+
+def _world_bounds(shape: "Shape", world_pts) -> Optional[Tuple[float, float, float, float]]:
+    """
+    一组世界坐标点的包围盒，再按线宽外扩一圈（光栅化要取整，多留 1 像素）。
+    控制点的包围盒一定盖住 Bézier / B 样条曲线（凸包性质）
+    """
+    if len(world_pts) == 0:
+        return None
+    v = np.asarray(world_pts, dtype=np.float64).reshape(-1, 2)
+    pad = max(1, int(shape.pen_width or 1)) / 2.0 + 1.0
+    return (float(v[:, 0].min()) - pad, float(v[:, 1].min()) - pad,
+            float(v[:, 0].max()) + pad, float(v[:, 1].max()) + pad)
+
+
+def _ellipse_bounds(shape: "Shape", circ, extra_pts) -> Optional[Tuple[float, float, float, float]]:
+    """局部坐标的圆 circ=(cx, cy, r) 经过 transform 之后（椭圆）的包围盒，并上 extra_pts"""
+    m = shape.transform
+    pts = [m.apply(x, y) for x, y in extra_pts]
+    if circ is not None:
+        cx, cy, r = circ
+        wx, wy = m.apply(cx, cy)
+        ex = r * math.hypot(m.a, m.c)
+        ey = r * math.hypot(m.b, m.d)
+        pts += [(wx - ex, wy - ey), (wx + ex, wy + ey)]
+    return _world_bounds(shape, pts)
+
+
+def _stroke_distance(shape: "Shape", d: float) -> float:
+    """到几何中心线的距离 → 到笔画边缘的距离（线宽的一半以内算 0）"""
+    return max(0.0, d - max(1, int(shape.pen_width or 1)) / 2.0)
+
+
+def _circle_polyline(m: Mat2x3, cx: float, cy: float, r: float,
+                     t0: float = 0.0, sweep: float = 2 * math.pi) -> np.ndarray:
+    """
+    局部坐标里的圆（弧）按足够密的参数采样，再映射到世界坐标。
+    弦高控制在 0.05 像素以内，非等比变换（椭圆）时拿它算距离
+    """
+    R = r * max(math.hypot(m.a, m.b), math.hypot(m.c, m.d), 1e-9)
+    step = 2.0 * math.sqrt(2.0 * 0.05 / R) if R > 0.1 else math.pi / 8
+    n = max(8, int(math.ceil(abs(sweep) / step)))
+    t = t0 + np.linspace(0.0, sweep, n + 1)
+    x = cx + r * np.cos(t)
+    y = cy + r * np.sin(t)
+    return np.stack([m.a * x + m.c * y + m.tx, m.b * x + m.d * y + m.ty], axis=1)
+
+
+def _polygon_spans(world_pts):
+    """
+    世界坐标多边形的内部行程（奇偶规则扫描线填充）。
+    描边的像素 (x, y) 对应整数点，而 scanline_fill 在 (x+0.5, y+0.5) 采样，先挪半个像素对齐
+    """
+    v = np.asarray(world_pts, dtype=np.float64).reshape(-1, 2) + 0.5
+    return scanline_fill([v])
+
+
+def dash_filter(points: PointBuffer, on: int, off: int) -> PointBuffer:
     """
     把一串像素点按 on/off 规则变成虚线：
     - on: 连续绘制的像素数
@@ -38,21 +124,7 @@ def dash_filter(points: List[Point], on: int, off: int) -> List[Point]:
     """
     if on <= 0 or off <= 0:
         return points
-
-    out: List[Point] = []
-    draw = True
-    run = 0
-    for p in points:
-        if draw:
-            out.append(p)
-        run += 1
-        if draw and run >= on:
-            draw = False
-            run = 0
-        elif (not draw) and run >= off:
-            draw = True
-            run = 0
-    return out
+    return points.take(dash_mask(len(points), on, off))
 
 
 @dataclass
@@ -65,29 +137,81 @@ class Shape:
     style: str = "solid"  # "solid" | "dash"
     dash_on: int = 0  # 开段像素数，虚线时>0
     dash_off: int = 0  # 断段像素数，虚线时>0
+    # 几何/变换版本号：每次改动 +1，Scene 用它判断光栅缓存是否失效
+    _version: int = field(default=0, init=False, repr=False, compare=False)
+    # 只有几何（不是 transform）改了才 +1：几何没变、只是整数平移时，Scene 直接挪缓存的光栅
+    _geom_version: int = field(default=0, init=False, repr=False, compare=False)
+    # 拾取用的世界坐标折线缓存：(version, 折线)
+    _pick_cache: Optional[Tuple[int, object]] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def geom_version(self) -> int:
+        return self._geom_version
+
+    def touch(self, geometry: bool = True):
+        """
+        几何或 transform 被改过后调用，让缓存的光栅结果失效。
+        只改了 transform 时传 geometry=False（整数平移还能复用旧光栅）
+        """
+        self._version += 1
+        if geometry:
+            self._geom_version += 1
 
     # ---- 通用变换 ----
     def translate(self, dx: float, dy: float):
         self.transform = Mat2x3.translation(dx, dy) @ self.transform
+        self.touch(geometry=False)
 
     def rotate(self, theta: float, cx: float = 0.0, cy: float = 0.0):
         to_origin = Mat2x3.translation(-cx, -cy)
         rot = Mat2x3.rotation(theta)
         back = Mat2x3.translation(cx, cy)
         self.transform = (back @ rot @ to_origin) @ self.transform
+        self.touch(geometry=False)
 
     def scale(self, sx: float, sy: float, cx: float = 0.0, cy: float = 0.0):
         to_origin = Mat2x3.translation(-cx, -cy)
         sc = Mat2x3.scale(sx, sy)
         back = Mat2x3.translation(cx, cy)
         self.transform = (back @ sc @ to_origin) @ self.transform
+        self.touch(geometry=False)
 
     def move(self, dx: float, dy: float):
         self.translate(dx, dy)
 
-    def rasterize(self) -> List[Point]:
+    def rasterize(self) -> PointBuffer:
         raise NotImplementedError
 
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        """
+        世界坐标包围盒 (x0, y0, x1, y1)（闭区间，可以偏大不能偏小），空间索引用。
+        子类尽量用几何直接算；这里兜底光栅化一次
+        """
+        b = self.rasterize().bbox()
+        if b is None:
+            return None
+        return _world_bounds(self, [(b[0], b[1]), (b[2], b[3])])
+
+    def distance(self, x: float, y: float) -> float:
+        """
+        世界坐标点 (x, y) 到图形笔画的距离（拾取用），什么都不画时是 inf。
+        子类按几何解析地算；这里兜底用光栅结果
+        """
+        pts = self.rasterize().expand()
+        if len(pts) == 0:
+            return math.inf
+        return _stroke_distance(self, float(np.hypot(pts.x - x, pts.y - y).min()))
+
+    def _cached_polyline(self, build):
+        """按 version 缓存 build() 算出来的世界坐标折线"""
+        if self._pick_cache is None or self._pick_cache[0] != self._version:
+            self._pick_cache = (self._version, build())
+        return self._pick_cache[1]
+
 
 
 # ---- 直线 ----
@@ -96,47 +220,47 @@ class Line(Shape):
     x1: int = 0; y1: int = 0
     x2: int = 0; y2: int = 0
 
-    def rasterize(self) -> List[Point]:
+    def rasterize(self) -> PointBuffer:
         X1, Y1 = self.transform.apply(self.x1, self.y1)
         X2, Y2 = self.transform.apply(self.x2, self.y2)
-        pts = bresenham(int(round(X1)), int(round(Y1)),
-                        int(round(X2)), int(round(Y2)))
-        # 应用虚线 on/off 规则
-        pts = dash_filter(pts, self.dash_on, self.dash_off)
+        return _polyline_pixels(self, [(X1, Y1), (X2, Y2)], closed=False, dedup=False)
 
-        w = max(1, int(self.pen_width))
-        return [{"x": p["x"], "y": p["y"], "color": self.color, "id": self.id, "w": w}
-                for p in pts]
+    def bounds(self):
+        m = self.transform
+        return _world_bounds(self, [m.apply(self.x1, self.y1), m.apply(self.x2, self.y2)])
+
+    def distance(self, x, y):
+        m = self.transform
+        seg = [m.apply(self.x1, self.y1), m.apply(self.x2, self.y2)]
+        return _stroke_distance(self, point_polyline_distance(seg, x, y))
 
 # ---- 矩形（描边）----
 @dataclass
 class Rectangle(Shape):
     x1: float = 0; y1: float = 0
     x2: float = 0; y2: float = 0
+    filled: bool = False  # 实心：内部按扫描线填成行程
 
-    def rasterize(self) -> List[Point]:
+    def rasterize(self) -> PointBuffer:
         x_min, x_max = sorted([self.x1, self.x2])
         y_min, y_max = sorted([self.y1, self.y2])
         corners = [(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)]
+        world = [self.transform.apply(x, y) for x, y in corners]
+        outline = _polyline_pixels(self, world, closed=True, dedup=True)
+        return _with_fill(self, outline, _polygon_spans(world)) if self.filled else outline
+
+    def bounds(self):
+        m = self.transform
+        return _world_bounds(self, [m.apply(x, y) for x in (self.x1, self.x2) for y in (self.y1, self.y2)])
 
-        edges = []
-        for i in range(4):
-            (x1, y1) = corners[i]
-            (x2, y2) = corners[(i+1) % 4]
-            X1, Y1 = self.transform.apply(x1, y1)
-            X2, Y2 = self.transform.apply(x2, y2)
-            edges += bresenham(int(round(X1)), int(round(Y1)), int(round(X2)), int(round(Y2)))
-
-        edges = dash_filter(edges, self.dash_on, self.dash_off)
-        seen = set()
-        w = max(1, int(self.pen_width))
-        uniq = []
-        for p in edges:
-            key = (p["x"], p["y"])
-            if key not in seen:
-                seen.add(key)
-                uniq.append({"x": p["x"], "y": p["y"], "color": self.color, "id": self.id, "w": w})
-        return uniq
+    def distance(self, x, y):
+        x_min, x_max = sorted([self.x1, self.x2])
+        y_min, y_max = sorted([self.y1, self.y2])
+        world = [self.transform.apply(px, py)
+                 for px, py in ((x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max))]
+        if self.filled and point_in_polygon(world, x, y):
+            return 0.0
+        return _stroke_distance(self, point_polyline_distance(world, x, y, closed=True))
 
 @dataclass
 class Circle(Shape):
@@ -144,6 +268,7 @@ class Circle(Shape):
     x1: float = 0; y1: float = 0
     x2: float = 0; y2: float = 0
     x3: float = 0; y3: float = 0
+    filled: bool = False  # 实心：逐行精确解椭圆的左右交点
 
     def _circumcenter_and_radius_local(self) -> Optional[Tuple[float, float, float]]:
         """
@@ -169,61 +294,63 @@ class Circle(Shape):
         r = math.sqrt((cx - x1)**2 + (cy - y1)**2)
         return cx, cy, r
 
-    def rasterize(self) -> List[Point]:
+    def rasterize(self) -> PointBuffer:
         """
         思路：
         1. 在局部空间下找到圆心和半径
-        2. 均匀采样圆周点 (局部坐标)
-        3. 用 self.transform.apply() 把采样点丢到世界坐标
-        4. 去重，返回像素点
-        如果三点共线，fallback 成一条线段
+        2. 圆经过仿射变换后在世界坐标里是一个椭圆：
+           中心 = transform(圆心)，两条共轭半轴 = 线性部分 × (r,0) / (0,r)
+        3. 直接在世界坐标里按隐式方程逐列 / 逐行求交（ellipse_ring），
+           得到无缺口、不重复的像素环，代价和周长成正比
+        如果三点共线（或者被缩放成一条线），fallback 成一条线段
         """
         circ = self._circumcenter_and_radius_local()
-        if circ is None:
+        ring = None
+        if circ is not None:
+            cx_local, cy_local, r_local = circ
+            m = self.transform
+            cx_w, cy_w = m.apply(cx_local, cy_local)
+            axes = (m.a * r_local, m.b * r_local, m.c * r_local, m.d * r_local)
+            ring = ellipse_ring(cx_w, cy_w, *axes)
+        if ring is None:
             # 共线或退化，按一条直线处理
             X1, Y1 = self.transform.apply(self.x1, self.y1)
             X2, Y2 = self.transform.apply(self.x2, self.y2)
-            pts = bresenham(int(round(X1)), int(round(Y1)),
-                            int(round(X2)), int(round(Y2)))
-            pts = dash_filter(pts, self.dash_on, self.dash_off)
-            w = max(1, int(self.pen_width))
-            return [{"x": p["x"], "y": p["y"],
-                     "color": self.color, "id": self.id, "w": w} for p in pts]
-
-        cx_local, cy_local, r_local = circ
-
-        # 计算采样密度：尽量让相邻采样点接近1px（在局部半径上估）
-        n = max(16, min(2000, int(2 * math.pi * max(1.0, r_local))))
-
-        raw_pts_world = []
-        for i in range(n):
-            theta = 2 * math.pi * (i / n)
-            px_local = cx_local + r_local * math.cos(theta)
-            py_local = cy_local + r_local * math.sin(theta)
-
-            Xw, Yw = self.transform.apply(px_local, py_local)
-            raw_pts_world.append({
-                "x": int(round(Xw)),
-                "y": int(round(Yw)),
-            })
-        raw_pts_world = dash_filter(raw_pts_world, self.dash_on, self.dash_off)
-        # 去重并加绘制属性
-        seen = set()
-        uniq = []
-        w = max(1, int(self.pen_width))
-        for p in raw_pts_world:
-            key = (p["x"], p["y"])
-            if key not in seen:
-                seen.add(key)
-                uniq.append({
-                    "x": p["x"],
-                    "y": p["y"],
-                    "color": self.color,
-                    "id": self.id,
-                    "w": w
-                })
-        return uniq
-    
+            return _polyline_pixels(self, [(X1, Y1), (X2, Y2)], closed=False, dedup=False)
+
+        xs, ys, _, _ = ring
+        xs, ys = bridge_gaps(xs, ys, closed=True)
+        outline = _shape_pixels(self, xs, ys)
+        if self.filled:
+            return _with_fill(self, outline, ellipse_spans(cx_w, cy_w, *axes))
+        return outline
+
+    def bounds(self):
+        circ = self._circumcenter_and_radius_local()
+        # 共线时 rasterize 退化成第 1、2 点的线段，三个点都算进去更保险
+        return _ellipse_bounds(self, circ, [(self.x1, self.y1), (self.x2, self.y2), (self.x3, self.y3)])
+
+    def distance(self, x, y):
+        m = self.transform
+        circ = self._circumcenter_and_radius_local()
+        if circ is None:
+            seg = [m.apply(self.x1, self.y1), m.apply(self.x2, self.y2)]
+            return _stroke_distance(self, point_polyline_distance(seg, x, y))
+        cx, cy, r = circ
+        k = m.similarity_scale()
+        if k is not None and k > 0:
+            # 等比变换下还是圆：拉回局部坐标直接算，再乘回缩放倍数
+            lx, ly = m.inverse().apply(x, y)
+            d = math.hypot(lx - cx, ly - cy)
+            if self.filled and d <= r:
+                return 0.0
+            return _stroke_distance(self, abs(d - r) * k)
+        # 非等比：世界坐标里是椭圆，用足够密的折线
+        ring = self._cached_polyline(lambda: _circle_polyline(m, cx, cy, r))
+        if self.filled and point_in_polygon(ring, x, y):
+            return 0.0
+        return _stroke_distance(self, point_polyline_distance(ring, x, y))
+
 
 # ---- n阶 Bézier 曲线 ----
 @dataclass
@@ -231,113 +358,62 @@ class Bezier(Shape):
     # 控制点列表（局部坐标）
     points: List[Dict[str, float]] = field(default_factory=list)
 
-    def _de_casteljau_world(self, t: float, world_ctrl_pts: List[Dict[str, float]]) -> Point:
-        """
-        在“世界坐标下的控制点”上运行 De Casteljau。
-        world_ctrl_pts: [{'x': Xw, 'y': Yw}, ...] 已经过 transform
-        返回 int-rounded 的点
-        """
-        tmp = [{"x": p["x"], "y": p["y"]} for p in world_ctrl_pts]
-        n = len(tmp)
-        for r in range(1, n):
-            for i in range(n - r):
-                tmp[i]["x"] = (1 - t) * tmp[i]["x"] + t * tmp[i + 1]["x"]
-                tmp[i]["y"] = (1 - t) * tmp[i]["y"] + t * tmp[i + 1]["y"]
-        return {
-            "x": int(round(tmp[0]["x"])),
-            "y": int(round(tmp[0]["y"])),
-        }
-
-    def rasterize(self) -> List[Point]:
+    def rasterize(self) -> PointBuffer:
         """
         做法：
-        1. 把本地控制点通过 transform 映射到世界坐标 → world_ctrl_pts
-        2. 在世界坐标上跑 De Casteljau（仿射下是等价的）
-        3. 坐标离散成像素，去重，上色
+        1. 把本地控制点通过 transform 映射到世界坐标（仿射下 Bézier 和控制点可交换）
+        2. 在世界坐标里按平直度容差自适应细分（flatten_bezier），只在弯的地方多切
+        3. 折线一次性光栅化，虚线、去重
         """
         if len(self.points) < 2:
-            return []
-
-        # 1. 映射控制点到世界坐标
-        world_ctrl_pts: List[Dict[str, float]] = []
-        for p in self.points:
-            Xw, Yw = self.transform.apply(p["x"], p["y"])
-            world_ctrl_pts.append({"x": Xw, "y": Yw})
-
-        # 2. 采样
-        n_samples = max(32, len(self.points) * 50)
-        raw_pts = []
-        for i in range(n_samples + 1):
-            t = i / n_samples
-            pt = self._de_casteljau_world(t, world_ctrl_pts)
-            raw_pts.append(pt)
-        raw_pts = dash_filter(raw_pts, self.dash_on, self.dash_off)
-        # 3. 去重 + 上色
-        seen = set()
-        uniq: List[Point] = []
-        w = max(1, int(self.pen_width))
-        for p in raw_pts:
-            key = (p["x"], p["y"])
-            if key not in seen:
-                seen.add(key)
-                uniq.append({
-                    "x": p["x"],
-                    "y": p["y"],
-                    "color": self.color,
-                    "id": self.id,
-                    "w": w
-                })
-        return uniq
-    
+            return PointBuffer.empty()
+
+        world_ctrl_pts = [self.transform.apply(p["x"], p["y"]) for p in self.points]
+        poly = flatten_bezier(world_ctrl_pts)
+        return _polyline_pixels(self, poly, closed=False, dedup=True)
+
+    def bounds(self):
+        return _world_bounds(self, [self.transform.apply(p["x"], p["y"]) for p in self.points])
+
+    def distance(self, x, y):
+        if len(self.points) < 2:
+            return math.inf
+        poly = self._cached_polyline(
+            lambda: flatten_bezier([self.transform.apply(p["x"], p["y"]) for p in self.points]))
+        return _stroke_distance(self, point_polyline_distance(poly, x, y))
+
 # ---- 任意多边形 ----
 @dataclass
 class Polygon(Shape):
     points: List[Point] = field(default_factory=list)
     closed: bool = True   # 默认还是闭合
+    filled: bool = False  # 实心（只对闭合多边形生效）：内部按扫描线填成行程
 
-    def rasterize(self) -> List[Point]:
+    def rasterize(self) -> PointBuffer:
         if self.closed:
             if len(self.points) < 3:
-                return []
+                return PointBuffer.empty()
         else:
             if len(self.points) < 2:
-                return []
+                return PointBuffer.empty()
 
-        world_pts = []
-        for p in self.points:
-            X, Y = self.transform.apply(p["x"], p["y"])
-            world_pts.append({"x": X, "y": Y})
+        world_pts = [self.transform.apply(p["x"], p["y"]) for p in self.points]
+        # 所有边一次性向量化光栅化（被裁剪过的圆可能有上千个顶点）
+        outline = _polyline_pixels(self, world_pts, closed=self.closed, dedup=True)
+        if self.filled and self.closed:
+            return _with_fill(self, outline, _polygon_spans(world_pts))
+        return outline
 
-        edges = []
-        n = len(world_pts)
+    def bounds(self):
+        return _world_bounds(self, [self.transform.apply(p["x"], p["y"]) for p in self.points])
 
-        if self.closed:
-            for i in range(n):
-                p1, p2 = world_pts[i], world_pts[(i+1) % n]
-                edges += bresenham(int(round(p1["x"])), int(round(p1["y"])),
-                                   int(round(p2["x"])), int(round(p2["y"])))
-        else:
-            for i in range(n - 1):
-                p1, p2 = world_pts[i], world_pts[i+1]
-                edges += bresenham(int(round(p1["x"])), int(round(p1["y"])),
-                                   int(round(p2["x"])), int(round(p2["y"])))
-
-        edges = dash_filter(edges, self.dash_on, self.dash_off)
-        seen = set()
-        uniq = []
-        w = max(1, int(self.pen_width))
-        for p in edges:
-            key = (p["x"], p["y"])
-            if key not in seen:
-                seen.add(key)
-                uniq.append({
-                    "x": p["x"],
-                    "y": p["y"],
-                    "color": self.color,
-                    "id": self.id,
-                    "w": w
-                })
-        return uniq
+    def distance(self, x, y):
+        if len(self.points) < (3 if self.closed else 2):
+            return math.inf
+        world = [self.transform.apply(p["x"], p["y"]) for p in self.points]
+        if self.filled and self.closed and point_in_polygon(world, x, y):
+            return 0.0
+        return _stroke_distance(self, point_polyline_distance(world, x, y, closed=self.closed))
 
 
 @dataclass
@@ -353,85 +429,32 @@ class BSpline(Shape):
         if len(self.points) < self.degree + 1:
             raise ValueError(f"B样条控制点数量不足，当前为 {len(self.points)}，至少需要 {self.degree + 1} 个。")
 
-    def _uniform_knot_vector(self, n: int, k: int) -> List[float]:
-        """
-        生成均匀节点向量
-        n: 控制点数量 - 1
-        k: 次数 (degree)
-        """
-        m = n + k + 1  # 节点总数 = n + k + 1
-        # 均匀节点，首尾各重复 k+1 次
-        return [0] * (k + 1) + [i / (m - 2 * k - 1) for i in range(m - 2 * k - 1)] + [1] * (k + 1)
-
-    def _basis(self, i: int, k: int, t: float, knots: List[float]) -> float:
-        """
-        Cox–de Boor 递归定义的B样条基函数 N_{i,k}(t)
-        """
-        if k == 0:
-            return 1.0 if knots[i] <= t < knots[i + 1] else 0.0
-        denom1 = knots[i + k] - knots[i]
-        denom2 = knots[i + k + 1] - knots[i + 1]
-        term1 = ((t - knots[i]) / denom1 * self._basis(i, k - 1, t, knots)) if denom1 != 0 else 0.0
-        term2 = ((knots[i + k + 1] - t) / denom2 * self._basis(i + 1, k - 1, t, knots)) if denom2 != 0 else 0.0
-        return term1 + term2
-
-    def _spline_point_world(self, t: float, world_ctrl_pts: List[Dict[str, float]]) -> Dict[str, int]:
+    def rasterize(self) -> PointBuffer:
         """
-        计算参数 t 对应的B样条点（世界坐标）
+        1. 控制点 → 世界坐标
+        2. 用缓存的基函数矩阵（bspline_basis）一次算出所有采样点，
+           每个采样点只用到它所在区间的 order 个控制点（de Boor）
+        3. 采样点连成折线光栅化，去重并返回像素点
         """
-        n = len(world_ctrl_pts) - 1
-        k = self.degree
-        knots = self._uniform_knot_vector(n, k)
+        if len(self.points) < self.order:
+            return PointBuffer.empty()
 
-        x, y = 0.0, 0.0
-        for i in range(n + 1):
-            Ni = self._basis(i, k, t, knots)
-            x += Ni * world_ctrl_pts[i]["x"]
-            y += Ni * world_ctrl_pts[i]["y"]
+        world_ctrl_pts = [self.transform.apply(p["x"], p["y"]) for p in self.points]
+        n_samples = max(64, len(self.points) * 50)
+        curve = eval_bspline(world_ctrl_pts, self.order, n_samples)
+        return _polyline_pixels(self, curve, closed=False, dedup=True)
 
-        return {"x": int(round(x)), "y": int(round(y))}
+    def bounds(self):
+        return _world_bounds(self, [self.transform.apply(p["x"], p["y"]) for p in self.points])
 
-    def rasterize(self) -> List[Dict[str, int]]:
-        """
-        1. 控制点 → 世界坐标
-        2. 在 [0,1] 区间上均匀采样
-        3. 去重并返回像素点
-        """
+    def distance(self, x, y):
         if len(self.points) < self.order:
-            return []
+            return math.inf
+        curve = self._cached_polyline(lambda: eval_bspline(
+            [self.transform.apply(p["x"], p["y"]) for p in self.points],
+            self.order, max(64, len(self.points) * 50)))
+        return _stroke_distance(self, point_polyline_distance(curve, x, y))
 
-        # 1. 映射控制点到世界坐标
-        world_ctrl_pts: List[Dict[str, float]] = []
-        for p in self.points:
-            Xw, Yw = self.transform.apply(p["x"], p["y"])
-            world_ctrl_pts.append({"x": Xw, "y": Yw})
-
-        # 2. 均匀采样
-        n_samples = max(64, len(self.points) * 50)
-        raw_pts = []
-        for i in range(n_samples + 1):
-            t = i / n_samples
-            pt = self._spline_point_world(t, world_ctrl_pts)
-            raw_pts.append(pt)
-        raw_pts = dash_filter(raw_pts, self.dash_on, self.dash_off)
-        # 3. 去重 + 上色
-        seen = set()
-        uniq: List[Dict[str, int]] = []
-        w = max(1, int(self.pen_width))
-        for p in raw_pts:
-            key = (p["x"], p["y"])
-            if key not in seen:
-                seen.add(key)
-                uniq.append({
-                    "x": p["x"],
-                    "y": p["y"],
-                    "color": self.color,
-                    "id": self.id,
-                    "w": w
-                })
-
-        return uniq
-    
 @dataclass
 class Arc(Shape):
     # 三个点：起点(x1, y1), 经过点(x2, y2), 终点(x3, y3) (局部坐标系里)
@@ -467,15 +490,13 @@ class Arc(Shape):
         r = math.sqrt((cx - x1)**2 + (cy - y1)**2)
         return cx, cy, r
 
-    def rasterize(self) -> List[Point]:
+    def rasterize(self) -> PointBuffer:
         """
         思路：
-        1. 在局部空间下找到外接圆心和半径。
-        2. 计算起点、经过点、终点在圆上的角度。
-        3. 根据三个点的顺序确定圆弧的方向（顺时针或逆时针）。
-        4. 在起点和终点的角度之间均匀采样。
-        5. 用 self.transform.apply() 把采样点丢到世界坐标
-        6. 去重，返回像素点。
+        1. 在局部空间下找到外接圆心和半径，把三个点归一化成单位圆上的方向向量。
+        2. 由三点的绕向（叉积符号）决定从起点沿哪个方向经过中间点到终点，不算 atan2。
+        3. 圆在世界坐标里是椭圆，直接在世界坐标里按隐式方程只求弧包围盒内的交点
+           （ellipse_arc），用伪角度筛出弧上的像素并排序，起点 / 终点像素精确保留。
         如果三点共线，fallback 成两条线段 (P1->P2, P2->P3)。
         """
         circ = self._circumcenter_and_radius_local()
@@ -483,146 +504,124 @@ class Arc(Shape):
         x2, y2 = float(self.x2), float(self.y2)
         x3, y3 = float(self.x3), float(self.y3)
 
+        arc = None
+        if circ is not None:
+            cx_local, cy_local, r_local = circ
+            m = self.transform
+            cx_w, cy_w = m.apply(cx_local, cy_local)
+            start = ((x1 - cx_local) / r_local, (y1 - cy_local) / r_local)
+            end = ((x3 - cx_local) / r_local, (y3 - cy_local) / r_local)
+            # P1 -> P2 -> P3 左转就是逆时针（参数角增大方向）
+            turn = (x2 - x1) * (y3 - y2) - (y2 - y1) * (x3 - x2)
+            direction = 1.0 if turn > 0 else -1.0
+            arc = ellipse_arc(cx_w, cy_w,
+                              m.a * r_local, m.b * r_local,
+                              m.c * r_local, m.d * r_local,
+                              start, end, direction)
+
+        if arc is None:
+            # 共线或退化，按两条线段处理：P1->P2 和 P2->P3（一次光栅化，去重）
+            world = [self.transform.apply(x1, y1),
+                     self.transform.apply(x2, y2),
+                     self.transform.apply(x3, y3)]
+            return _polyline_pixels(self, world, closed=False, dedup=True)
+
+        xs, ys = arc
+        return _shape_pixels(self, xs, ys)
+
+    def bounds(self):
+        # 整圆的包围盒一定盖住弧，偏大一点无所谓
+        circ = self._circumcenter_and_radius_local()
+        return _ellipse_bounds(self, circ, [(self.x1, self.y1), (self.x2, self.y2), (self.x3, self.y3)])
+
+    def distance(self, x, y):
+        m = self.transform
+        circ = self._circumcenter_and_radius_local()
         if circ is None:
-            # 共线或退化，按两条线段处理：P1->P2 和 P2->P3
-            from .shapes import bresenham  # 如果 bresenham 跟这个类同文件，去掉这行 import
-            
-            # P1 到 P2
-            X1, Y1 = self.transform.apply(x1, y1)
-            X2, Y2 = self.transform.apply(x2, y2)
-            pts1 = bresenham(int(round(X1)), int(round(Y1)),
-                             int(round(X2)), int(round(Y2)))
-            
-            # P2 到 P3
-            X3, Y3 = self.transform.apply(x3, y3)
-            # 注意：P2 点会被重复计算，后面去重会解决
-            pts2 = bresenham(int(round(X2)), int(round(Y2)),
-                             int(round(X3)), int(round(Y3)))
-            
-            all_pts = pts1 + pts2 # 合并所有点
-            all_pts = dash_filter(all_pts, self.dash_on, self.dash_off)
-            w = max(1, int(self.pen_width))
-            
-            # 去重和加属性（与下面的逻辑类似）
-            seen = set()
-            uniq = []
-            for p in all_pts:
-                 key = (p["x"], p["y"])
-                 if key not in seen:
-                     seen.add(key)
-                     uniq.append({"x": p["x"], "y": p["y"],
-                                  "color": self.color, "id": self.id, "w": w})
-            return uniq
-
-        cx_local, cy_local, r_local = circ
-
-        # 1. 计算三个点在局部圆上的角度
-        # atan2 返回的角度范围是 (-pi, pi]
-        theta1 = math.atan2(y1 - cy_local, x1 - cx_local)
-        theta2 = math.atan2(y2 - cy_local, x2 - cx_local)
-        theta3 = math.atan2(y3 - cy_local, x3 - cx_local)
-        
-        # 2. 调整角度到 [0, 2*pi)
-        theta1 = theta1 if theta1 >= 0 else theta1 + 2 * math.pi
-        theta2 = theta2 if theta2 >= 0 else theta2 + 2 * math.pi
-        theta3 = theta3 if theta3 >= 0 else theta3 + 2 * math.pi
-        
-        # 3. 确定圆弧的角度范围 (start_angle, end_angle) 和 sweep_angle
-        # 目的是从 theta1 沿着包含 theta2 的方向转到 theta3。
-
-        # 将 theta1 到 theta3 的角度差规范到 (-2*pi, 2*pi) 范围内
-        angle_diff = theta3 - theta1
-        
-        # 规范化到 (-2*pi, 2*pi)
-        while angle_diff <= -2 * math.pi: angle_diff += 2 * math.pi
-        while angle_diff >= 2 * math.pi: angle_diff -= 2 * math.pi
-        
-        # 检查 theta2 是否落在 theta1 到 theta3 的短弧上
-        # (即从 theta1 逆时针到 theta3 的角度是否小于 pi)
-        # 短弧/长弧判断通常是通过 angle_diff 的符号来确定方向，然后检查 theta2 是否在范围内
-        
-        # 定义一个函数，计算从 a 到 b 的逆时针角度 (范围 [0, 2*pi))
-        def get_ccw_diff(a, b):
-            diff = b - a
-            return diff if diff >= 0 else diff + 2 * math.pi
-
-        ccw_diff_1_to_3 = get_ccw_diff(theta1, theta3)
-        ccw_diff_1_to_2 = get_ccw_diff(theta1, theta2)
-        ccw_diff_2_to_3 = get_ccw_diff(theta2, theta3)
-        
-        # 如果 ccw_diff_1_to_2 + ccw_diff_2_to_3 约等于 ccw_diff_1_to_3，
-        # 那么圆弧是逆时针方向，从 theta1 到 theta3
-        # 考虑到浮点数误差，使用小范围判断
-        epsilon = 1e-6
-        if abs(ccw_diff_1_to_2 + ccw_diff_2_to_3 - ccw_diff_1_to_3) < epsilon:
-            # 逆时针圆弧：起点 theta1, 终点 theta3, 角度跨度 ccw_diff_1_to_3
-            start_angle = theta1
-            sweep_angle = ccw_diff_1_to_3
-        else:
-            # 顺时针圆弧（即沿着长弧，跨度 > pi）。
-            # 相当于逆时针从 theta3 到 theta1 的长弧。
-            # 从 theta1 到 theta3 的顺时针角度是 -(2*pi - ccw_diff_1_to_3)
-            start_angle = theta1
-            sweep_angle = -(2 * math.pi - ccw_diff_1_to_3)
-
-
-        # 4. 计算采样点数量
-        # 采样密度：尽量让相邻采样点接近1px（在局部半径上估），考虑最大角度跨度
-        arc_length_local = abs(sweep_angle) * r_local
-        # 确保至少有 16 个点，或足以覆盖弧长
-        n = max(16, min(2000, int(max(1.0, arc_length_local))))
-        
-        if n == 0:
-            return [] # 半径太小，返回空列表
-
-        raw_pts_world = []
-        for i in range(n + 1): # n+1 次采样，包括起点和终点
-            # 插值角度
-            frac = i / n
-            theta = start_angle + sweep_angle * frac
-            
-            px_local = cx_local + r_local * math.cos(theta)
-            py_local = cy_local + r_local * math.sin(theta)
-
-            # 转换到世界坐标并四舍五入到最近的像素点
-            Xw, Yw = self.transform.apply(px_local, py_local)
-            raw_pts_world.append({
-                "x": int(round(Xw)),
-                "y": int(round(Yw)),
-            })
-        raw_pts_world = dash_filter(raw_pts_world, self.dash_on, self.dash_off)
-        # 5. 去重并加绘制属性
-        seen = set()
-        uniq = []
-        w = max(1, int(self.pen_width))
-        for p in raw_pts_world:
-            key = (p["x"], p["y"])
-            if key not in seen:
-                seen.add(key)
-                uniq.append({
-                    "x": p["x"],
-                    "y": p["y"],
-                    "color": self.color,
-                    "id": self.id,
-                    "w": w
-                })
-        return uniq
+            world = [m.apply(self.x1, self.y1), m.apply(self.x2, self.y2), m.apply(self.x3, self.y3)]
+            return _stroke_distance(self, point_polyline_distance(world, x, y))
+        cx, cy, r = circ
+        # 局部坐标里弧的起始角和扫过的角度（方向和 rasterize 一样由三点绕向决定）
+        a1 = math.atan2(self.y1 - cy, self.x1 - cx)
+        a3 = math.atan2(self.y3 - cy, self.x3 - cx)
+        turn = (self.x2 - self.x1) * (self.y3 - self.y2) - (self.y2 - self.y1) * (self.x3 - self.x2)
+        direction = 1.0 if turn > 0 else -1.0
+        sweep = ((a3 - a1) * direction) % (2 * math.pi)
+        k = m.similarity_scale()
+        if k is not None and k > 0:
+            # 等比变换：局部坐标里点到圆弧的距离有闭式解
+            lx, ly = m.inverse().apply(x, y)
+            rel = ((math.atan2(ly - cy, lx - cx) - a1) * direction) % (2 * math.pi)
+            if rel <= sweep:
+                d = abs(math.hypot(lx - cx, ly - cy) - r)
+            else:
+                d = min(math.hypot(lx - self.x1, ly - self.y1), math.hypot(lx - self.x3, ly - self.y3))
+            return _stroke_distance(self, d * k)
+        arc = self._cached_polyline(lambda: _circle_polyline(m, cx, cy, r, a1, sweep * direction))
+        return _stroke_distance(self, point_polyline_distance(arc, x, y))
 
 @dataclass
 class FillBlob(Shape):
-    # 存“基准像素”（创建时的绝对坐标），移动/旋转/缩放靠 transform
-    pixels: List[Dict] = field(default_factory=list)
-
-    def rasterize(self) -> List[Dict]:
-        out = []
+    # 创建时把填充区域描成轮廓多边形（局部坐标，像素角点，含洞），存储量跟周长走而不是面积；
+    # 移动/旋转/缩放靠 transform，光栅化时对变换后的轮廓重新做扫描线填充，不会漏像素
+    contours: List[np.ndarray] = field(default_factory=list)
+    # 不变换时扫出来的行程，纯平移直接整段挪它
+    _base: Optional[PointBuffer] = field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def from_spans(cls, spans: PointBuffer, **kwargs) -> "FillBlob":
+        """由填充算法给出的行程建 FillBlob（只留轮廓）"""
+        return cls(contours=trace_span_contours(spans.span_y, spans.span_x0, spans.span_x1), **kwargs)
+
+    def rasterize(self) -> PointBuffer:
+        if not self.contours:
+            return PointBuffer.empty()
+        m = self.transform
         w = max(1, int(self.pen_width or 1))
-        for p in self.pixels:
-            x, y = self.transform.apply(p["x"], p["y"])  # 应用变换
-            out.append({
-                "x": int(round(x)),
-                "y": int(round(y)),
-                "color": p.get("color", self.color),
-                "id": self.id,  # 用形状自身 id
-                "w": w
-            })
-        return out
+        if m.a == 1 and m.b == 0 and m.c == 0 and m.d == 1:
+            # 纯平移：整段整段地挪，不用重新扫。
+            # 半像素平移统一往 +∞ 取整，整段一起动，不会出现逐像素四舍六入五成双的锯齿
+            if self._base is None:
+                ys, x0s, x1s = scanline_fill(self.contours)
+                self._base = PointBuffer.from_spans(ys, x0s, x1s, self.id, self.color, w)
+            return self._base.shifted(int(math.floor(m.tx + 0.5)), int(math.floor(m.ty + 0.5)))
+
+        # 旋转 / 缩放：轮廓顶点做仿射变换，再扫描线填充
+        world = []
+        for poly in self.contours:
+            x = poly[:, 0].astype(np.float64)
+            y = poly[:, 1].astype(np.float64)
+            world.append(np.stack([m.a * x + m.c * y + m.tx, m.b * x + m.d * y + m.ty], axis=1))
+        ys, x0s, x1s = scanline_fill(world)
+        return PointBuffer.from_spans(ys, x0s, x1s, self.id, self.color, w)
+
+    def bounds(self):
+        if not self.contours:
+            return None
+        v = np.concatenate(self.contours).astype(np.float64)
+        m = self.transform
+        x0, y0 = v.min(axis=0)
+        x1, y1 = v.max(axis=0)
+        # 轮廓是像素角点，右 / 下边界本身就多出一格；变换一下包围盒的四个角
+        return _world_bounds(self, [m.apply(x, y) for x in (x0, x1) for y in (y0, y1)])
+
+    def distance(self, x, y):
+        if not self.contours:
+            return math.inf
+        m = self.transform
+
+        def build():
+            # 轮廓在像素角点坐标里，像素 (x, y) 的中心是 (x+0.5, y+0.5)，变换后挪回像素坐标
+            out = []
+            for poly in self.contours:
+                px = poly[:, 0].astype(np.float64)
+                py = poly[:, 1].astype(np.float64)
+                out.append(np.stack([m.a * px + m.c * py + m.tx - 0.5,
+                                     m.b * px + m.d * py + m.ty - 0.5], axis=1))
+            return out
+
+        world = self._cached_polyline(build)
+        # 奇偶规则：在奇数个轮廓里面就是在填充区域里
+        if sum(point_in_polygon(c, x, y) for c in world) % 2:
+            return 0.0
+        return min(point_polyline_distance(c, x, y, closed=True) for c in world)
@@ -0,0 +1,188 @@
+# backend/app/domain/spatial.py
+"""
+场景的空间索引：均匀网格，格子里挂“包围盒碰到这个格子的 shape id”。
+
+以前“鼠标下面是谁 / 哪些图形和裁剪框相交 / 视口里要画哪些”都得把整个场景光栅化一遍，
+有了索引就只看附近格子里的那几个候选，再由调用方精确判断。
+
+- 包围盒是世界坐标、闭区间 (x0, y0, x1, y1)，可以是小数
+- 特别大的包围盒（跨太多格子）不往格子里挂，单独放一个列表，每次查询都带上
+"""
+import math
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+BBox = Tuple[float, float, float, float]
+
+# 默认格子边长（像素）
+DEFAULT_CELL_SIZE = 64
+# 一个包围盒最多挂这么多个格子，再多就算“大图形”
+MAX_CELLS_PER_ITEM = 1024
+
+
+def bbox_intersects(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def bbox_contains(outer: BBox, inner: BBox) -> bool:
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[2] <= outer[2] and inner[3] <= outer[3])
+
+
+def bbox_distance(b: BBox, x: float, y: float) -> float:
+    """点到包围盒的距离（在盒子里面是 0）"""
+    dx = max(b[0] - x, 0.0, x - b[2])
+    dy = max(b[1] - y, 0.0, y - b[3])
+    return math.hypot(dx, dy)
+
+
+class SpatialGrid:
+    def __init__(self, cell_size: int = DEFAULT_CELL_SIZE):
+        self.cell = max(1, int(cell_size))
+        self._cells: Dict[Tuple[int, int], Set[str]] = {}
+        self._boxes: Dict[str, BBox] = {}
+        # key -> 挂在哪些格子上（None 表示是大图形）
+        self._where: Dict[str, Optional[Tuple[int, int, int, int]]] = {}
+        self._large: Set[str] = set()
+        # 用过的格子范围（只增不减，nearest 用它决定最多扩几圈）
+        self._extent: Optional[Tuple[int, int, int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._boxes
+
+    def bbox(self, key: str) -> Optional[BBox]:
+        return self._boxes.get(key)
+
+    def _cell_range(self, b: BBox) -> Tuple[int, int, int, int]:
+        c = self.cell
+        return (math.floor(b[0] / c), math.floor(b[1] / c),
+                math.floor(b[2] / c), math.floor(b[3] / c))
+
+    # ----------------------
+    # 增删改
+    # ----------------------
+    def insert(self, key: str, b: Optional[BBox]) -> None:
+        """放入 / 更新一个 key 的包围盒；b 为 None（什么都不画）时等于删除"""
+        if key in self._boxes:
+            self.remove(key)
+        if b is None:
+            return
+        self._boxes[key] = b
+        r = self._cell_range(b)
+        if (r[2] - r[0] + 1) * (r[3] - r[1] + 1) > MAX_CELLS_PER_ITEM:
+            self._where[key] = None
+            self._large.add(key)
+            return
+        self._where[key] = r
+        e = self._extent
+        self._extent = r if e is None else (min(e[0], r[0]), min(e[1], r[1]),
+                                            max(e[2], r[2]), max(e[3], r[3]))
+        for cx in range(r[0], r[2] + 1):
+            for cy in range(r[1], r[3] + 1):
+                self._cells.setdefault((cx, cy), set()).add(key)
+
+    def remove(self, key: str) -> None:
+        if key not in self._boxes:
+            return
+        del self._boxes[key]
+        r = self._where.pop(key)
+        if r is None:
+            self._large.discard(key)
+            return
+        for cx in range(r[0], r[2] + 1):
+            for cy in range(r[1], r[3] + 1):
+                bucket = self._cells.get((cx, cy))
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._cells[(cx, cy)]
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._boxes.clear()
+        self._where.clear()
+        self._large.clear()
+        self._extent = None
+
+    # ----------------------
+    # 查询（返回的都是“包围盒命中”的候选，精确判断交给调用方）
+    # ----------------------
+    def query_point(self, x: float, y: float) -> Set[str]:
+        c = self.cell
+        bucket = self._cells.get((math.floor(x / c), math.floor(y / c)), ())
+        out = {k for k in bucket if bbox_distance(self._boxes[k], x, y) == 0.0}
+        out.update(k for k in self._large if bbox_distance(self._boxes[k], x, y) == 0.0)
+        return out
+
+    def query_rect(self, b: BBox) -> Set[str]:
+        r = self._cell_range(b)
+        n_cells = (r[2] - r[0] + 1) * (r[3] - r[1] + 1)
+        if n_cells > len(self._cells):
+            # 框比已占用的格子还多：不如直接把所有包围盒扫一遍
+            cand: Iterable[str] = self._boxes.keys()
+        else:
+            cand = set()
+            for cx in range(r[0], r[2] + 1):
+                for cy in range(r[1], r[3] + 1):
+                    bucket = self._cells.get((cx, cy))
+                    if bucket:
+                        cand.update(bucket)
+            cand.update(self._large)
+        return {k for k in cand if bbox_intersects(self._boxes[k], b)}
+
+    def nearest(self, x: float, y: float, k: int = 1,
+                max_dist: Optional[float] = None) -> List[Tuple[float, str]]:
+        """
+        包围盒离 (x, y) 最近的 k 个：[(距离, key), ...]，由近到远。
+        从所在格子一圈一圈往外扩，第 ring 圈之外的格子离点至少 ring * cell，
+        已经找够 k 个且第 k 个比这个还近就可以停。
+        """
+        if not self._boxes or k <= 0:
+            return []
+        c = self.cell
+        gx, gy = math.floor(x / c), math.floor(y / c)
+        seen: Set[str] = set()
+        found: List[Tuple[float, str]] = []
+        for key in self._large:
+            seen.add(key)
+            found.append((bbox_distance(self._boxes[key], x, y), key))
+
+        # 最多扩到能覆盖所有用过的格子的圈数
+        e = self._extent
+        max_ring = 0 if e is None else max(abs(gx - e[0]), abs(gx - e[2]), abs(gy - e[1]), abs(gy - e[3]))
+        if max_dist is not None:
+            max_ring = min(max_ring, int(max_dist // c) + 1)
+
+        ring = 0
+        while ring <= max_ring:
+            if ring == 0:
+                ring_cells = [(gx, gy)]
+            else:
+                ring_cells = [(gx + i, gy - ring) for i in range(-ring, ring + 1)]
+                ring_cells += [(gx + i, gy + ring) for i in range(-ring, ring + 1)]
+                ring_cells += [(gx - ring, gy + j) for j in range(-ring + 1, ring)]
+                ring_cells += [(gx + ring, gy + j) for j in range(-ring + 1, ring)]
+            for cell in ring_cells:
+                for key in self._cells.get(cell, ()):
+                    if key not in seen:
+                        seen.add(key)
+                        found.append((bbox_distance(self._boxes[key], x, y), key))
+            found.sort()
+            # 下一圈的格子离点至少 ring * cell
+            if len(found) >= k and found[k - 1][0] <= ring * c:
+                break
+            ring += 1
+
+        if max_dist is not None:
+            found = [f for f in found if f[0] <= max_dist]
+        return found[:k]
+
+    def stats(self) -> dict:
+        return {
+            "items": len(self._boxes),
+            "cells": len(self._cells),
+            "large": len(self._large),
+            "cell_size": self.cell,
+        }
@@ -1,10 +1,17 @@
 # backend/app/services/scene_service.py
 
+import json
+import math
 import re
-from typing import Dict, List, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
 from ..domain.scene import Scene
 from ..domain.shapes import Line, Rectangle, Circle, Bezier, Polygon, BSpline,FillBlob, Arc
-from ..domain.fill import scanline_flood_fill
+from ..domain.fill import boundary_fill_rgba
+from ..domain.framebuffer import Framebuffer
+from ..domain.regions import RegionLabels
+from ..domain.points import PointBuffer
 from uuid import uuid4
 from ..extensions import socketio
 
@@ -50,28 +57,294 @@ def _rgba_to_hex(c):
         return f"#{c:02x}{c:02x}{c:02x}"
     return "#000000"
 
+def _pick_viewport(v) -> Optional[Tuple[int, int, int, int]]:
+    """
+    视口 [x0, y0, x1, y1]（闭区间，世界坐标）；也接受 "x0,y0,x1,y1" 字符串。
+    None / 空串表示不裁剪，格式不对抛 ValueError。
+    """
+    if v is None or v == "":
+        return None
+    if isinstance(v, str):
+        v = v.split(",")
+    if not isinstance(v, (list, tuple)) or len(v) != 4:
+        raise ValueError("viewport 需要 [x0, y0, x1, y1]")
+    try:
+        x0, y0, x1, y1 = (int(float(t)) for t in v)
+    except (TypeError, ValueError):
+        raise ValueError("viewport 需要 [x0, y0, x1, y1]")
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+# WebSocket 订阅者可选的点集格式
+SUBSCRIBE_FORMATS = ("json", "binary")
+# 批量接口里能用的图形类型（兼容单个接口的路径名）→ _make_xxx
+BATCH_SHAPE_TYPES = {
+    "line": "line", "lines": "line",
+    "rect": "rect", "rectangle": "rect", "rectangles": "rect",
+    "circle": "circle", "circles": "circle",
+    "bezier": "bezier",
+    "polygon": "polygon", "polygons": "polygon",
+    "bspline": "bspline",
+    "arc": "arc",
+}
+BATCH_TYPES = tuple(BATCH_SHAPE_TYPES) + ("translate", "rotate", "scale")
+
+
+def _int_or_none(v) -> Optional[int]:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+# 批量里各图形必填的坐标字段，以及所有图形都可选的整数字段
+BATCH_COORD_FIELDS = {
+    "line": ("x1", "y1", "x2", "y2"),
+    "rect": ("x1", "y1", "x2", "y2"),
+    "circle": ("x1", "y1", "x2", "y2", "x3", "y3"),
+    "arc": ("x1", "y1", "x2", "y2", "x3", "y3"),
+}
+BATCH_INT_OPTIONS = ("width", "dash_on", "dash_off", "degree")
+# 变换项的数字字段和缺省值
+BATCH_TRANSFORM_FIELDS = {
+    "translate": (("dx", 0.0), ("dy", 0.0)),
+    "rotate": (("theta", 0.0), ("cx", 0.0), ("cy", 0.0)),
+    "scale": (("sx", 1.0), ("sy", 1.0), ("cx", 0.0), ("cy", 0.0)),
+}
+
+
+def _batch_number(d: Dict, key: str, default: Optional[float] = None, name: Optional[str] = None):
+    """
+    批量项里的一个数字字段：缺了用 default（default 为 None 表示必填），
+    不是有限的数字就抛 ValueError，并且说清楚是哪个字段（name 可以带上下标，比如 points[2].x）
+    """
+    name = name or key
+    v = d.get(key)
+    if v is None:
+        if default is None:
+            raise ValueError(f"缺少字段 {name}")
+        return default
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"字段 {name} 需要数字，收到 {v!r}")
+    if not math.isfinite(f):
+        raise ValueError(f"字段 {name} 需要有限的数字，收到 {v!r}")
+    # 本来就是数字的原样保留（整数坐标别变成 1.0），字符串之类的才换成 float
+    return v if type(v) in (int, float) else f
+
+
+def _clean_batch_shape(kind: str, d: Dict) -> Dict:
+    """校验批量里一项图形描述的数字字段，返回数字都转好了的副本（交给 _make_xxx）"""
+    d = dict(d)
+    for key in BATCH_COORD_FIELDS.get(kind, ()):
+        d[key] = _batch_number(d, key)
+    for key in BATCH_INT_OPTIONS:
+        if d.get(key) is not None:
+            d[key] = int(_batch_number(d, key))
+    if "points" in d:
+        pts = d["points"]
+        if not isinstance(pts, list):
+            raise ValueError("字段 points 需要 [{x, y}, ...]")
+        clean = []
+        for i, p in enumerate(pts):
+            if not isinstance(p, dict):
+                raise ValueError(f"字段 points[{i}] 需要 {{x, y}}")
+            clean.append({"x": _batch_number(p, "x", name=f"points[{i}].x"),
+                          "y": _batch_number(p, "y", name=f"points[{i}].y")})
+        d["points"] = clean
+    return d
+
+# 变换会话（拖拽）期间最多每秒推几次；<= 0 表示不限
+DEFAULT_BROADCAST_HZ = 30.0
+# GET /points、/scene 序列化好的响应体缓存：最多几份、总共多少字节（单份超过上限的不缓存）
+BODY_CACHE_ENTRIES = 8
+BODY_CACHE_BYTES = 64 * 1024 * 1024
+
 class SceneService:
-    def __init__(self, scene: Scene):
+    def __init__(self, scene: Scene, broadcast_hz: float = DEFAULT_BROADCAST_HZ):
         self.scene = scene
+        # WebSocket 订阅者：sid -> (格式 "json" | "binary", 视口或 None)
+        # 整场景订阅者每次收完整的 points_update；增量订阅者只收 shape_added / removed / replaced
+        self._subscribers: Dict[str, Tuple[str, Optional[Tuple[int, int, int, int]]]] = {}
+        self._delta_subscribers: Dict[str, Tuple[str, Optional[Tuple[int, int, int, int]]]] = {}
+        # 增量已经推到了哪个场景版本
+        self._sent_version: int = scene.version
+        # 变换会话里的推送限频：只推最新状态，两次之间攒下的改动在下一次 / 会话结束时一起推
+        self._broadcast_hz: float = float(broadcast_hz or 0)
+        self._in_session: bool = False
+        self._last_broadcast: float = 0.0
+        self._pending: bool = False
+        self._held: int = 0
+        # ETag 前缀：区分不同的场景实例（重启后版本号从 0 开始，旧 ETag 不能误中）
+        self._etag_prefix: str = uuid4().hex[:8]
+        # 当前场景版本下序列化好的响应体：ETag -> (body, mimetype)；版本一变整个作废
+        self._bodies: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._bodies_version: int = -1
+        self._bodies_bytes: int = 0
+        # 油漆桶用的常驻帧缓冲（第一次填充时按画布尺寸建）
+        self._fb: Optional[Framebuffer] = None
+        # 挂在帧缓冲上的连通块标号索引，连点油漆桶时不用每次从头泛洪
+        self._regions: Optional[RegionLabels] = None
 
-    def _broadcast_points(self, pts: Optional[list[dict]] = None) -> list[dict]:
+    # -------------------------
+    # WebSocket 订阅
+    # -------------------------
+    def subscribe(self, sid: str, fmt: str = "json", viewport=None, delta: bool = False):
+        """
+        登记 / 更新某个连接想要的格式、视口，以及是否走增量协议。
+        带了视口的连接只收视口里的像素；视口不合法就当没给（整场景）。
+        返回实际登记下的 (格式, 视口)。
+        """
+        try:
+            vp = _pick_viewport(viewport)
+        except ValueError:
+            vp = None
+        key = (fmt if fmt in SUBSCRIBE_FORMATS else "json", vp)
+        self._subscribers.pop(sid, None)
+        self._delta_subscribers.pop(sid, None)
+        (self._delta_subscribers if delta else self._subscribers)[sid] = key
+        return key
+
+    def unsubscribe(self, sid: str):
+        self._subscribers.pop(sid, None)
+        self._delta_subscribers.pop(sid, None)
+
+    def _broadcast_points(self, pts: Optional[PointBuffer] = None) -> PointBuffer:
         """
         把当前场景（或给定 pts）通过 WebSocket 推送给所有客户端，
-        并把 pts 返回给调用者。
+        并把 pts 返回给调用者（PointBuffer，API 层自己转 JSON）。
+        变换会话里按 broadcast_hz 限频：间隔没到就先不推，只记一下有没推的改动。
         """
         # ⭐ 注意：这里要用 scene.flatten_points，不是再调用 _broadcast_points 自己！
         if pts is None:
             pts = self.scene.flatten_points()
+        if not self._hold_broadcast():
+            self._emit_points(pts)
+            self._flush_deltas()
+        return pts
+
+    def _hold_broadcast(self) -> bool:
+        """变换会话中、离上次推送还不到 1/hz 秒：这次先攒着（返回 True）"""
+        if not self._in_session or self._broadcast_hz <= 0:
+            return False
+        now = time.monotonic()
+        if now - self._last_broadcast < 1.0 / self._broadcast_hz:
+            self._pending = True
+            self._held += 1
+            return True
+        self._last_broadcast = now
+        self._pending = False
+        return False
+
+    def _emit_points(self, pts: Optional[PointBuffer] = None):
+        """
+        给整场景订阅者推 points_update。
+        订阅者按 (格式, 视口) 分组，每组只光栅化 / 编码一次：
+        没带视口的拿整场景，带了视口的只拿视口里的部分。
+        增量订阅者不收整场景，只收这次改了的那几个 shape（见 _flush_deltas）。
+        """
+        if not self._subscribers:
+            return
+        if pts is None:
+            pts = self.scene.flatten_points()
+        groups: Dict[Tuple[str, Optional[Tuple[int, int, int, int]]], list] = {}
+        for sid, key in list(self._subscribers.items()):
+            groups.setdefault(key, []).append(sid)
         try:
-            socketio.emit("points_update", pts)
+            # 没带视口的 JSON 连接（连上就默认是这种，见 api/ws.py）还是一次群发，跳过其他组
+            plain = groups.pop(("json", None), None)
+            if plain:
+                others = [sid for sids in groups.values() for sid in sids]
+                others += list(self._delta_subscribers)
+                socketio.emit("points_update", pts.to_dicts(), skip_sid=others or None)
+            for (fmt, vp), sids in groups.items():
+                part = pts if vp is None else pts.cropped(*vp)
+                payload = part.to_bytes() if fmt == "binary" else part.to_dicts()
+                for sid in sids:
+                    socketio.emit("points_update", payload, to=sid)
         except Exception as e:
             print("[SceneService] broadcast points_update failed:", e)
-        return pts
+
+    def set_broadcast_rate(self, hz: float):
+        """运行时调整变换会话里的推送频率（<= 0 不限频）"""
+        self._broadcast_hz = float(hz or 0)
+
+    # -------------------------
+    # 增量推送
+    # -------------------------
+    def _flush_deltas(self):
+        """
+        把上次推送之后的场景变更按 shape 发给增量订阅者：
+            shape_removed  {"version", "base", "id"}
+            shape_replaced {"version", "base", "id", "points"}
+            shape_added    {"version", "base", "id", "index", "points"}
+        points 只有这一个 shape 的光栅（按订阅者的格式 / 视口），index 是它在整场景绘制顺序里的位置。
+        每条的 base 是上一条的 version，客户端发现 base 比自己手里的版本新（漏了消息）就发 request_resync。
+        变更日志已经不够往回找时直接给所有增量订阅者整场景重发。
+        """
+        head = self.scene.version
+        if not self._delta_subscribers:
+            self._sent_version = head
+            return
+        if head == self._sent_version:
+            return
+        ops = self.scene.delta_since(self._sent_version)
+        if ops is None:
+            for sid in list(self._delta_subscribers):
+                self.resync(sid)
+            self._sent_version = head
+            return
+        if not ops:
+            # 只有加了又删掉的 shape，客户端那边什么都不用做；版本留着下次一起推
+            return
+
+        groups: Dict[Tuple[str, Optional[Tuple[int, int, int, int]]], list] = {}
+        for sid, key in list(self._delta_subscribers.items()):
+            groups.setdefault(key, []).append(sid)
+        # 这批消息的版本号落在 (sent, head] 里，最后一条正好是 head
+        first = head - len(ops) + 1
+        try:
+            for (fmt, vp), sids in groups.items():
+                for i, (kind, shape_id, index) in enumerate(ops):
+                    msg = {
+                        "version": first + i,
+                        "base": first + i - 1 if i else self._sent_version,
+                        "id": shape_id,
+                    }
+                    if kind != "removed":
+                        pts = self.scene.shape_points(shape_id, vp)
+                        msg["points"] = pts.to_bytes() if fmt == "binary" else pts.to_dicts()
+                    if kind == "added":
+                        msg["index"] = index
+                    for sid in sids:
+                        socketio.emit(f"shape_{kind}", msg, to=sid)
+        except Exception as e:
+            print("[SceneService] broadcast deltas failed:", e)
+        self._sent_version = head
+
+    def resync_payload(self, sid: str) -> Dict:
+        """某个增量订阅者的整场景重发内容：{"version", "order", "points"}（order 是全部 shape 的绘制顺序）"""
+        fmt, vp = self._delta_subscribers.get(sid) or self._subscribers.get(sid) or ("json", None)
+        pts = self.scene.flatten_points(vp)
+        return {
+            "version": self.scene.version,
+            "order": self.scene.draw_order(),
+            "points": pts.to_bytes() if fmt == "binary" else pts.to_dicts(),
+        }
+
+    def resync(self, sid: str):
+        try:
+            socketio.emit("scene_resync", self.resync_payload(sid), to=sid)
+        except Exception as e:
+            print("[SceneService] scene_resync failed:", e)
+
+    def viewport_points(self, viewport) -> PointBuffer:
+        """只取视口里的像素（不广播），视口外的 shape 不光栅化"""
+        return self.scene.flatten_points(_pick_viewport(viewport))
 
     # -------------------------
     # 创建各种图形
     # -------------------------
-    def add_line(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> List[Dict]:
+    def _make_line(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> Line:
         """
         期望 d 里有: x1,y1,x2,y2
         """
@@ -89,12 +362,11 @@ class SceneService:
             dash_on=on,
             dash_off=off,
         )
-        self.scene.add(line)
-        return self._broadcast_points()
+        return line
 
-    def add_rect(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> List[Dict]:
+    def _make_rect(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> Rectangle:
         """
-        期望 d 里有: x1,y1,x2,y2  视为对角点
+        期望 d 里有: x1,y1,x2,y2  视为对角点；可选 filled=true 画实心
         """
         c = _pick_color(color)
         w = _pick_width(width if width is not None else d.get("width"), 1)
@@ -105,15 +377,15 @@ class SceneService:
             x1=int(d["x1"]), y1=int(d["y1"]),
             x2=int(d["x2"]), y2=int(d["y2"]),
             color=c,
-            pen_width=w, style=s, dash_on=on, dash_off=off
+            pen_width=w, style=s, dash_on=on, dash_off=off,
+            filled=bool(d.get("filled", False)),
         )
-        self.scene.add(rect)
-        return self._broadcast_points()
+        return rect
 
-    def add_circle(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> List[Dict]:
+    def _make_circle(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> Circle:
         """
         期望 d 里有: x1,y1,x2,y2,x3,y3
-        （用三点拟合外接圆）
+        （用三点拟合外接圆）；可选 filled=true 画实心
         """
         c = _pick_color(color)
         w = _pick_width(width if width is not None else d.get("width"), 1)
@@ -125,12 +397,12 @@ class SceneService:
             x2=int(d["x2"]), y2=int(d["y2"]),
             x3=int(d["x3"]), y3=int(d["y3"]),
             color=c,
-            pen_width=w, style=s, dash_on=on, dash_off=off
+            pen_width=w, style=s, dash_on=on, dash_off=off,
+            filled=bool(d.get("filled", False)),
         )
-        self.scene.add(circle)
-        return self._broadcast_points()
+        return circle
 
-    def add_bezier(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> List[Dict]:
+    def _make_bezier(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> Bezier:
         """
         期望 d["points"] 是 [{x:..., y:...}, ...]
         """
@@ -144,12 +416,11 @@ class SceneService:
         on = int(dash_on if dash_on is not None else d.get("dash_on", 0) or 0)
         off = int(dash_off if dash_off is not None else d.get("dash_off", 0) or 0)
         bezier = Bezier(points=pts, color=c, pen_width=w,style=s, dash_on=on, dash_off=off)
-        self.scene.add(bezier)
-        return self._broadcast_points()
+        return bezier
 
-    def add_polygon(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> List[Dict]:
+    def _make_polygon(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> Polygon:
         """
-        期望 d["points"] 是 [{x:..., y:...}, ...] 且至少3点
+        期望 d["points"] 是 [{x:..., y:...}, ...] 且至少3点；可选 filled=true 画实心
         """
         pts = d.get("points", [])
         if not isinstance(pts, list) or len(pts) < 3:
@@ -160,17 +431,17 @@ class SceneService:
         s = style if style is not None else d.get("style", "solid")
         on = int(dash_on if dash_on is not None else d.get("dash_on", 0) or 0)
         off = int(dash_off if dash_off is not None else d.get("dash_off", 0) or 0)
-        polygon = Polygon(points=pts, color=c, pen_width=w,style=s, dash_on=on, dash_off=off)
-        self.scene.add(polygon)
-        return self._broadcast_points()
+        polygon = Polygon(points=pts, color=c, pen_width=w,style=s, dash_on=on, dash_off=off,
+                          filled=bool(d.get("filled", False)))
+        return polygon
 
-    def add_bspline(
+    def _make_bspline(
         self,
         d: Dict,
         degree: Optional[int] = None,
         color: Optional[str] = None,
         width: Optional[int] = None, style: Optional[str] = None, dash_on: Optional[int] = None, dash_off: Optional[int] = None,
-    ) -> List[Dict]:
+    ) -> BSpline:
         """
         期望 d 包含:
         {
@@ -188,12 +459,10 @@ class SceneService:
         on = int(dash_on if dash_on is not None else d.get("dash_on", 0) or 0)
         off = int(dash_off if dash_off is not None else d.get("dash_off", 0) or 0)
         bspline = BSpline(points=pts, order = degree + 1, color=c, pen_width=w,style=s, dash_on=on, dash_off=off)
-        self.scene.add(bspline)
-
-        return self._broadcast_points()
+        return bspline
 
 
-    def add_arc(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> List[Dict]:
+    def _make_arc(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> Arc:
         c = _pick_color(color)
         w = _pick_width(width if width is not None else d.get("width"), 1)
         s = style if style is not None else d.get("style", "solid")
@@ -206,18 +475,188 @@ class SceneService:
             color=c,
             pen_width=w,style=s, dash_on=on, dash_off=off
         )
-        self.scene.add(arc)
+        return arc
+
+    def add_line(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> PointBuffer:
+        self.scene.add(self._make_line(d, color, width, style, dash_on, dash_off))
+        return self._broadcast_points()
+
+    def add_rect(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> PointBuffer:
+        self.scene.add(self._make_rect(d, color, width, style, dash_on, dash_off))
+        return self._broadcast_points()
+
+    def add_circle(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> PointBuffer:
+        self.scene.add(self._make_circle(d, color, width, style, dash_on, dash_off))
+        return self._broadcast_points()
+
+    def add_bezier(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> PointBuffer:
+        self.scene.add(self._make_bezier(d, color, width, style, dash_on, dash_off))
+        return self._broadcast_points()
+
+    def add_polygon(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> PointBuffer:
+        self.scene.add(self._make_polygon(d, color, width, style, dash_on, dash_off))
+        return self._broadcast_points()
+
+    def add_bspline(
+        self,
+        d: Dict,
+        degree: Optional[int] = None,
+        color: Optional[str] = None,
+        width: Optional[int] = None, style: Optional[str] = None, dash_on: Optional[int] = None, dash_off: Optional[int] = None,
+    ) -> PointBuffer:
+        self.scene.add(self._make_bspline(d, degree, color, width, style, dash_on, dash_off))
+        return self._broadcast_points()
+
+    def add_arc(self, d: Dict, color: Optional[str] = None, width: Optional[int] = None,style: Optional[str] = None,dash_on: Optional[int] = None,dash_off: Optional[int] = None,) -> PointBuffer:
+        self.scene.add(self._make_arc(d, color, width, style, dash_on, dash_off))
         return self._broadcast_points()
 
+    # -------------------------
+    # 批量操作
+    # -------------------------
+    def _make_from_spec(self, d: Dict):
+        """批量里的一项图形描述 → shape 对象；字段和对应的单个创建接口一样"""
+        kind = BATCH_SHAPE_TYPES[d["type"]]
+        color = d.get("color", "#ff0000")
+        if kind == "bspline":
+            degree = int(d.get("degree", 3) or 3)
+            return self._make_bspline(d, degree=degree, color=color)
+        return getattr(self, f"_make_{kind}")(d, color=color)
+
+    def apply_batch(self, ops) -> Dict:
+        """
+        一次做一串操作（图形创建和变换可以混着来），要么全做要么全不做：
+            {"type": "line" | "rect" | "circle" | "bezier" | "polygon" | "bspline" | "arc", ...同单个接口的字段}
+            {"type": "translate", "id", "dx", "dy"}
+            {"type": "rotate", "id", "theta", "cx", "cy"}
+            {"type": "scale", "id", "sx", "sy", "cx", "cy"}
+        变换的 id 可以写 "$k"，指这一批里第 k 项（从 0 数）建出来的图形。
+        先把每一项都解析校验完（有错抛 ValueError，场景不动），再在一个 batch 里全部做掉：
+        只记一条撤销、只推一次。返回 {"ids": 新建图形的 id, "version": 场景版本}
+        """
+        if not isinstance(ops, list):
+            raise ValueError("batch 需要一个数组")
+        steps = []
+        made: Dict[int, str] = {}
+        for k, d in enumerate(ops):
+            try:
+                kind = d.get("type") if isinstance(d, dict) else None
+                if kind not in BATCH_TYPES:
+                    raise ValueError(f"不认识的 type {kind!r}")
+                if kind in BATCH_SHAPE_TYPES:
+                    shape = self._make_from_spec(_clean_batch_shape(BATCH_SHAPE_TYPES[kind], d))
+                    made[k] = shape.id
+                    steps.append(("add", shape))
+                    continue
+                ref = d.get("id")
+                if isinstance(ref, str) and ref.startswith("$"):
+                    ref = made.get(_int_or_none(ref[1:]))
+                if ref is None or (ref not in made.values() and self.scene.get_shape(ref) is None):
+                    raise ValueError(f"找不到图形 {d.get('id')!r}")
+                args = tuple(_batch_number(d, key, default) for key, default in BATCH_TRANSFORM_FIELDS[kind])
+                steps.append((kind, ref, args))
+            except (KeyError, TypeError, ValueError) as e:
+                msg = f"缺少字段 {e}" if isinstance(e, KeyError) else str(e)
+                raise ValueError(f"第 {k} 项：{msg}")
+
+        scene = self.scene
+        own_batch = not scene.in_batch
+        if own_batch:
+            scene.begin_batch()
+        for step in steps:
+            if step[0] == "add":
+                scene.add(step[1])
+            elif step[0] == "translate":
+                scene.translate_shape(step[1], *step[2])
+            elif step[0] == "rotate":
+                scene.rotate_shape(step[1], *step[2])
+            else:
+                scene.scale_shape(step[1], *step[2])
+        if own_batch:
+            scene.end_batch()
+
+        # 整场景订阅者一条 points_update，增量订阅者一次 flush
+        if not self._hold_broadcast():
+            self._emit_points()
+            self._flush_deltas()
+        return {"ids": list(made.values()), "version": scene.version}
+
     # -------------------------
     # 状态 / 绘制
     # -------------------------
-    def get_points(self) -> List[Dict]:
+    def get_points(self, viewport=None) -> PointBuffer:
         """
         展场景，返回像素点（前端画布用）
+        带了视口只算视口里的那部分，只回给请求方，不广播
         """
+        if viewport is not None:
+            return self.viewport_points(viewport)
         return self._broadcast_points()
 
+    # -------------------------
+    # 条件 GET：ETag + 按版本缓存响应体
+    # -------------------------
+    def etag(self, kind: str, *variant) -> str:
+        """
+        某个只读接口在当前场景版本下的 ETag（不带引号）。
+        variant 区分同一接口的不同表示（格式 / 视口 / 流式），场景一有改动版本就变
+        """
+        parts = [self._etag_prefix, kind, str(self.scene.version)]
+        parts += [str(v) for v in variant if v is not None]
+        return "-".join(parts)
+
+    def points_etag(self, viewport, representation: str) -> str:
+        """/points 的 ETag；视口先规范化（格式不对抛 ValueError）"""
+        vp = _pick_viewport(viewport)
+        return self.etag("points", representation, ",".join(map(str, vp)) if vp else None)
+
+    def cached_body(self, etag: str) -> Optional[Tuple[bytes, str]]:
+        if self._bodies_version != self.scene.version:
+            return None
+        hit = self._bodies.get(etag)
+        if hit is not None:
+            self._bodies.move_to_end(etag)
+        return hit
+
+    def cache_body(self, etag: str, body: bytes, mimetype: str):
+        """记下某个 ETag 的响应体；只留当前版本的，按条数 / 字节数 LRU"""
+        if self._bodies_version != self.scene.version:
+            self._bodies.clear()
+            self._bodies_bytes = 0
+            self._bodies_version = self.scene.version
+        if len(body) > BODY_CACHE_BYTES or etag in self._bodies:
+            return
+        self._bodies[etag] = (body, mimetype)
+        self._bodies_bytes += len(body)
+        while len(self._bodies) > BODY_CACHE_ENTRIES or self._bodies_bytes > BODY_CACHE_BYTES:
+            _, (old, _) = self._bodies.popitem(last=False)
+            self._bodies_bytes -= len(old)
+
+    def stream_points(self, viewport=None, ndjson: bool = False) -> Iterator[str]:
+        """
+        流式版的 get_points（不广播）：逐个 shape 光栅化、编码、吐出去，
+        同一时刻只拿着一个 shape 的像素和它的 JSON 文本。
+        - ndjson=False：拼起来就是和 /points 一样的 JSON 数组 [{x, y, color, id, w}, ...]
+        - ndjson=True：一行一个 shape：{"id": ..., "points": [{x, y, color, id, w}, ...]}
+        视口格式不对在这里就抛 ValueError（不等到开始迭代）
+        """
+        vp = _pick_viewport(viewport)
+        return self._points_chunks(vp, ndjson)
+
+    def _points_chunks(self, vp, ndjson: bool) -> Iterator[str]:
+        dumps = json.JSONEncoder(separators=(",", ":")).encode
+        if ndjson:
+            for sid, pts in self.scene.iter_points(vp):
+                yield dumps({"id": sid, "points": pts.to_dicts()}) + "\n"
+            return
+        yield "["
+        first = True
+        for _, pts in self.scene.iter_points(vp):
+            body = dumps(pts.to_dicts())[1:-1]
+            yield body if first else "," + body
+            first = False
+        yield "]"
+
     def dump_scene_state(self) -> Dict:
         """
         返回整个场景的结构化信息（每个 shape 的几何定义 + 当前 transform 矩阵）
@@ -225,25 +664,141 @@ class SceneService:
         """
         return self.scene.dump_scene_state()
 
+    def stats(self) -> Dict:
+        """
+        运行时统计（光栅缓存命中率、撤销历史占用、空间索引、帧缓冲重画量），给运维 / 压测看
+        """
+        return {
+            "raster_cache": self.scene.raster_cache_stats(),
+            "history": self.scene.history_stats(),
+            "spatial_index": self.scene.spatial_index_stats(),
+            "framebuffer": self._fb.stats() if self._fb is not None else None,
+            "regions": self._regions.stats() if self._regions is not None else None,
+            "sync": {
+                "version": self.scene.version,
+                "sent_version": self._sent_version,
+                "subscribers": len(self._subscribers),
+                "delta_subscribers": len(self._delta_subscribers),
+                "broadcast_hz": self._broadcast_hz,
+                "held_broadcasts": self._held,
+            },
+            "body_cache": {
+                "version": self._bodies_version,
+                "entries": len(self._bodies),
+                "bytes": self._bodies_bytes,
+            },
+        }
+
+    def pick(self, x: float, y: float, threshold: float = 12.0) -> Dict:
+        """点选：{"id": 最近的 shape id 或 None, "dist": 距离}"""
+        hit = self.scene.pick(x, y, threshold)
+        if hit is None:
+            return {"id": None, "dist": None}
+        return {"id": hit[0], "dist": hit[1]}
+
     # -------------------------
     # 变换
     # -------------------------
-    def translate_shape(self, shape_id: str, dx: float, dy: float) -> List[Dict]:
-        pts = self.scene.translate_and_raster(shape_id, dx, dy)
-        return self._broadcast_points(pts)
+    @property
+    def in_transform_session(self) -> bool:
+        return self._in_session
+
+    def translate_shape(self, shape_id: str, dx: float, dy: float) -> PointBuffer:
+        """
+        平移。会话外照旧返回整场景；变换会话（拖拽）里每次 mousemove 都会来一次，
+        这时只返回被移动的这个 shape 的光栅（走缓存，整数平移直接挪），不再每次展开整场景，
+        整场景的推送按 broadcast_hz 限频，会话结束时补推（见 end_transform_session）
+        """
+        if not self._in_session:
+            pts = self.scene.translate_and_raster(shape_id, dx, dy)
+            return self._broadcast_points(pts)
+        self.scene.translate_shape(shape_id, dx, dy)
+        if not self._hold_broadcast():
+            self._emit_points()
+            self._flush_deltas()
+        return self.scene.shape_points(shape_id)
 
     def rotate_shape(self, shape_id: str, theta: float, cx: float, cy: float) -> bool:
         """
         绕 (cx, cy) 旋转指定图形 theta (弧度)。
+        推送和平移一样：整场景订阅者、增量订阅者都推（会话里按 broadcast_hz 限频）。
+        _hold_broadcast 放行时会清掉 _pending，所以这里一定要真推整场景，
+        否则会话里之前攒着的平移就再也推不出去了（end_transform_session 看 _pending 已经是 False）
         """
-        return self.scene.rotate_shape(shape_id, theta, cx, cy)
+        ok = self.scene.rotate_shape(shape_id, theta, cx, cy)
+        if not self._hold_broadcast():
+            self._emit_points()
+            self._flush_deltas()
+        return ok
 
     def scale_shape(self, shape_id: str, sx: float, sy: float, cx: float, cy: float) -> bool:
         """
-        围绕 (cx, cy) 按 (sx, sy) 缩放指定图形。
+        围绕 (cx, cy) 按 (sx, sy) 缩放指定图形。推送规则同 rotate_shape
+        """
+        ok = self.scene.scale_shape(shape_id, sx, sy, cx, cy)
+        if not self._hold_broadcast():
+            self._emit_points()
+            self._flush_deltas()
+        return ok
+
+
+    def _framebuffer(self, width: int, height: int, bg_color) -> Framebuffer:
+        """
+        取（必要时新建）和画布同尺寸、同背景色的帧缓冲，并增量同步到场景当前状态
+        """
+        rgba_bg = _to_rgba(bg_color)
+        fb = self._fb
+        if fb is None or fb.size != (width, height) or fb.background != rgba_bg:
+            fb = self._fb = Framebuffer(width, height, rgba_bg, _to_rgba)
+            self._regions = RegionLabels(fb)
+        fb.sync(self.scene)
+        return fb
+
+    def _add_fill(self, raw: PointBuffer, rgba_new, fill_id: str) -> Tuple[Optional[str], PointBuffer]:
+        """
+        填充结果转回场景的颜色格式（仍用 hex，和其他 shape 一致），打包成 FillBlob 加进场景。
+        返回 (fill_id, 行程)，没填到东西时 fill_id 是 None。
+        """
+        if raw.n_spans == 0:
+            return None, PointBuffer.empty()
+        hex_color = _rgba_to_hex(rgba_new)
+        spans = PointBuffer.from_spans(raw.span_y, raw.span_x0, raw.span_x1, fill_id, hex_color, 1)
+        blob = FillBlob.from_spans(spans, id=fill_id, color=hex_color, pen_width=1)
+        self.scene.add(blob)
+        return fill_id, spans
+
+    def _flood(self, x: int, y: int, new_color, width: int, height: int,
+               connectivity: int, tol: int, bg_color) -> Tuple[Optional[str], PointBuffer]:
+        """
+        油漆桶的公共部分：在帧缓冲的连通块索引上查出种子所在区域，有结果就作为 FillBlob 加进场景。
         """
-        return self.scene.scale_shape(shape_id, sx, sy, cx, cy)
+        self._framebuffer(int(width), int(height), bg_color)
 
+        # 算法内部用 RGBA 对比
+        fill_id = f"fill-{uuid4().hex[:8]}"
+        rgba_new = _to_rgba(new_color)
+        raw = self._regions.flood(
+            int(x), int(y),
+            new_color=rgba_new, shape_id=fill_id,
+            pen_w=1, connectivity=int(connectivity), tol=int(tol),
+        )
+        return self._add_fill(raw, rgba_new, fill_id)
+
+    def _boundary(self, x: int, y: int, boundary_color, new_color, width: int, height: int,
+                  connectivity: int, tol: int, bbox, bg_color) -> Tuple[Optional[str], PointBuffer]:
+        """
+        边界填充：同一个帧缓冲，遇到 boundary_color 停；bbox 限定最远填到哪
+        """
+        fb = self._framebuffer(int(width), int(height), bg_color)
+        fill_id = f"fill-{uuid4().hex[:8]}"
+        rgba_new = _to_rgba(new_color)
+        raw = boundary_fill_rgba(
+            fb.rgba, int(x), int(y),
+            boundary_color=_to_rgba(boundary_color), new_color=rgba_new, shape_id=fill_id,
+            pen_w=1, connectivity=int(connectivity), tol=int(tol),
+            bbox=tuple(int(v) for v in bbox) if bbox is not None else None,
+        )
+        return self._add_fill(raw, rgba_new, fill_id)
 
     def bucket_fill(
             self,
@@ -255,103 +810,62 @@ class SceneService:
             connectivity: int = 4,
             tol: int = 0,
             bg_color: str = "#ffffff",  # 画布背景色（没画到的像素）
-    ) -> List[Dict]:
+    ) -> PointBuffer:
         """
         在 (x,y) 对与起点同色的区域做连通填充；把填充像素作为一个 FillBlob shape 加入场景。
-        返回最新 flatten_points()。
+        返回最新 flatten_points()（PointBuffer）。
         """
-        # 1) 构建 read(x,y)：从当前场景的像素点映射出 RGBA
-        rgba_bg = _to_rgba(bg_color)
-        rgbamap = {}
-        for p in self._broadcast_points():
-            rgbamap[(int(p["x"]), int(p["y"]))] = _to_rgba(p["color"])
-
-        def read(xx: int, yy: int):
-            return rgbamap.get((xx, yy), rgba_bg)
-
-        # 2) 算法产出像素（算法内部用 RGBA 对比）
-        fill_id = f"fill-{uuid4().hex[:8]}"
-        rgba_new = _to_rgba(new_color)
-        raw_pts = scanline_flood_fill(
-            seed_x=int(x), seed_y=int(y),
-            read=read,
-            width=int(width), height=int(height),
-            new_color=rgba_new,
-            shape_id=fill_id,
-            pen_w=1, connectivity=int(connectivity), tol=int(tol)
-        )
-
-        if not raw_pts:
-            return self._broadcast_points()
-
-        # 3) 转回你场景的颜色格式（仍用 hex），打包成 FillBlob 形状
-        hex_color = _rgba_to_hex(rgba_new)
-        pixels = []
-        for p in raw_pts:
-            pixels.append({
-                "x": p["x"],
-                "y": p["y"],
-                "color": hex_color,  # 存 hex，和你其他 shape 一致
-                "id": fill_id,
-                "w": 1
-            })
-
-        # blob = FillBlob(pixels=pixels, color=hex_color, pen_width=1)
-        blob = FillBlob(id=fill_id, pixels=pixels, color=hex_color, pen_width=1)
-        self.scene.add(blob)
-
+        self._flood(x, y, new_color, width, height, connectivity, tol, bg_color)
         return self._broadcast_points()
 
-    # services/scene_service.py 里加：
     def bucket_fill_meta(
             self, x: int, y: int, new_color, width: int, height: int,
             connectivity: int = 4, tol: int = 0, bg_color: str = "#ffffff"
     ):
-        # --- 基本逻辑与 bucket_fill 一致 ---
-        rgba_bg = _to_rgba(bg_color)
-        rgbamap = {}
-        for p in self._broadcast_points():
-            rgbamap[(int(p["x"]), int(p["y"]))] = _to_rgba(p["color"])
+        """和 bucket_fill 一样，另外把新 FillBlob 的 id 和行程一起返回"""
+        fill_id, spans = self._flood(x, y, new_color, width, height, connectivity, tol, bg_color)
+        return {"points": self._broadcast_points(), "fill_id": fill_id, "spans": spans}
 
-        def read(xx: int, yy: int):
-            return rgbamap.get((xx, yy), rgba_bg)
-
-        from uuid import uuid4
-        fill_id = f"fill-{uuid4().hex[:8]}"
-        rgba_new = _to_rgba(new_color)
-        raw_pts = scanline_flood_fill(
-            seed_x=int(x), seed_y=int(y), read=read,
-            width=int(width), height=int(height),
-            new_color=rgba_new, shape_id=fill_id,
-            pen_w=1, connectivity=int(connectivity), tol=int(tol)
-        )
-        if not raw_pts:
-            return {"points": self._broadcast_points(), "fill_id": None, "pixels": []}
-
-        hex_color = _rgba_to_hex(rgba_new)
-        pixels = [{"x": p["x"], "y": p["y"], "color": hex_color, "id": fill_id, "w": 1} for p in raw_pts]
-
-        blob = FillBlob(pixels=pixels, color=hex_color, pen_width=1)
-        self.scene.add(blob)
-
-        return {"points": self._broadcast_points(), "fill_id": fill_id, "pixels": pixels}
+    def boundary_fill_meta(
+            self, x: int, y: int, boundary_color, new_color, width: int, height: int,
+            connectivity: int = 4, tol: int = 0, bbox=None, bg_color: str = "#ffffff"
+    ):
+        """
+        边界填充：从 (x,y) 出发填到 boundary_color 为止（bbox=(x0,y0,x1,y1) 可限定范围）。
+        返回值和 bucket_fill_meta 一样
+        """
+        fill_id, spans = self._boundary(x, y, boundary_color, new_color, width, height,
+                                        connectivity, tol, bbox, bg_color)
+        return {"points": self._broadcast_points(), "fill_id": fill_id, "spans": spans}
 
     # -------------------------
     # undo / clear
     # -------------------------
-    def undo(self) -> List[Dict]:
+    def undo(self) -> PointBuffer:
         self.scene.undo()
         return self._broadcast_points()
 
-    def clear(self) -> List[Dict]:
+    def clear(self) -> PointBuffer:
         self.scene.clear()
         return self._broadcast_points()
 
     def begin_transform_session(self):
+        """
+        开始一段连续变换（拖拽）：撤销记录并成一条，推送按 broadcast_hz 限频。
+        会话第一次改动照常马上推，之后间隔不到的先攒着。
+        """
         self.scene.begin_batch()
+        self._in_session = True
+        self._last_broadcast = 0.0
 
     def end_transform_session(self):
+        """结束会话：攒着没推的最终状态一定在这里推出去"""
         self.scene.end_batch()
+        self._in_session = False
+        if self._pending:
+            self._pending = False
+            self._emit_points()
+            self._flush_deltas()
 
     def clip_rect(self, shape_id, x1, y1, x2, y2):
         pts = self.scene.clip_shape_by_rect_and_raster(shape_id, x1, y1, x2, y2)
@@ -1,18 +1,35 @@
 // frontend/js/api.js
 
+import { POINTS_MIME, readPoints, splitSpanRows } from "./wire.js";
+
 const API = "/api/v1";
 
+// 返回像素点的接口优先要二进制，后端不支持时照样回 JSON
+const ACCEPT_POINTS = `${POINTS_MIME}, application/json;q=0.9`;
+const JSON_POINTS_HEADERS = { "Content-Type": "application/json", "Accept": ACCEPT_POINTS };
+
 // --- scene read ---
 
-export async function getPoints() {
-  const r = await fetch(`${API}/points`, { cache: "no-store" });
+// viewport 可选：[x0, y0, x1, y1]，只要视口里的像素（服务端不光栅化视口外的图形）
+export async function getPoints(viewport = null) {
+  const q = viewport ? `?viewport=${viewport.join(",")}` : "";
+  // no-cache：浏览器带 If-None-Match 回来问，场景没变时服务端回 304，直接用缓存的那份
+  const r = await fetch(`${API}/points${q}`, { cache: "no-cache", headers: { "Accept": ACCEPT_POINTS } });
   if (!r.ok) throw new Error(`GET /points ${r.status}`);
-  return r.json(); // -> [ {x,y,color,id,w}, ... ]
+  return readPoints(r); // -> [ {x,y,color,id,w}, ... ]
+}
+
+// 服务端点选：按几何算距离，返回 { id, dist }（没点中时 id 为 null）
+export async function getPick(x, y, threshold = 12) {
+  const q = new URLSearchParams({ x, y, threshold });
+  const r = await fetch(`${API}/pick?${q}`, { cache: "no-store" });
+  if (!r.ok) throw new Error(`GET /pick ${r.status}`);
+  return r.json();
 }
 
 export async function getSceneState() {
   // 可选：调 /scene (如果你后端加了 dump_scene_state)
-  const r = await fetch(`${API}/scene`, { cache: "no-store" });
+  const r = await fetch(`${API}/scene`, { cache: "no-cache" });
   if (!r.ok) throw new Error(`GET /scene ${r.status}`);
   return r.json();
 }
@@ -22,86 +39,86 @@ export async function getSceneState() {
 export async function postLine(payload) {
   const r = await fetch(`${API}/lines`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify(payload),
   });
   if (!r.ok) throw new Error(`POST /lines ${r.status}`);
-  return r.json(); // 服务端 add_line 返回 flatten_points()
+  return readPoints(r); // 服务端 add_line 返回 flatten_points()
 }
 
 export async function postRect(payload) {
   const r = await fetch(`${API}/rectangles`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify(payload),
   });
   if (!r.ok) throw new Error(`POST /rectangles ${r.status}`);
-  return r.json();
+  return readPoints(r);
 }
 
 export async function postCircle(payload) {
   const r = await fetch(`${API}/circles`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify(payload),
   });
   if (!r.ok) {
     const err = await r.json().catch(() => ({ error: "请求失败" }));
     throw new Error(err.error || `HTTP ${r.status}`);
   }
-  return r.json();
+  return readPoints(r);
 }
 
 export async function postBezier(payload) {
   const r = await fetch(`${API}/bezier`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify(payload),
   });
   if (!r.ok) {
     const err = await r.json().catch(() => ({ error: "请求失败" }));
     throw new Error(err.error || `HTTP ${r.status}`);
   }
-  return r.json();
+  return readPoints(r);
 }
 
 export async function postBSpline(payload) {
   const r = await fetch(`${API}/bspline`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify(payload),
   });
   if (!r.ok) {
     const err = await r.json().catch(() => ({ error: "请求失败" }));
     throw new Error(err.error || `HTTP ${r.status}`);
   }
-  return r.json();
+  return readPoints(r);
 }
 
 export async function postPolygon(payload) {
   const r = await fetch(`${API}/polygons`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify(payload),
   });
   if (!r.ok) {
     const err = await r.json().catch(() => ({ error: "请求失败" }));
     throw new Error(err.error || `HTTP ${r.status}`);
   }
-  return r.json();
+  return readPoints(r);
 }
 
 export async function postArc(payload) {
   const r = await fetch(`${API}/arc`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify(payload),
   });
   if (!r.ok) {
     const err = await r.json().catch(() => ({ error: "请求失败" }));
     throw new Error(err.error || `HTTP ${r.status}`);
   }
-  return r.json();
+  return readPoints(r);
 }
 
 // --- scene mutate (transform etc.) ---
@@ -110,11 +127,14 @@ export async function postArc(payload) {
 export async function postTranslate({ id, dx, dy }) {
   const r = await fetch(`${API}/translate`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify({ id, dx, dy }),
   });
   if (!r.ok) throw new Error(`POST /translate ${r.status}`);
-  return r.json(); // { ok: true/false }
+  // 平移后服务端返回 flatten_points()；拖拽会话里只返回被移动的那个 shape（partial = true）
+  const pts = await readPoints(r);
+  pts.partial = r.headers.get("X-Points-Scope") === "shape";
+  return pts;
 }
 
 // 2) 旋转（预留，后面会用）
@@ -140,33 +160,33 @@ export async function postScale({ id, sx, sy, cx, cy }) {
 }
 
 export async function postClipRect(payload) {
-  const r = await fetch("/api/v1/clip_rect", {
+  const r = await fetch(`${API}/clip_rect`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify(payload),
   });
   if (!r.ok) {
     const err = await r.json().catch(() => ({}));
     throw new Error(err.error || `POST /clip_rect ${r.status}`);
   }
-  return r.json();
+  return readPoints(r);
 }
 
 // --- undo / clear ---
 
 export async function postUndo() {
-  const r = await fetch(`${API}/undo`, { method: "POST" });
+  const r = await fetch(`${API}/undo`, { method: "POST", headers: { "Accept": ACCEPT_POINTS } });
   if (!r.ok) throw new Error(`POST /undo ${r.status}`);
-  return r.json(); // undo() 之后服务端返回 flatten_points()
+  return readPoints(r); // undo() 之后服务端返回 flatten_points()
 }
 
 export async function clearCanvas() {
   const r = await fetch(`${API}/clear`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
   });
   if (!r.ok) throw new Error("Failed to clear canvas");
-  return r.json(); // clear() 之后返回新的 flatten_points()
+  return readPoints(r); // clear() 之后返回新的 flatten_points()
 }
 
 export async function postTransformBegin() {
@@ -191,12 +211,23 @@ export function attachStyleFields(base) {
   };
 } // ✅ 缺少的就是这个大括号
 
+// 返回 { points, fill_id, spans }。
+// 后端给二进制时 body 就是整场景点集，fill_id 在 X-Fill-Id 头里，新填充的行程从 points.spans 里按 id 挑出来
 export async function postFill(body) {
   const r = await fetch(`/api/v1/flood`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: JSON_POINTS_HEADERS,
     body: JSON.stringify(body),
   });
   if (!r.ok) throw new Error(`POST /flood ${r.status}`);
-  return r.json(); // 现在返回 { points, fill_id, pixels }
+  const ct = r.headers.get("Content-Type") || "";
+  if (!ct.startsWith(POINTS_MIME)) {
+    const res = await r.json();
+    res.points = splitSpanRows(res.points);
+    return res;
+  }
+  const points = await readPoints(r);
+  const fill_id = r.headers.get("X-Fill-Id");
+  const spans = fill_id ? points.spans.filter(s => s.id === fill_id) : [];
+  return { points, fill_id, spans };
 }
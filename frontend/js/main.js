@@ -13,6 +13,7 @@ import { handleClickArc } from "./tools/arc.js";
 import { handleClickClip } from "./tools/clip.js";
 import { handleClickBucket } from "./tools/fill.js";
 import { rebuildIndex, pickShapeByPoint } from "./picker.js";
+import { applyResync, applyDelta, replicaPoints } from "./replica.js";
 let socket = null;
 
 const canvas = document.getElementById("canvas");
@@ -35,9 +36,14 @@ canvas.addEventListener("wheel", e => {
   }).then(() => refresh());
 }, { passive: false });
 
+// 画布在世界坐标里对应的范围（闭区间）；以后做平移 / 缩放改这里就行
+function canvasViewport() {
+  return [0, 0, canvas.width - 1, canvas.height - 1];
+}
+
 async function refresh() {
   try {
-    const pts = await getPoints();
+    const pts = await getPoints(canvasViewport());
     state.set({ cachedPts: pts }); // 触发重画
     rebuildIndex();
   } catch (e) {
@@ -55,15 +61,33 @@ function setupSocket() {
 
   socket.on("connect", () => {
     console.log("WebSocket 已连接");
-    socket.emit("subscribe_points");
+    // 要二进制推送（ArrayBuffer），省掉大场景下的 JSON 编解码；
+    // 只订阅画布范围内的像素，画布外的图形服务端不算也不发；
+    // 走增量协议：之后只收改动了的那几个 shape，不再每次收整场景
+    socket.emit("subscribe_points", { format: "binary", viewport: canvasViewport(), delta: true });
   });
 
-  socket.on("points_update", (pts) => {
-    // pts 结构 = getPoints() 返回值
-    state.set({ cachedPts: pts });
+  function showReplica() {
+    state.set({ cachedPts: replicaPoints() });
     rebuildIndex();
+  }
+
+  socket.on("scene_resync", (msg) => {
+    applyResync(msg);
+    showReplica();
   });
 
+  for (const kind of ["added", "replaced", "removed"]) {
+    socket.on(`shape_${kind}`, (msg) => {
+      if (!applyDelta(kind, msg)) {
+        // 中间漏了消息：要一次整场景重发
+        socket.emit("request_resync");
+        return;
+      }
+      showReplica();
+    });
+  }
+
   socket.on("disconnect", () => {
     console.log("WebSocket 断开");
   });
@@ -199,7 +223,7 @@ canvas.addEventListener("click", async (e) => {
 
   // 操作类模式：点选
   if (state.mode === "move" || state.mode === "clip") {
-    const hit = pickShapeByPoint(x, y, 12);
+    const hit = await pickShapeByPoint(x, y, 12);
     state.set({ selectedId: hit ? hit.id : null });
   }
 
@@ -211,7 +235,7 @@ canvas.addEventListener("click", async (e) => {
       return;
     }
   // 第二下：按普通 move/clip 逻辑去“选中”
-    const hit = pickShapeByPoint(x, y, 12);
+    const hit = await pickShapeByPoint(x, y, 12);
     state.set({ selectedId: hit ? hit.id : null });
     return;
   }
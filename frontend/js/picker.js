@@ -1,4 +1,5 @@
 import { state } from "./state.js";
+import { getPick } from "./api.js";
 
 const hypot = Math.hypot;
 function dist(x1, y1, x2, y2) { return hypot(x1 - x2, y1 - y2); }
@@ -14,23 +15,56 @@ function minDistToPointCloud(points, x, y, step = 1) {
   return best;
 }
 
-export function rebuildIndex() {
+// 点到一组水平行程的最近距离
+function minDistToSpans(spans, x, y) {
+  let best = Infinity;
+  for (const s of spans) {
+    const dx = x < s.x0 ? s.x0 - x : (x > s.x1 ? x - s.x1 : 0);
+    const d = hypot(dx, s.y - y);
+    if (d < best) best = d;
+    if (best === 0) break;
+  }
+  return best;
+}
+
+function groupById(items) {
   const map = new Map();
-  for (const p of state.cachedPts) {
+  for (const p of items) {
     if (!p.id) continue;
     const arr = map.get(p.id) || [];
     arr.push(p);
     map.set(p.id, arr);
   }
-  state.shapesById = map;
+  return map;
 }
 
-export function pickShapeByPoint(x, y, threshold = 12) {
+export function rebuildIndex() {
+  state.shapesById = groupById(state.cachedPts);
+  state.spansById = groupById(state.cachedPts.spans || []);
+}
+
+// 本地兜底：扫一遍缓存的像素（后端连不上时才用）
+function pickShapeLocal(x, y, threshold) {
   let winnerId = null, best = Infinity;
   for (const [id, pts] of state.shapesById.entries()) {
     const d = minDistToPointCloud(pts, x, y, 1);
     if (d < best) { best = d; winnerId = id; }
   }
+  for (const [id, spans] of state.spansById.entries()) {
+    const d = minDistToSpans(spans, x, y);
+    if (d < best) { best = d; winnerId = id; }
+  }
   if (best <= threshold) return { id: winnerId, dist: best };
   return null;
-}
\ No newline at end of file
+}
+
+// 点选交给后端：空间索引筛候选 + 按几何精确算距离，不用每次扫全部像素
+export async function pickShapeByPoint(x, y, threshold = 12) {
+  try {
+    const hit = await getPick(x, y, threshold);
+    return hit.id ? { id: hit.id, dist: hit.dist } : null;
+  } catch (e) {
+    console.warn("服务端点选失败，改用本地像素扫描：", e);
+    return pickShapeLocal(x, y, threshold);
+  }
+}
@@ -66,6 +66,12 @@ export function paintAll() {
     }
   });
 
+  // 二进制推送里的填充直接是行程，一段一次 fillRect
+  for (const s of state.cachedPts.spans || []) {
+    ctx.fillStyle = s.color || "red";
+    ctx.fillRect(s.x0, s.y, s.x1 - s.x0 + 1, 1);
+  }
+
   if (state.selectedId) highlightShape(state.selectedId);
   if (state.rotateCenter) {
     drawPreviewDot(state.rotateCenter.x, state.rotateCenter.y, "#00ff00");
@@ -73,6 +79,16 @@ export function paintAll() {
 }
 
 export function highlightShape(id) {
+  const spans = state.spansById.get(id);
+  if (spans && spans.length) {
+    ctx.fillStyle = "rgba(33,150,243,0.3)";
+    for (const s of spans) ctx.fillRect(s.x0 - 1, s.y - 1, s.x1 - s.x0 + 3, 3);
+    for (const s of spans) {
+      ctx.fillStyle = s.color || "red";
+      ctx.fillRect(s.x0, s.y, s.x1 - s.x0 + 1, 1);
+    }
+  }
+
   const pts = state.shapesById.get(id);
   if (!pts || !pts.length) return;
 
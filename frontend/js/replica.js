@@ -0,0 +1,76 @@
+// frontend/js/replica.js
+// 增量订阅（subscribe_points 带 delta: true）时，本地按 shape 保存一份场景副本：
+//   scene_resync   {version, order, points}       整场景重来
+//   shape_added    {version, base, id, index, points}
+//   shape_replaced {version, base, id, points}
+//   shape_removed  {version, base, id}
+// points 只是这一个 shape 的像素（二进制或 JSON，和 points_update 一样）。
+// 每条消息内容都是“这个 shape 现在的样子”，重复收到也没关系；
+// base 比手里的版本新说明中间漏了消息，这时返回 false，调用方去要一次 resync。
+
+import { pointsFromMessage } from "./wire.js";
+
+let version = -1;
+let order = [];               // 全部 shape 的绘制顺序（包括视口外、没有像素的）
+const rasters = new Map();    // id -> 对象数组（行程挂在 .spans 上）
+
+const EMPTY = Object.assign([], { spans: [] });
+
+// 整场景的点集按 id 拆开
+function splitById(pts) {
+  const out = new Map();
+  const bucket = (id) => {
+    let arr = out.get(id);
+    if (!arr) { arr = Object.assign([], { spans: [] }); out.set(id, arr); }
+    return arr;
+  };
+  for (const p of pts) bucket(p.id).push(p);
+  for (const s of pts.spans || []) bucket(s.id).spans.push(s);
+  return out;
+}
+
+export function applyResync(msg) {
+  const byId = splitById(pointsFromMessage(msg.points));
+  order = msg.order.slice();
+  rasters.clear();
+  for (const id of order) rasters.set(id, byId.get(id) || EMPTY);
+  version = msg.version;
+}
+
+// 应用一条 shape_* 消息；返回 false 表示漏了消息，需要 resync
+export function applyDelta(kind, msg) {
+  if (msg.version <= version) return true;   // 旧消息（resync 里已经包含了）
+  if (msg.base > version) return false;
+
+  const id = msg.id;
+  if (kind === "removed") {
+    if (rasters.delete(id)) order.splice(order.indexOf(id), 1);
+  } else {
+    const pts = pointsFromMessage(msg.points);
+    if (!pts.spans) pts.spans = [];
+    if (!rasters.has(id)) {
+      const at = kind === "added" ? Math.min(msg.index, order.length) : order.length;
+      order.splice(at, 0, id);
+    }
+    rasters.set(id, pts);
+  }
+  version = msg.version;
+  return true;
+}
+
+// 按绘制顺序拼回 getPoints() 同样的结构
+export function replicaPoints() {
+  const out = [];
+  const spans = [];
+  for (const id of order) {
+    const pts = rasters.get(id);
+    for (const p of pts) out.push(p);
+    for (const s of pts.spans) spans.push(s);
+  }
+  out.spans = spans;
+  return out;
+}
+
+export function replicaVersion() {
+  return version;
+}
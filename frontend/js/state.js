@@ -10,6 +10,7 @@ export const state = {
   points: [],                   // 临时点击点
   cachedPts: [],                // 后端返回的点
   shapesById: new Map(),        // id -> 点集合
+  spansById: new Map(),         // id -> 行程集合（填充）
   selectedId: null,
 
   // 兼容旧代码：保留 fill*，但与 currentColor 同步
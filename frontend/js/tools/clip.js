@@ -7,7 +7,7 @@ import { pickShapeByPoint } from "../picker.js";
 export async function handleClickClip(x, y, button, refresh) {
   // 1. 如果此时还没有选中的图形，先尝试以当前点选一下
   if (!state.selectedId) {
-    const hit = pickShapeByPoint(x, y, 14);
+    const hit = await pickShapeByPoint(x, y, 14);
     if (hit) {
       state.set({ selectedId: hit.id });
     } else {
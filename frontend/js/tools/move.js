@@ -7,33 +7,32 @@ import {
   postTransformBegin,
   postTransformEnd,
 } from "../api.js";
-import { rebuildIndex } from "../picker.js";
+import { rebuildIndex, pickShapeByPoint } from "../picker.js";
 import { paintAll } from "../render.js";
 
-// 工具函数：命中检测
-function pickShapeAt(x, y, pts) {
-  if (!pts || pts.length === 0) return null;
-  const exact = pts.find((p) => p.x === x && p.y === y);
-  if (exact) return exact.id;
-  const R = 4;
-  for (const p of pts) {
-    const dx = p.x - x;
-    const dy = p.y - y;
-    if (dx * dx + dy * dy <= R * R) return p.id;
-  }
-  return null;
-}
-
 // Alt 键状态
 let altPressed = false;
 window.addEventListener('keydown', e => { if (e.key === 'Alt') altPressed = true; });
 window.addEventListener('keyup', e => { if (e.key === 'Alt') altPressed = false; });
 
+// 用单个 shape 的新像素替换点集里它原来的那些（位置不变，保持绘制顺序）
+function replaceShapePoints(all, id, part) {
+  function splice(list, fresh) {
+    let at = list.findIndex(p => p.id === id);
+    const rest = list.filter(p => p.id !== id);
+    if (at < 0) at = rest.length;
+    return rest.slice(0, at).concat(fresh, rest.slice(at)); // 大 shape 几十万像素，别用 splice(...fresh)
+  }
+  const out = splice(all, part);
+  out.spans = splice(all.spans || [], part.spans || []);
+  return out;
+}
+
 // 主入口：在 move 模式下 mousedown 时调用
-export function beginMoveDrag(canvas, x0, y0) {
+export async function beginMoveDrag(canvas, x0, y0) {
   const pickedId = state.selectedId
     ? state.selectedId
-    : pickShapeAt(x0, y0, state.cachedPts);
+    : (await pickShapeByPoint(x0, y0, 4))?.id;
 
   if (!pickedId) {
     console.log("[beginMoveDrag] abort, no hit at", x0, y0);
@@ -92,8 +91,12 @@ export function beginMoveDrag(canvas, x0, y0) {
 
     console.log("[onMouseMove] fired ▸ {dx:", dx, ", dy:", dy, "}");
 
-    postTranslate({ id: state.selectedId, dx, dy })
-      .then((r) => (Array.isArray(r) ? r : getPoints()))
+    const id = state.selectedId;
+    postTranslate({ id, dx, dy })
+      .then((r) => {
+        if (!Array.isArray(r)) return getPoints();
+        return r.partial ? replaceShapePoints(state.cachedPts, id, r) : r;
+      })
       .then((pts) => {
         state.set({
           cachedPts: pts,
@@ -0,0 +1,102 @@
+// frontend/js/wire.js
+// 二进制点集（application/x-paint-points）的解码，格式见 backend/app/domain/points.py：
+//   20 字节头 | JSON 表（shapes / widths / palette）
+//   | 散点：Int32 x | Int32 y | Uint16/32 shape | Uint16/32 color
+//   | 行程：Int32 y | Int32 x0 | Int32 x1 | Uint16/32 shape | Uint16/32 color
+// 各列都按 4 字节对齐，直接在 ArrayBuffer 上包成 TypedArray，不逐项解析。
+// （TypedArray 用本机字节序，浏览器基本都是小端，和后端一致）
+
+export const POINTS_MIME = "application/x-paint-points";
+
+const MAGIC = "PTS1";
+const HEADER_BYTES = 20;
+const pad4 = n => (n + 3) & ~3;
+
+function indexArray(bytes, buf, offset, n) {
+  return bytes === 4 ? new Uint32Array(buf, offset, n) : new Uint16Array(buf, offset, n);
+}
+
+// ArrayBuffer -> { n, x, y, shape, color, m, spanY, spanX0, spanX1, spanShape, spanColor, shapes, widths, palette }
+export function decodePoints(input) {
+  // socket.io 有时给的是 Uint8Array / Buffer 视图，统一成独立的 ArrayBuffer
+  const buf = input instanceof ArrayBuffer
+    ? input
+    : input.buffer.slice(input.byteOffset, input.byteOffset + input.byteLength);
+
+  const view = new DataView(buf);
+  const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+  if (magic !== MAGIC) throw new Error("不是二进制点集");
+
+  const shapeBytes = view.getUint8(5);
+  const colorBytes = view.getUint8(6);
+  const n = view.getUint32(8, true);
+  const m = view.getUint32(12, true);
+  const tableLen = view.getUint32(16, true);
+
+  const table = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, HEADER_BYTES, tableLen)));
+  let off = HEADER_BYTES + tableLen;
+
+  const x = new Int32Array(buf, off, n); off += n * 4;
+  const y = new Int32Array(buf, off, n); off += n * 4;
+  const shape = indexArray(shapeBytes, buf, off, n); off += pad4(n * shapeBytes);
+  const color = indexArray(colorBytes, buf, off, n); off += pad4(n * colorBytes);
+
+  const spanY = new Int32Array(buf, off, m); off += m * 4;
+  const spanX0 = new Int32Array(buf, off, m); off += m * 4;
+  const spanX1 = new Int32Array(buf, off, m); off += m * 4;
+  const spanShape = indexArray(shapeBytes, buf, off, m); off += pad4(m * shapeBytes);
+  const spanColor = indexArray(colorBytes, buf, off, m);
+
+  return {
+    n, x, y, shape, color,
+    m, spanY, spanX0, spanX1, spanShape, spanColor,
+    shapes: table.shapes, widths: table.widths, palette: table.palette,
+  };
+}
+
+// 列式 -> 旧的 [{x, y, color, id, w}, ...]，给还按对象数组读的代码用。
+// 行程不展开（一段可能上千像素），挂在数组的 spans 属性上：[{y, x0, x1, color, id}, ...]
+export function toPointObjects(cols) {
+  const { n, x, y, shape, color, shapes, widths, palette } = cols;
+  const out = new Array(n);
+  for (let i = 0; i < n; i++) {
+    const s = shape[i];
+    out[i] = { x: x[i], y: y[i], color: palette[color[i]], id: shapes[s], w: widths[s] };
+  }
+  const { m, spanY, spanX0, spanX1, spanShape, spanColor } = cols;
+  const spans = new Array(m);
+  for (let i = 0; i < m; i++) {
+    spans[i] = {
+      y: spanY[i], x0: spanX0[i], x1: spanX1[i],
+      color: palette[spanColor[i]], id: shapes[spanShape[i]],
+    };
+  }
+  out.spans = spans;
+  return out;
+}
+
+// JSON 点集里行程是 {y, x0, x1, color, id, w} 这样的项（排在散点后面，不逐像素展开），
+// 拆出来挂到 .spans 上，和二进制解出来的结构一样
+export function splitSpanRows(arr) {
+  if (arr.spans) return arr;
+  const out = [];
+  const spans = [];
+  for (const p of arr) (p.x0 === undefined ? out : spans).push(p);
+  out.spans = spans;
+  return out;
+}
+
+// 二进制或 JSON 的 points 消息统一转成对象数组
+export function pointsFromMessage(msg) {
+  if (Array.isArray(msg)) return splitSpanRows(msg);
+  return toPointObjects(decodePoints(msg));
+}
+
+// fetch 的 Response：按 Content-Type 决定怎么读
+export async function readPoints(r) {
+  const ct = r.headers.get("Content-Type") || "";
+  if (ct.startsWith(POINTS_MIME)) {
+    return toPointObjects(decodePoints(await r.arrayBuffer()));
+  }
+  return splitSpanRows(await r.json());
+}